@@ -1,21 +1,31 @@
 import os
-import ast
 import uuid
-import json
-import re
 from functools import wraps
 from datetime import datetime
 
-import pyotp
-from marshmallow.exceptions import ValidationError
 from flask import render_template, Blueprint, request, redirect, session, url_for, abort
 
-from .models import Prompt, PromptSchema
+from .models import Prompt, QUERY_ONLY_FIELDS
+from .events import prompts_written, prompts_deleted
+from .facets import get_facet_counts
+from .storage import hydrate_prompt
+from .writes import (build_document, build_changes, insert_prompt_document, update_prompt_document,
+                     delete_prompt_document, WriteConflict)
+from .queries import apply_search, parse_filter_args
+from .templating import get_compiled_template
+from .payloads import parse_example
 
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 ADMIN_SECRET = os.environ.get('ADMIN_SECRET')
-TEMPLATE_VAR_PATTERN = re.compile(r'\{\{\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*\}\}')
+
+
+@admin_bp.before_request
+def parse_form():
+    # Parsed before the views, whose error handling would turn a body over
+    # MAX_CONTENT_LENGTH (RequestEntityTooLarge) into a 500 instead of a 413.
+    if request.method == 'POST':
+        request.form
 
 
 def login_required(f):
@@ -32,6 +42,8 @@ def login():
     if not ADMIN_SECRET:
         return 'Admin secret is not configured', 503
     if request.method == 'POST':
+        import pyotp
+
         auth_code = request.form.get('auth_code', '').strip()
         totp = pyotp.TOTP(ADMIN_SECRET)
         if totp.verify(auth_code):
@@ -45,6 +57,8 @@ def login():
 
 
 def handle_form_data(form):
+    from .schemas import ValidationError
+
     form_data = form.to_dict()
     # Assuming tags are submitted as a comma-separated string
     tags_str = form_data.get('tags', '')
@@ -57,56 +71,46 @@ def handle_form_data(form):
         form_data['example'] = {}
     else:
         try:
-            parsed_example = ast.literal_eval(example_str)
-        except (ValueError, SyntaxError):
-            raise ValidationError({'example': ['Invalid example format. Please provide a valid dictionary.']})
-        if not isinstance(parsed_example, dict):
-            raise ValidationError({'example': ['Invalid example format. Please provide a valid dictionary.']})
-        form_data['example'] = parsed_example
+            form_data['example'] = parse_example(example_str)
+        except ValueError as e:
+            raise ValidationError({'example': [f'Invalid example format. Please provide a valid dictionary. {e}']})
     return form_data
 
 
 def get_prompt_or_404(prompt_id):
     try:
-        return Prompt.objects.get(prompt_id=prompt_id)
+        return Prompt.objects.exclude(*QUERY_ONLY_FIELDS).get(prompt_id=prompt_id)
     except Prompt.DoesNotExist:
         abort(404, description='Prompt not found')
 
 
-def render_prompt_preview(content, example):
-    if not isinstance(content, str):
+def render_prompt_preview(prompt):
+    if not isinstance(prompt.content, str):
         return ''
-    if not isinstance(example, dict):
-        return content
-
-    def replace_var(match):
-        key = match.group(1)
-        if key not in example:
-            return match.group(0)
-        value = example[key]
-        if isinstance(value, (dict, list)):
-            return json.dumps(value, ensure_ascii=False)
-        return str(value)
-
-    return TEMPLATE_VAR_PATTERN.sub(replace_var, content)
+    if not isinstance(prompt.example, dict):
+        return prompt.content
+    compiled = get_compiled_template(prompt.prompt_id, prompt.updated_at, prompt.content)
+    return compiled.render(prompt.example)
 
 
 @admin_bp.route('/prompts')
 @login_required
 def prompt_list():
-    tag = request.args.get('tag')
+    filters, error = parse_filter_args(request.args)
+    if error:
+        abort(400, description=error)
     search = request.args.get('search')
     page = int(request.args.get('page', 1))
     per_page = int(request.args.get('per_page', 10))
     sort_by = '-created_at'
 
-    query = Prompt.objects.order_by(sort_by)
+    query = Prompt.objects.exclude(*QUERY_ONLY_FIELDS).order_by(sort_by)
 
-    if tag:
-        query = query.filter(tags=tag)
+    if filters:
+        query = query.filter(__raw__=filters)
 
     if search:
-        query = query.filter(content__icontains=search)
+        query = apply_search(query, search)
 
     total_count = query.count()
     prompts = query.skip((page - 1) * per_page).limit(per_page)
@@ -114,6 +118,7 @@ def prompt_list():
     return render_template(
         'prompts.html',
         prompts=prompts,
+        tag_counts=get_facet_counts(('tags',))['tags'],
         total_count=total_count,
         page=page,
         per_page=per_page
@@ -123,14 +128,14 @@ def prompt_list():
 @admin_bp.route('/prompt/create', methods=['GET', 'POST'])
 @login_required
 def create_prompt():
+    # Loaded on first use: only the admin forms need marshmallow.
+    from .schemas import PromptSchema, ValidationError
+
     if request.method == 'POST':
         try:
             form_data = handle_form_data(request.form)
-            prompt_schema = PromptSchema(partial=True)
-            prompt = prompt_schema.load(form_data)
-            prompt_id = str(uuid.uuid4())
-            prompt.prompt_id = prompt_id
-            prompt.save()
+            document = build_document({**form_data, 'prompt_id': str(uuid.uuid4())}, PromptSchema(partial=True))
+            prompts_written([insert_prompt_document(document)])
             return redirect('/admin/prompts')
         except ValidationError as e:
             # 处理验证错误,可以在页面上显示错误消息
@@ -144,35 +149,48 @@ def create_prompt():
 @admin_bp.route('/prompt/<prompt_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_prompt(prompt_id):
-    prompt = get_prompt_or_404(prompt_id)
+    from .schemas import PromptSchema, ValidationError
+
     if request.method == 'POST':
         try:
             form_data = handle_form_data(request.form)
-            # Validate and deserialize the form data with PromptSchema
-            prompt_schema = PromptSchema(partial=True)
-            prompt_schema.load(form_data)
-            prompt.update(**form_data)
-            prompt.updated_at = datetime.now()
-            prompt.save()
+            # The version the form was loaded from: edits made meanwhile are not overwritten.
+            expected_updated_at = form_data.pop('expected_updated_at', None)
+            try:
+                expected_updated_at = datetime.fromisoformat(expected_updated_at) if expected_updated_at else None
+            except ValueError:
+                raise ValidationError({'expected_updated_at': ['Invalid datetime.']})
+            changes = build_changes(form_data, PromptSchema(partial=True))
+            previous, current = update_prompt_document(prompt_id, changes, expected_updated_at)
+            prompts_written([current], previous=[previous])
             return redirect('/admin/prompts')
+        except Prompt.DoesNotExist:
+            abort(404, description='Prompt not found')
+        except WriteConflict:
+            return render_template('prompt_form.html', prompt=hydrate_prompt(get_prompt_or_404(prompt_id)),
+                                   error='The prompt was modified meanwhile; review the current version'), 409
         except ValidationError as e:
-            return render_template('prompt_form.html', prompt=prompt, errors=e.messages), 400
+            return render_template('prompt_form.html', prompt=hydrate_prompt(get_prompt_or_404(prompt_id)),
+                                   errors=e.messages), 400
         except Exception:
-            return render_template('prompt_form.html', prompt=prompt, error='Failed to update prompt'), 500
-    return render_template('prompt_form.html', prompt=prompt)
+            return render_template('prompt_form.html', prompt=hydrate_prompt(get_prompt_or_404(prompt_id)),
+                                   error='Failed to update prompt'), 500
+    return render_template('prompt_form.html', prompt=hydrate_prompt(get_prompt_or_404(prompt_id)))
 
 
 @admin_bp.route('/prompt/<prompt_id>/delete', methods=['POST'])
 @login_required
 def delete_prompt(prompt_id):
-    prompt = get_prompt_or_404(prompt_id)
-    prompt.delete()
+    try:
+        prompts_deleted([delete_prompt_document(prompt_id)])
+    except Prompt.DoesNotExist:
+        abort(404, description='Prompt not found')
     return redirect('/admin/prompts')
 
 
 @admin_bp.route('/prompt/<prompt_id>')
 @login_required
 def prompt_detail(prompt_id):
-    prompt = get_prompt_or_404(prompt_id)
-    formatted_prompt = render_prompt_preview(prompt.content, prompt.example)
+    prompt = hydrate_prompt(get_prompt_or_404(prompt_id))
+    formatted_prompt = render_prompt_preview(prompt)
     return render_template('prompt_detail.html', prompt=prompt, formatted_prompt=formatted_prompt)
@@ -1,28 +1,65 @@
+import json
 import uuid
+import base64
 import logging
-from functools import wraps
+from functools import wraps, partial
 from datetime import datetime
 
 from flask import jsonify, request, Blueprint
-from marshmallow import ValidationError
+from mongoengine.queryset.visitor import Q
 from mongoengine.errors import ValidationError as MongoValidationError
 
-from .models import Prompt, PromptSchema
-from .config import get_auth_token
+from .models import Prompt, PromptRevision, QUERY_ONLY_FIELDS
+from .cache import prompt_cache
+from .events import prompts_written, prompts_deleted
+from .facets import get_facet_counts, FACET_FIELDS
+from .changes import (list_changes, start_position, encode_change_cursor, decode_change_cursor,
+                      KIND_WRITTEN, KIND_DELETED)
+from .history import load_snapshot
+from .storage import hydrate_rows
+from .writes import (build_document, build_changes, insert_prompt_document, update_prompt_document,
+                     delete_prompt_document, WriteConflict)
+from .db import for_reads, read_collection, build_write_concern, cache_fill_read_preference, API_READ_PREFERENCE
+from .serialization import prompt_serializer, get_prompt_serializer, parse_fields, PUBLIC_FIELDS
+from .conditional import (make_etag, version_token, to_http_datetime, is_not_modified,
+                          has_conditional_headers, set_validators, not_modified_response)
+from .queries import apply_search, parse_filter_args, summarize_plan, SEARCH_MODES, SEARCH_MODE_TEXT
+from .templating import get_compiled_template, get_cached_template, prompt_warnings
+from .metrics import timed
+from .tokens import check_token, method_scope, SCOPE_READ
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
 logger = logging.getLogger(__name__)
 
 MAX_PER_PAGE = 100
+MAX_RENDER_BATCH_SIZE = 100
+MAX_CHANGES_PER_PAGE = 500
+# Always read, whatever `fields` asks for: needed for cursors and ETags.
+LIST_KEY_FIELDS = ('prompt_id', 'created_at', 'updated_at', 'content_blob')
+CURSOR_SORT = ('-created_at', '-prompt_id')
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+FALSE_VALUES = ('0', 'false', 'no', 'off')
 
 
 def error_response(message, status_code):
     return jsonify({'error': message}), status_code
 
 
-def parse_positive_int_arg(name, default_value, max_value=None):
-    raw_value = request.args.get(name, str(default_value))
+@bp.before_request
+def reject_oversized_body():
+    """
+    Answer 413 before the view runs when ``Content-Length`` exceeds the limit
+    (see :mod:`api.payloads`); views report any exception raised while reading
+    the body as a 500.
+    """
+    limit = request.max_content_length
+    if limit is not None and request.content_length is not None and request.content_length > limit:
+        return error_response('Request payload too large', 413)
+
+
+def parse_positive_int_arg(name, default_value, max_value=None, args=None):
+    raw_value = (request.args if args is None else args).get(name, str(default_value))
     try:
         value = int(raw_value)
     except (TypeError, ValueError):
@@ -34,16 +71,73 @@ def parse_positive_int_arg(name, default_value, max_value=None):
     return value, None
 
 
-def token_required(f):
+def parse_bool_arg(name, default_value, args=None):
+    raw_value = (request.args if args is None else args).get(name)
+    if raw_value is None:
+        return default_value, None
+    raw_value = raw_value.strip().lower()
+    if raw_value in TRUE_VALUES:
+        return True, None
+    if raw_value in FALSE_VALUES:
+        return False, None
+    return None, f"Invalid '{name}' parameter: must be a boolean."
+
+
+def encode_cursor(created_at, prompt_id):
+    raw = json.dumps([created_at.isoformat(), prompt_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode an opaque cursor produced by :func:`encode_cursor`.
+
+    :return: ``(created_at, prompt_id)`` of the last item of the previous page.
+    :raises ValueError: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, prompt_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created_at), str(prompt_id)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+
+def count_prompts(query, filtered):
+    # An unfiltered count can be answered from collection metadata instead of a scan.
+    if not filtered:
+        return read_collection(Prompt).estimated_document_count()
+    return query.count()
+
+
+def authorization_error(authorization, scope):
+    """
+    Check an ``Authorization`` header value against the token registry (see :mod:`api.tokens`).
+
+    :param scope: ``read`` or ``write``, the scope the endpoint requires.
+    :return: ``(message, status_code)`` when the request must be rejected, otherwise None.
+    """
+    error = check_token(authorization, scope)
+    if error and error[1] == 503:
+        logger.error('API auth token is not configured. Set AUTH_TOKEN or API_TOKENS.')
+    return error
+
+
+def token_required(f=None, scope=None):
+    """
+    Require a valid bearer token. The endpoint requires the ``read`` scope for
+    GET requests and ``write`` otherwise, unless ``scope`` is given, as for
+    POST endpoints that do not modify prompts.
+    """
+    if f is None:
+        return partial(token_required, scope=scope)
+
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        configured_token = get_auth_token()
-        if not configured_token:
-            logger.error('API auth token is not configured. Set AUTH_TOKEN.')
-            return error_response('Server authentication token is not configured', 503)
-        token = request.headers.get('Authorization')
-        if token != f"Bearer {configured_token}":
-            return error_response('Unauthorized', 401)
+        with timed('auth'):
+            error = authorization_error(request.headers.get('Authorization'), scope or method_scope(request.method))
+        if error:
+            return error_response(*error)
         return f(*args, **kwargs)
     return decorated_function
 
@@ -54,14 +148,41 @@ def get_prompt_detail(prompt_id):
     """
     Get detailed information of a specific prompt.
 
+    Serialized payloads are served from the in-process prompt cache when possible.
+    Responses carry an ``ETag`` derived from ``prompt_id`` and ``updated_at``; a
+    matching ``If-None-Match`` (or ``If-Modified-Since``) is answered with 304
+    after reading only ``updated_at``.
+
     :param prompt_id: The unique identifier of the prompt.
     :return: JSON response containing the prompt details.
     """
     try:
-        prompt = Prompt.objects.get(prompt_id=prompt_id)
-        prompt_schema = PromptSchema()
-        prompt_data = prompt_schema.dump(prompt)
-        return jsonify(prompt_data), 200
+        prompt_data = prompt_cache.get(prompt_id)
+        if prompt_data is None and has_conditional_headers():
+            row = for_reads(Prompt.objects(prompt_id=prompt_id)).only('updated_at').as_pymongo().first()
+            if row is None:
+                raise Prompt.DoesNotExist
+            etag = make_etag(version_token(prompt_id, row.get('updated_at')))
+            last_modified = to_http_datetime(row.get('updated_at'))
+            if is_not_modified(etag, last_modified):
+                return not_modified_response(etag, last_modified)
+        if prompt_data is None:
+            read_preference = cache_fill_read_preference(prompt_cache)
+            row = Prompt.objects(prompt_id=prompt_id).read_preference(read_preference) \
+                .exclude(*QUERY_ONLY_FIELDS).as_pymongo().first()
+            if row is None:
+                raise Prompt.DoesNotExist
+            row = hydrate_rows([row], read_preference)[0]
+            with timed('serialize'):
+                prompt_data = prompt_serializer(row)
+            prompt_cache.set(prompt_id, prompt_data)
+        etag = make_etag(version_token(prompt_id, prompt_data.get('updated_at')))
+        last_modified = to_http_datetime(prompt_data.get('updated_at'))
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        with timed('serialize'):
+            response = jsonify(prompt_data)
+        return set_validators(response, etag, last_modified), 200
     except Prompt.DoesNotExist:
         logger.exception(f"Prompt not found: {prompt_id}")
         return error_response('Prompt not found', 404)
@@ -70,32 +191,370 @@ def get_prompt_detail(prompt_id):
         return error_response('Failed to retrieve prompt', 500)
 
 
+@bp.route('/prompts:facets', methods=['GET'])
+@token_required
+def get_prompt_facets():
+    """
+    Count prompts per tag, ``applicable_llm`` and ``version``.
+
+    Counts are maintained on every write, so the cost depends on the number of
+    distinct values, not on the number of prompts. ``facets`` (comma separated)
+    selects a subset.
+
+    :return: JSON response mapping each facet to ``[{"value", "count"}]``, most frequent first.
+    """
+    try:
+        facets = FACET_FIELDS
+        if 'facets' in request.args:
+            requested = {facet.strip() for facet in request.args['facets'].split(',') if facet.strip()}
+            if not requested or requested.difference(FACET_FIELDS):
+                return error_response(
+                    f"Invalid 'facets' parameter: must be a comma separated subset of {', '.join(FACET_FIELDS)}.", 400
+                )
+            facets = tuple(facet for facet in FACET_FIELDS if facet in requested)
+        return jsonify({'data': get_facet_counts(facets)}), 200
+    except Exception as e:
+        logger.exception(f"Error retrieving prompt facets: {str(e)}")
+        return error_response('Failed to retrieve prompt facets', 500)
+
+
+@bp.route('/prompts:changes', methods=['GET'])
+@token_required
+def get_prompt_changes():
+    """
+    List the prompts created, updated or deleted after a cursor, oldest change first.
+
+    Meant for replicas of the catalog (see :mod:`promptdoc_client`): start
+    without ``cursor`` to receive everything, then pass back ``next_cursor`` to
+    receive only what changed since. Prompts are read by ``(updated_at,
+    prompt_id)`` and deletions from their tombstones, both through an index, so
+    a poll costs as much as the changes it returns. Within a page only the last
+    change of each prompt is returned: its state in ``data`` or its deletion in
+    ``deleted``. A resumed read also returns the changes of the
+    ``CHANGES_SETTLE_SECONDS`` before the cursor again (see :mod:`api.changes`).
+
+    :return: JSON response with ``data`` (full prompts), ``deleted`` (``prompt_id``
+        and ``deleted_at``), ``next_cursor`` and ``has_more``.
+    """
+    try:
+        per_page, error = parse_positive_int_arg('per_page', 100, max_value=MAX_CHANGES_PER_PAGE)
+        if error:
+            return error_response(error, 400)
+        cursor = request.args.get('cursor')
+        position, continuation = None, False
+        if cursor:
+            try:
+                position, continuation = decode_change_cursor(cursor)
+            except ValueError:
+                return error_response("Invalid 'cursor' parameter.", 400)
+
+        changes, has_more = list_changes(start_position(position, continuation), per_page)
+        latest = {}
+        for change in changes:
+            latest.pop(change[1], None)
+            latest[change[1]] = change
+        rows = hydrate_rows([row for _, _, kind, row in latest.values() if kind == KIND_WRITTEN],
+                            API_READ_PREFERENCE)
+        deleted = [{'prompt_id': row['prompt_id'], 'deleted_at': row['deleted_at'].isoformat()}
+                   for _, _, kind, row in latest.values() if kind == KIND_DELETED]
+        if changes:
+            # A resumed read starts behind the cursor and must not end before it.
+            last = changes[-1][:3]
+            position = last if has_more or position is None else max(last, position)
+        next_cursor = encode_change_cursor(*position, continuation=has_more) if position else None
+
+        with timed('serialize'):
+            response = jsonify({'data': prompt_serializer.many(rows), 'deleted': deleted,
+                                'next_cursor': next_cursor, 'has_more': has_more})
+        return response, 200
+    except Exception as e:
+        logger.exception(f"Error retrieving prompt changes: {str(e)}")
+        return error_response('Failed to retrieve prompt changes', 500)
+
+
+@bp.route('/prompt/<family>/latest', methods=['GET'])
+@token_required
+def get_latest_prompt(family):
+    """
+    Resolve the latest version of a prompt family.
+
+    Versions are compared naturally ("1.10" is newer than "1.9"); ties go to the
+    most recently updated prompt. Optionally restricted to one ``applicable_llm``.
+
+    :param family: The family the prompt versions belong to.
+    :return: JSON response containing the prompt details.
+    """
+    try:
+        query = for_reads(Prompt.objects(family=family)).exclude(*QUERY_ONLY_FIELDS)
+        applicable_llm = request.args.get('applicable_llm')
+        if applicable_llm:
+            query = query.filter(applicable_llm=applicable_llm)
+        row = query.order_by('-version_key', '-updated_at').as_pymongo().first()
+        if row is None:
+            return error_response('Prompt not found', 404)
+        return jsonify(prompt_serializer(hydrate_rows([row], API_READ_PREFERENCE)[0])), 200
+    except Exception as e:
+        logger.exception(f"Error resolving latest prompt: {str(e)}")
+        return error_response('Failed to retrieve prompt', 500)
+
+
+@bp.route('/prompt/<prompt_id>/revisions', methods=['GET'])
+@token_required
+def get_prompt_revisions(prompt_id):
+    """
+    List the recorded revisions of a prompt, newest first.
+
+    :param prompt_id: The unique identifier of the prompt.
+    :return: JSON response containing revision metadata without the snapshots.
+    """
+    try:
+        per_page, error = parse_positive_int_arg('per_page', 20, max_value=MAX_PER_PAGE)
+        if error:
+            return error_response(error, 400)
+        revisions = for_reads(PromptRevision.objects(prompt_id=prompt_id)).exclude('snapshot') \
+            .order_by('-updated_at', '-id').limit(per_page)
+        return jsonify({'data': [revision_metadata(revision) for revision in revisions]}), 200
+    except Exception as e:
+        logger.exception(f"Error retrieving prompt revisions: {str(e)}")
+        return error_response('Failed to retrieve prompt revisions', 500)
+
+
+@bp.route('/prompt/<prompt_id>/revisions/<revision_id>', methods=['GET'])
+@token_required
+def get_prompt_revision(prompt_id, revision_id):
+    """
+    Get the full content of one revision.
+
+    :param prompt_id: The unique identifier of the prompt.
+    :param revision_id: The identifier returned by the revision list.
+    :return: JSON response containing the revision metadata and snapshot.
+    """
+    try:
+        try:
+            revision = for_reads(PromptRevision.objects(prompt_id=prompt_id, id=revision_id)).first()
+        except MongoValidationError:
+            revision = None
+        if revision is None:
+            return error_response('Revision not found', 404)
+        snapshot = hydrate_rows([load_snapshot(revision)], API_READ_PREFERENCE)[0]
+        return jsonify({**snapshot, **revision_metadata(revision)}), 200
+    except Exception as e:
+        logger.exception(f"Error retrieving prompt revision: {str(e)}")
+        return error_response('Failed to retrieve prompt revision', 500)
+
+
+def revision_metadata(revision):
+    return {
+        'revision_id': str(revision.id),
+        'prompt_id': revision.prompt_id,
+        'version': revision.version,
+        'applicable_llm': revision.applicable_llm,
+        'updated_at': revision.updated_at.isoformat() if revision.updated_at else None,
+        'content_hash': revision.content_hash,
+    }
+
+
+def load_compiled_templates(prompt_ids):
+    """
+    Resolve compiled templates for ``prompt_ids``.
+
+    Only ``updated_at`` is read for prompts whose template is already compiled;
+    ``content`` is fetched, in a single query, for the remaining ones.
+
+    :return: Mapping of prompt_id to :class:`~api.templating.CompiledTemplate`.
+    """
+    versions = for_reads(Prompt.objects(prompt_id__in=prompt_ids)).only('prompt_id', 'updated_at').as_pymongo()
+    templates = {}
+    stale_ids = []
+    for row in versions:
+        compiled = get_cached_template(row['prompt_id'], row.get('updated_at'))
+        if compiled is None:
+            stale_ids.append(row['prompt_id'])
+        else:
+            templates[row['prompt_id']] = compiled
+    if stale_ids:
+        rows = for_reads(Prompt.objects(prompt_id__in=stale_ids))
+        rows = rows.only('prompt_id', 'updated_at', 'content', 'content_blob')
+        for row in hydrate_rows(list(rows.as_pymongo()), API_READ_PREFERENCE):
+            templates[row['prompt_id']] = get_compiled_template(
+                row['prompt_id'], row.get('updated_at'), row.get('content', '')
+            )
+    return templates
+
+
+def render_result(prompt_id, compiled, variables, strict):
+    missing_variables = compiled.missing_variables(variables)
+    if strict and missing_variables:
+        return {'prompt_id': prompt_id, 'error': 'Missing variables', 'missing_variables': missing_variables}
+    return {
+        'prompt_id': prompt_id,
+        'content': compiled.render(variables),
+        'missing_variables': missing_variables,
+    }
+
+
+@bp.route('/prompt/<prompt_id>/render', methods=['POST'])
+@token_required(scope=SCOPE_READ)
+def render_prompt(prompt_id):
+    """
+    Render a prompt with caller supplied variables.
+
+    Request body: ``{"variables": {...}, "strict": false}``. Placeholders without
+    a value are left untouched unless ``strict`` is set, in which case the
+    request fails with 400.
+
+    :param prompt_id: The unique identifier of the prompt.
+    :return: JSON response containing the rendered content.
+    """
+    try:
+        payload = request.get_json(silent=True)
+        if payload is None or not isinstance(payload, dict):
+            return error_response('Invalid request payload', 400)
+        variables = payload.get('variables', {})
+        if not isinstance(variables, dict):
+            return error_response('Invalid request payload', 400)
+        compiled = load_compiled_templates([prompt_id]).get(prompt_id)
+        if compiled is None:
+            logger.info(f"Prompt not found: {prompt_id}")
+            return error_response('Prompt not found', 404)
+        result = render_result(prompt_id, compiled, variables, bool(payload.get('strict')))
+        if 'error' in result:
+            return jsonify(result), 400
+        return jsonify(result), 200
+    except Exception as e:
+        logger.exception(f"Error rendering prompt: {str(e)}")
+        return error_response('Failed to render prompt', 500)
+
+
+@bp.route('/prompts:batchRender', methods=['POST'])
+@token_required(scope=SCOPE_READ)
+def batch_render_prompts():
+    """
+    Render several prompts in one request.
+
+    Request body: ``{"items": [{"prompt_id": "...", "variables": {...}}], "strict": false}``.
+    Each item gets its own result; unknown prompts or missing variables (in
+    strict mode) are reported per item and do not fail the batch.
+
+    :return: JSON response containing one result per item, in request order.
+    """
+    try:
+        payload = request.get_json(silent=True)
+        if payload is None or not isinstance(payload, dict):
+            return error_response('Invalid request payload', 400)
+        items = payload.get('items')
+        if not isinstance(items, list) or not items:
+            return error_response('Invalid request payload', 400)
+        if len(items) > MAX_RENDER_BATCH_SIZE:
+            return error_response(f'Too many items: at most {MAX_RENDER_BATCH_SIZE} are allowed.', 400)
+        for item in items:
+            if (not isinstance(item, dict) or not isinstance(item.get('prompt_id'), str)
+                    or not isinstance(item.get('variables', {}), dict)):
+                return error_response('Invalid request payload', 400)
+
+        strict = bool(payload.get('strict'))
+        templates = load_compiled_templates(list({item['prompt_id'] for item in items}))
+        results = []
+        for item in items:
+            prompt_id = item['prompt_id']
+            compiled = templates.get(prompt_id)
+            if compiled is None:
+                results.append({'prompt_id': prompt_id, 'error': 'Prompt not found'})
+            else:
+                results.append(render_result(prompt_id, compiled, item.get('variables', {}), strict))
+        return jsonify({'results': results}), 200
+    except Exception as e:
+        logger.exception(f"Error rendering prompts: {str(e)}")
+        return error_response('Failed to render prompts', 500)
+
+
+def with_warnings(body, document):
+    """Add the template ``warnings`` of a written prompt (raw document) to a response body, when there are any."""
+    warnings = prompt_warnings(document)
+    if warnings:
+        body['warnings'] = warnings
+    return body
+
+
+def parse_write_concern_args(args=None):
+    """
+    Parse the optional write concern parameters of the write endpoints: ``w``
+    (``majority`` or a number of members), ``j`` and ``wtimeout`` (milliseconds).
+
+    :return: ``(write_concern, error)``; ``write_concern`` is None for the client default.
+    """
+    args = request.args if args is None else args
+    j, error = parse_bool_arg('j', None, args=args)
+    if error:
+        return None, error
+    wtimeout = None
+    if 'wtimeout' in args:
+        wtimeout, error = parse_positive_int_arg('wtimeout', None, args=args)
+        if error:
+            return None, error
+    try:
+        return build_write_concern(args.get('w'), j, wtimeout), None
+    except ValueError as e:
+        return None, str(e)
+
+
+def parse_update_preconditions(payload):
+    """
+    Take the optimistic concurrency preconditions of an update: the
+    ``expected_updated_at`` field of ``payload`` (the ``updated_at`` the client
+    read, removed from the payload) and the ``If-Unmodified-Since`` header.
+
+    :return: ``(expected_updated_at, unmodified_since, error)``
+    """
+    expected_updated_at = payload.pop('expected_updated_at', None)
+    if expected_updated_at is not None:
+        try:
+            expected_updated_at = datetime.fromisoformat(expected_updated_at)
+        except (TypeError, ValueError):
+            return None, None, "Invalid 'expected_updated_at': must be an ISO 8601 datetime."
+    return expected_updated_at, request.if_unmodified_since, None
+
+
 @bp.route('/prompt/<prompt_id>', methods=['PUT'])
 @token_required
 def update_prompt(prompt_id):
     """
     Update an existing prompt.
 
+    The payload is validated once and written with a single atomic
+    ``find_one_and_update``. With ``expected_updated_at`` in the payload (or an
+    ``If-Unmodified-Since`` header) the update only applies to that version of
+    the prompt; a newer version is reported with 409 (412 for the header).
+
     :param prompt_id: The unique identifier of the prompt to update.
-    :return: JSON response indicating the success or failure of the update operation.
+    :return: JSON response indicating the success or failure of the update operation,
+        with the new ``updated_at``.
     """
+    # Loaded on first write: marshmallow is not needed to serve reads.
+    from .schemas import PromptSchema, ValidationError
     try:
-        prompt = Prompt.objects.get(prompt_id=prompt_id)
         payload = request.get_json(silent=True)
         if payload is None or not isinstance(payload, dict):
             return error_response('Invalid request payload', 400)
-        prompt_schema = PromptSchema(partial=True)
-        validation_errors = prompt_schema.validate(payload, partial=True)
-        if validation_errors:
-            raise ValidationError(validation_errors)
-        payload.pop('prompt_id', None)
-        payload['updated_at'] = datetime.now()
-        prompt.update(**payload)
+        write_concern, error = parse_write_concern_args()
+        if error:
+            return error_response(error, 400)
+        expected_updated_at, unmodified_since, error = parse_update_preconditions(payload)
+        if error:
+            return error_response(error, 400)
+        changes = build_changes(payload, PromptSchema(partial=True))
+        previous, current = update_prompt_document(prompt_id, changes, expected_updated_at, unmodified_since,
+                                                   write_concern)
+        prompts_written([current], previous=[previous])
         logger.info(f"Prompt updated successfully: {prompt_id}")
-        return jsonify({'message': 'Prompt updated successfully'}), 200
+        body = {'message': 'Prompt updated successfully', 'updated_at': current['updated_at'].isoformat()}
+        return jsonify(with_warnings(body, current)), 200
     except Prompt.DoesNotExist:
         logger.exception(f"Prompt not found: {prompt_id}")
         return error_response('Prompt not found', 404)
+    except WriteConflict:
+        logger.info(f"Prompt update conflict: {prompt_id}")
+        return error_response('Prompt was modified since the expected version', 412 if unmodified_since else 409)
     except (ValidationError, MongoValidationError) as e:
         logger.exception(f"Invalid request payload: {str(e)}")
         return error_response('Invalid request payload', 400)
@@ -114,8 +573,10 @@ def delete_prompt(prompt_id):
     :return: JSON response indicating the success or failure of the delete operation.
     """
     try:
-        prompt = Prompt.objects.get(prompt_id=prompt_id)
-        prompt.delete()
+        write_concern, error = parse_write_concern_args()
+        if error:
+            return error_response(error, 400)
+        prompts_deleted([delete_prompt_document(prompt_id, write_concern)])
         logger.info(f"Prompt deleted successfully: {prompt_id}")
         return jsonify({'message': 'Prompt deleted successfully'}), 200
     except Prompt.DoesNotExist:
@@ -134,20 +595,22 @@ def create_prompt():
 
     :return: JSON response containing the success message and the ID of the newly created prompt.
     """
+    # Loaded on first write: marshmallow is not needed to serve reads.
+    from .schemas import PromptSchema, ValidationError
     try:
         payload = request.get_json(silent=True)
         if payload is None or not isinstance(payload, dict):
             return error_response('Invalid request payload', 400)
+        write_concern, error = parse_write_concern_args()
+        if error:
+            return error_response(error, 400)
         prompt_id = str(uuid.uuid4())
-        payload = {**payload, 'prompt_id': prompt_id}
-        prompt_schema = PromptSchema(partial=True)
-        validation_errors = prompt_schema.validate(payload)
-        if validation_errors:
-            raise ValidationError(validation_errors)
-        prompt = prompt_schema.load(payload)
-        prompt.save()
+        document = build_document({**payload, 'prompt_id': prompt_id}, PromptSchema(partial=True))
+        insert_prompt_document(document, write_concern)
+        prompts_written([document])
         logger.info(f"Prompt created successfully: {prompt_id}")
-        return jsonify({'message': 'Prompt created successfully', 'prompt_id': prompt_id}), 201
+        body = {'message': 'Prompt created successfully', 'prompt_id': prompt_id}
+        return jsonify(with_warnings(body, document)), 201
     except (ValidationError, MongoValidationError) as e:
         logger.exception(f"Invalid request payload: {str(e)}")
         return error_response('Invalid request payload', 400)
@@ -156,48 +619,164 @@ def create_prompt():
         return error_response('Failed to create prompt', 500)
 
 
+def parse_list_args(args):
+    """
+    Validate the query parameters of ``GET /api/prompts``.
+
+    :return: ``(options, error)``; ``options`` holds filters (see
+        :func:`api.queries.parse_filter_args`), search, search_mode, cursor,
+        per_page, include_total, fields, page (None in cursor mode) and explain.
+    """
+    filters, error = parse_filter_args(args)
+    if error:
+        return None, error
+    search_mode = args.get('search_mode', SEARCH_MODE_TEXT)
+    if search_mode not in SEARCH_MODES:
+        return None, f"Invalid 'search_mode' parameter: must be one of {', '.join(SEARCH_MODES)}."
+    cursor = args.get('cursor')
+    per_page, error = parse_positive_int_arg('per_page', 10, max_value=MAX_PER_PAGE, args=args)
+    if error:
+        return None, error
+    include_total, error = parse_bool_arg('include_total', cursor is None, args=args)
+    if error:
+        return None, error
+    fields = PUBLIC_FIELDS
+    if 'fields' in args:
+        fields, error = parse_fields(args['fields'])
+        if error:
+            return None, error
+    page = None
+    if cursor is not None:
+        if 'page' in args:
+            return None, "'page' and 'cursor' parameters cannot be combined."
+    else:
+        page, error = parse_positive_int_arg('page', 1, args=args)
+        if error:
+            return None, error
+    explain, error = parse_bool_arg('explain', False, args=args)
+    if error:
+        return None, error
+    return {
+        'filters': filters,
+        'search': args.get('search'),
+        'search_mode': search_mode,
+        'cursor': cursor,
+        'per_page': per_page,
+        'include_total': include_total,
+        'fields': fields,
+        'page': page,
+        'explain': explain,
+    }, None
+
+
 @bp.route('/prompts', methods=['GET'])
 @token_required
 def get_prompt_list():
     """
     Get a list of prompts with optional filtering and pagination.
 
+    Two pagination modes are supported. ``page``/``per_page`` keeps the classic
+    offset pagination. Passing ``cursor`` (empty for the first page) switches to
+    keyset pagination on ``(created_at, prompt_id)``: each response carries a
+    ``next_cursor`` and the total count is only computed when ``include_total``
+    is set, so walking the whole catalog costs linear time.
+
+    ``tag``/``tags`` (with ``tag_mode=any|all``), ``applicable_llm``,
+    ``version`` and the ``created_*``/``updated_*`` date ranges combine with AND
+    and are served by the compound indexes. ``explain=true`` returns a summary
+    of the query plan for the first page instead of prompts.
+
+    ``search`` uses the text index by default and ranks results by relevance in
+    page mode; ``search_mode=substring`` falls back to a regex over ``content``.
+
+    ``fields`` (comma separated) limits the returned fields and is pushed down to
+    MongoDB as a projection. Rows are read with ``as_pymongo()`` and serialized
+    without building ``Prompt`` instances.
+
     :return: JSON response containing the list of prompts and pagination information.
     """
     try:
-        tag = request.args.get('tag')
-        search = request.args.get('search')
-        page, error = parse_positive_int_arg('page', 1)
+        options, error = parse_list_args(request.args)
         if error:
             return error_response(error, 400)
-        per_page, error = parse_positive_int_arg('per_page', 10, max_value=MAX_PER_PAGE)
-        if error:
-            return error_response(error, 400)
-        sort_by = '-created_at'
+        filters, search, cursor = options['filters'], options['search'], options['cursor']
+        fields, per_page, include_total = options['fields'], options['per_page'], options['include_total']
+        serializer = get_prompt_serializer(fields)
 
-        query = Prompt.objects.order_by(sort_by)
+        query = for_reads(Prompt.objects).order_by(*CURSOR_SORT)
 
-        if tag:
-            query = query.filter(tags__in=[tag])
+        if filters:
+            query = query.filter(__raw__=filters)
 
         if search:
-            query = query.filter(content__icontains=search)
-
-        total_count = query.count()
-        prompts = query.skip((page - 1) * per_page).limit(per_page)
-
-        prompt_schema = PromptSchema(many=True)
-        prompt_data = prompt_schema.dump(prompts)
-
-        return jsonify({
-            'data': prompt_data,
-            'pagination': {
-                'total_count': total_count,
-                'page': page,
-                'per_page': per_page,
-                'total_pages': (total_count + per_page - 1) // per_page
-            }
-        }), 200
+            # Keyset pagination needs the stable (created_at, prompt_id) order.
+            query = apply_search(query, search, options['search_mode'], rank=cursor is None)
+
+        filtered = bool(filters or search)
+        query = query.only(*set(fields).union(LIST_KEY_FIELDS)).as_pymongo()
+
+        if options['explain']:
+            return jsonify({'explain': summarize_plan(query.limit(per_page).explain())})
+
+        if cursor is not None:
+            return get_prompt_list_by_cursor(query, cursor, per_page, include_total, filtered, serializer)
+
+        page = options['page']
+        total_count = count_prompts(query, filtered) if include_total else None
+        prompts = list(query.skip((page - 1) * per_page).limit(per_page))
+
+        return prompt_list_response(prompts, serializer, {
+            'total_count': total_count,
+            'page': page,
+            'per_page': per_page,
+            'total_pages': (total_count + per_page - 1) // per_page if include_total else None
+        })
     except Exception as e:
         logger.error(f"Error retrieving prompt list: {str(e)}")
         return jsonify({'error': 'Failed to retrieve prompt list'}), 500
+
+
+def get_prompt_list_by_cursor(query, cursor, per_page, include_total, filtered, serializer):
+    total_count = count_prompts(query, filtered) if include_total else None
+    if cursor:
+        try:
+            created_at, prompt_id = decode_cursor(cursor)
+        except ValueError:
+            return error_response("Invalid 'cursor' parameter.", 400)
+        query = query.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, prompt_id__lt=prompt_id)
+        )
+
+    # Fetch one extra document to learn whether another page exists without counting.
+    prompts = list(query.limit(per_page + 1))
+    has_more = len(prompts) > per_page
+    prompts = prompts[:per_page]
+    next_cursor = encode_cursor(prompts[-1]['created_at'], prompts[-1]['prompt_id']) if has_more else None
+
+    return prompt_list_response(prompts, serializer, {
+        'per_page': per_page,
+        'next_cursor': next_cursor,
+        'has_more': has_more,
+        'total_count': total_count,
+    })
+
+
+def list_etag(prompts, serializer, pagination):
+    # The ETag covers the identity and version of every item, the selected fields
+    # and the pagination block, so an unchanged page is answered with 304 before
+    # any serialization.
+    return make_etag(
+        *(version_token(prompt['prompt_id'], prompt.get('updated_at')) for prompt in prompts),
+        *serializer.fields,
+        *sorted(pagination.items()),
+    )
+
+
+def prompt_list_response(prompts, serializer, pagination):
+    etag = list_etag(prompts, serializer, pagination)
+    if is_not_modified(etag):
+        return not_modified_response(etag)
+
+    with timed('serialize'):
+        response = jsonify({'data': serializer.many(prompts), 'pagination': pagination})
+    return set_validators(response, etag), 200
@@ -0,0 +1,569 @@
+"""
+ASGI entry point with async read endpoints.
+
+    uvicorn api.asgi:app --workers 4
+
+``GET /api/prompt/<prompt_id>``, ``GET /api/prompts`` and
+``POST /api/prompt/<prompt_id>/render`` are served on the event loop with the
+Motor driver (``pip install motor``), so a request waiting on MongoDB does not
+hold a thread and one process can keep thousands of reads in flight. They share
+the auth check, argument parsing, serializer, caches and ETags of the Flask
+views and return the same payloads.
+
+Every other request (writes, batch endpoints, revisions, admin, ``/metrics``) is
+handed to the Flask app on a thread pool of ``ASGI_WSGI_THREADS`` threads, so
+the URL surface is unchanged. Request bodies of those routes are streamed to the
+Flask app as it reads them, so ``POST /api/prompts:import`` keeps its constant
+memory use.
+"""
+import io
+import re
+import sys
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import MultiDict, Headers
+from werkzeug.http import parse_etags, parse_date, http_date, quote_etag
+
+from .index import app as flask_app
+from .config import MONGODB_SETTINGS, ASGI_WSGI_THREADS
+from .db import cache_fill_read_preference, API_READ_PREFERENCE
+from .models import Prompt, PromptBlob, QUERY_ONLY_PROJECTION
+from .cache import prompt_cache
+from .metrics import REQUEST_DURATION, REQUESTS
+from .api_routes import (authorization_error, parse_list_args, list_etag, render_result, decode_cursor,
+                         encode_cursor, LIST_KEY_FIELDS)
+from .conditional import make_etag, version_token, to_http_datetime, preconditions_match
+from .queries import raw_list_query, after_cursor, summarize_plan
+from .serialization import prompt_serializer, get_prompt_serializer
+from .storage import referenced_blob_ids, apply_blobs
+from .templating import get_compiled_template, get_cached_template
+from .tokens import SCOPE_READ
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
+
+
+logger = logging.getLogger(__name__)
+
+# Chunks of a streamed Flask response buffered ahead of a slow client.
+WSGI_QUEUE_SIZE = 16
+# Read size of the request body stream handed to the Flask app.
+WSGI_INPUT_BUFFER_SIZE = 65536
+# Bounded by MAX_IMPORT_LENGTH instead of MAX_CONTENT_LENGTH.
+IMPORT_PATH = '/api/prompts:import'
+
+
+class AsyncPromptStore:
+    """Read access to the prompt collections through Motor."""
+
+    def __init__(self, database, read_preference=API_READ_PREFERENCE):
+        self.prompts = database.get_collection(Prompt._get_collection_name(), read_preference=read_preference)
+        self.blobs = database.get_collection(PromptBlob._get_collection_name(), read_preference=read_preference)
+
+    @classmethod
+    def from_settings(cls, settings=MONGODB_SETTINGS):
+        if AsyncIOMotorClient is None:
+            raise RuntimeError('The async read endpoints require the motor package: pip install motor')
+        # Same pool, timeout and compression options as the synchronous client.
+        options = {name: value for name, value in settings.items() if name not in ('db', 'host', 'mongo_client_class')}
+        client = AsyncIOMotorClient(settings.get('host'), uuidRepresentation='standard', **options)
+        return cls(client[settings['db']])
+
+    @staticmethod
+    def routed(collection, read_preference=None):
+        """``collection`` with ``read_preference`` instead of the store's one, when given."""
+        return collection if read_preference is None else collection.with_options(read_preference=read_preference)
+
+    async def find_one(self, prompt_id, projection=None, read_preference=None):
+        return await self.routed(self.prompts, read_preference).find_one({'prompt_id': prompt_id}, projection)
+
+    async def find(self, query, projection=None, sort=None, skip=0, limit=0):
+        cursor = self.prompts.find(query, projection or None)
+        if sort:
+            cursor = cursor.sort(sort)
+        return await cursor.skip(skip).limit(limit).to_list(length=None)
+
+    async def explain(self, query, projection=None, sort=None, limit=0):
+        cursor = self.prompts.find(query, projection or None)
+        if sort:
+            cursor = cursor.sort(sort)
+        return await cursor.limit(limit).explain()
+
+    async def count(self, query):
+        # An unfiltered count can be answered from collection metadata instead of a scan.
+        if not query:
+            return await self.prompts.estimated_document_count()
+        return await self.prompts.count_documents(query)
+
+    async def hydrate(self, rows, read_preference=None):
+        """Async counterpart of :func:`api.storage.hydrate_rows`."""
+        blob_ids = referenced_blob_ids(rows)
+        blobs = {}
+        if blob_ids:
+            async for blob in self.routed(self.blobs, read_preference).find({'_id': {'$in': list(blob_ids)}}):
+                blobs[blob['_id']] = blob['data']
+        return apply_blobs(rows, blobs)
+
+
+class AsyncRequest:
+    def __init__(self, scope, receive):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+        self.headers = Headers([(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']])
+        self._receive = receive
+
+    @property
+    def if_none_match(self):
+        return parse_etags(self.headers.get('If-None-Match'))
+
+    @property
+    def if_modified_since(self):
+        return parse_date(self.headers.get('If-Modified-Since'))
+
+    def has_conditional_headers(self):
+        return bool(self.if_none_match or self.if_modified_since)
+
+    def is_not_modified(self, etag, last_modified=None):
+        return preconditions_match(etag, last_modified, self.if_none_match, self.if_modified_since)
+
+    @property
+    def content_length(self):
+        value = self.headers.get('Content-Length')
+        return int(value) if value and value.isdigit() else None
+
+    async def body(self):
+        return await read_body(self._receive, flask_app.config['MAX_CONTENT_LENGTH'])
+
+    async def get_json(self):
+        """
+        Parse the body with the app's bounded JSON provider; None when it is not
+        valid JSON or too large, like ``get_json(silent=True)``.
+        """
+        try:
+            return flask_app.json.loads(await self.body())
+        except ValueError:
+            return None
+
+
+class AsyncResponse:
+    __slots__ = ('status', 'headers', 'body')
+
+    def __init__(self, status, headers=(), body=b''):
+        self.status = status
+        self.headers = list(headers)
+        self.body = body
+
+
+def json_response(data, status=200, etag=None, last_modified=None):
+    # Same encoder and compact layout as jsonify().
+    body = (flask_app.json.dumps(data, separators=(',', ':')) + '\n').encode('utf-8')
+    return AsyncResponse(status, [('Content-Type', 'application/json')] + validator_headers(etag, last_modified), body)
+
+
+def error_response(message, status_code):
+    return json_response({'error': message}, status_code)
+
+
+def validator_headers(etag, last_modified=None):
+    headers = []
+    if etag is not None:
+        headers.append(('ETag', quote_etag(etag)))
+    if last_modified is not None:
+        headers.append(('Last-Modified', http_date(last_modified)))
+    return headers
+
+
+def not_modified_response(etag, last_modified=None):
+    return AsyncResponse(304, validator_headers(etag, last_modified))
+
+
+async def get_prompt_detail(get_store, request, prompt_id):
+    """Async ``GET /api/prompt/<prompt_id>``; see :func:`api.api_routes.get_prompt_detail`."""
+    try:
+        prompt_data = prompt_cache.get(prompt_id)
+        if prompt_data is None and request.has_conditional_headers():
+            row = await get_store().find_one(prompt_id, {'updated_at': 1})
+            if row is None:
+                return error_response('Prompt not found', 404)
+            etag = make_etag(version_token(prompt_id, row.get('updated_at')))
+            last_modified = to_http_datetime(row.get('updated_at'))
+            if request.is_not_modified(etag, last_modified):
+                return not_modified_response(etag, last_modified)
+        if prompt_data is None:
+            read_preference = cache_fill_read_preference(prompt_cache)
+            row = await get_store().find_one(prompt_id, QUERY_ONLY_PROJECTION, read_preference)
+            if row is None:
+                return error_response('Prompt not found', 404)
+            prompt_data = prompt_serializer((await get_store().hydrate([row], read_preference))[0])
+            prompt_cache.set(prompt_id, prompt_data)
+        etag = make_etag(version_token(prompt_id, prompt_data.get('updated_at')))
+        last_modified = to_http_datetime(prompt_data.get('updated_at'))
+        if request.is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        return json_response(prompt_data, etag=etag, last_modified=last_modified)
+    except Exception as e:
+        logger.exception(f"Error retrieving prompt: {str(e)}")
+        return error_response('Failed to retrieve prompt', 500)
+
+
+async def get_prompt_list(get_store, request):
+    """Async ``GET /api/prompts``; see :func:`api.api_routes.get_prompt_list`."""
+    try:
+        options, error = parse_list_args(request.args)
+        if error:
+            return error_response(error, 400)
+        cursor, per_page, include_total = options['cursor'], options['per_page'], options['include_total']
+        serializer = get_prompt_serializer(options['fields'])
+        query, sort, projection = raw_list_query(options['filters'], options['search'], options['search_mode'],
+                                                 rank=cursor is None)
+        projection.update({Prompt._fields[name].db_field: 1 for name in set(options['fields']).union(LIST_KEY_FIELDS)})
+        if options['explain']:
+            plan = await get_store().explain(query, projection, sort, limit=per_page)
+            return json_response({'explain': summarize_plan(plan)})
+        total_count = await get_store().count(query) if include_total else None
+
+        if cursor is not None:
+            if cursor:
+                try:
+                    created_at, prompt_id = decode_cursor(cursor)
+                except ValueError:
+                    return error_response("Invalid 'cursor' parameter.", 400)
+                query = after_cursor(query, created_at, prompt_id)
+            # Fetch one extra document to learn whether another page exists without counting.
+            prompts = await get_store().find(query, projection, sort, limit=per_page + 1)
+            has_more = len(prompts) > per_page
+            prompts = prompts[:per_page]
+            pagination = {
+                'per_page': per_page,
+                'next_cursor': encode_cursor(prompts[-1]['created_at'], prompts[-1]['prompt_id']) if has_more else None,
+                'has_more': has_more,
+                'total_count': total_count,
+            }
+        else:
+            page = options['page']
+            prompts = await get_store().find(query, projection, sort, skip=(page - 1) * per_page, limit=per_page)
+            pagination = {
+                'total_count': total_count,
+                'page': page,
+                'per_page': per_page,
+                'total_pages': (total_count + per_page - 1) // per_page if include_total else None
+            }
+
+        etag = list_etag(prompts, serializer, pagination)
+        if request.is_not_modified(etag):
+            return not_modified_response(etag)
+        return json_response({'data': serializer.many(prompts), 'pagination': pagination}, etag=etag)
+    except Exception as e:
+        logger.error(f"Error retrieving prompt list: {str(e)}")
+        return error_response('Failed to retrieve prompt list', 500)
+
+
+async def load_compiled_templates(store, prompt_ids):
+    """Async counterpart of :func:`api.api_routes.load_compiled_templates`."""
+    versions = await store.find({'prompt_id': {'$in': prompt_ids}}, {'prompt_id': 1, 'updated_at': 1})
+    templates = {}
+    stale_ids = []
+    for row in versions:
+        compiled = get_cached_template(row['prompt_id'], row.get('updated_at'))
+        if compiled is None:
+            stale_ids.append(row['prompt_id'])
+        else:
+            templates[row['prompt_id']] = compiled
+    if stale_ids:
+        rows = await store.find({'prompt_id': {'$in': stale_ids}},
+                                {'prompt_id': 1, 'updated_at': 1, 'content': 1, 'content_blob': 1})
+        for row in await store.hydrate(rows):
+            templates[row['prompt_id']] = get_compiled_template(
+                row['prompt_id'], row.get('updated_at'), row.get('content', '')
+            )
+    return templates
+
+
+async def render_prompt(get_store, request, prompt_id):
+    """Async ``POST /api/prompt/<prompt_id>/render``; see :func:`api.api_routes.render_prompt`."""
+    try:
+        payload = await request.get_json()
+        if payload is None or not isinstance(payload, dict):
+            return error_response('Invalid request payload', 400)
+        variables = payload.get('variables', {})
+        if not isinstance(variables, dict):
+            return error_response('Invalid request payload', 400)
+        compiled = (await load_compiled_templates(get_store(), [prompt_id])).get(prompt_id)
+        if compiled is None:
+            logger.info(f"Prompt not found: {prompt_id}")
+            return error_response('Prompt not found', 404)
+        result = render_result(prompt_id, compiled, variables, bool(payload.get('strict')))
+        return json_response(result, 400 if 'error' in result else 200)
+    except Exception as e:
+        logger.exception(f"Error rendering prompt: {str(e)}")
+        return error_response('Failed to render prompt', 500)
+
+
+# (method, path pattern, Flask rule used as the metrics label, handler)
+ASYNC_ROUTES = (
+    ('GET', re.compile(r'/api/prompt/(?P<prompt_id>[^/]+)'), '/api/prompt/<prompt_id>', get_prompt_detail),
+    ('GET', re.compile(r'/api/prompts'), '/api/prompts', get_prompt_list),
+    ('POST', re.compile(r'/api/prompt/(?P<prompt_id>[^/]+)/render'), '/api/prompt/<prompt_id>/render', render_prompt),
+)
+
+
+def match_route(method, path):
+    for route_method, pattern, rule, handler in ASYNC_ROUTES:
+        if method == route_method:
+            match = pattern.fullmatch(path)
+            if match:
+                return rule, handler, match.groupdict()
+    return None
+
+
+class PayloadTooLarge(ValueError):
+    pass
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+async def read_body(receive, limit=None):
+    """
+    :raises PayloadTooLarge: As soon as more than ``limit`` bytes were received.
+    :raises ClientDisconnected: If the client goes away before the end of the body.
+    """
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if limit is not None and size > limit:
+            raise PayloadTooLarge()
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def body_limit(path):
+    # Same limits as api.payloads.PromptRequest, checked against Content-Length before the app runs.
+    if path == IMPORT_PATH:
+        return flask_app.config['MAX_IMPORT_LENGTH']
+    return flask_app.config['MAX_CONTENT_LENGTH']
+
+
+async def send_response(send, response):
+    await send({
+        'type': 'http.response.start',
+        'status': response.status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers]
+        + [(b'content-length', str(len(response.body)).encode('latin-1'))],
+    })
+    await send({'type': 'http.response.body', 'body': response.body})
+
+
+class ReceiveStream(io.RawIOBase):
+    """
+    ``wsgi.input`` pulling the request body from the ASGI ``receive`` channel as
+    the Flask app reads it, so a body is never held in memory at once.
+
+    Read on the WSGI worker thread; each message is received on the event loop.
+
+    :raises ClientDisconnected: On a read after the client went away, so a
+        truncated body is never taken for a complete one.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._chunk = memoryview(b'')
+        self._more_body = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk and self._more_body:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message['type'] == 'http.disconnect':
+                raise ClientDisconnected()
+            self._chunk = memoryview(message.get('body', b''))
+            self._more_body = message.get('more_body', False)
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+
+def build_environ(scope, stream):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': stream,
+        # The stream ends with the body, so Werkzeug may read bodies without a
+        # Content-Length (chunked uploads) and enforces the body limits itself.
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def run_wsgi(wsgi_app, environ, loop, queue, abandoned):
+    """Run ``wsgi_app`` on a worker thread, feeding start/body/end messages to ``queue``."""
+    def put(message):
+        if abandoned.is_set():
+            raise ClientDisconnected()
+        asyncio.run_coroutine_threadsafe(queue.put(message), loop).result()
+
+    def start_response(status, headers, exc_info=None):
+        put(('start', int(status.split(' ', 1)[0]), headers))
+        return lambda data: put(('body', data))
+
+    try:
+        iterable = wsgi_app(environ, start_response)
+        try:
+            # Streamed responses are iterated on this same thread, inside their request context.
+            for chunk in iterable:
+                if chunk:
+                    put(('body', chunk))
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+    except ClientDisconnected:
+        return
+    finally:
+        if not abandoned.is_set():
+            put(('end',))
+
+
+class PromptASGIApp:
+    """
+    ASGI application serving the hot read endpoints natively and everything else through ``wsgi_app``.
+
+    :param store: Factory returning an :class:`AsyncPromptStore`; by default one
+        is created from ``MONGODB_SETTINGS`` on the first async read.
+    """
+
+    def __init__(self, wsgi_app, store=None, threads=ASGI_WSGI_THREADS):
+        self.wsgi_app = wsgi_app
+        self._store_factory = store or AsyncPromptStore.from_settings
+        self._store = None
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+    def store(self):
+        if self._store is None:
+            self._store = self._store_factory()
+        return self._store
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            route = match_route(scope['method'], scope['path'])
+            if route is None:
+                await self.call_wsgi(scope, receive, send)
+            else:
+                await self.call_async(route, scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def call_async(self, route, scope, receive, send):
+        rule, handler, params = route
+        start = time.perf_counter()
+        request = AsyncRequest(scope, receive)
+        # Every natively served route is read-only, render included.
+        error = authorization_error(request.headers.get('Authorization'), SCOPE_READ)
+        limit = body_limit(scope['path'])
+        if error:
+            response = error_response(*error)
+        elif limit is not None and (request.content_length or 0) > limit:
+            response = error_response('Request payload too large', 413)
+        else:
+            response = await handler(self.store, request, **params)
+        await send_response(send, response)
+        REQUEST_DURATION.observe(time.perf_counter() - start, rule, request.method)
+        REQUESTS.inc(rule, request.method, response.status)
+
+    async def call_wsgi(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, io.BufferedReader(ReceiveStream(receive, loop), WSGI_INPUT_BUFFER_SIZE))
+        limit = body_limit(scope['path'])
+        content_length = environ.get('CONTENT_LENGTH')
+        if limit is not None and content_length and content_length.isdigit() and int(content_length) > limit:
+            # Answered without running the app; longer bodies without a Content-Length stop at the limit.
+            await send_response(send, error_response('Request payload too large', 413))
+            return
+        queue = asyncio.Queue(maxsize=WSGI_QUEUE_SIZE)
+        abandoned = threading.Event()
+        worker = loop.run_in_executor(self.executor, run_wsgi, self.wsgi_app, environ, loop, queue, abandoned)
+        started = False
+        try:
+            while True:
+                message = await queue.get()
+                if message[0] == 'start':
+                    started = True
+                    await send({
+                        'type': 'http.response.start',
+                        'status': message[1],
+                        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                    for name, value in message[2]],
+                    })
+                elif message[0] == 'body':
+                    await send({'type': 'http.response.body', 'body': message[1], 'more_body': True})
+                else:
+                    break
+        except BaseException:
+            # Unblock the worker thread so it can close the Flask response.
+            abandoned.set()
+            while not queue.empty():
+                queue.get_nowait()
+            raise
+        try:
+            await worker
+        except Exception as e:
+            logger.exception(f"Error running WSGI request: {str(e)}")
+        if not started:
+            await send({'type': 'http.response.start', 'status': 500,
+                        'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+            await send({'type': 'http.response.body', 'body': b'Internal Server Error'})
+            return
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+app = PromptASGIApp(flask_app)
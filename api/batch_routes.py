@@ -0,0 +1,303 @@
+import uuid
+import logging
+
+from flask import jsonify, request, Blueprint, Response, stream_with_context
+from mongoengine.errors import ValidationError as MongoValidationError
+from pymongo import InsertOne, UpdateOne, DeleteOne
+from pymongo.errors import BulkWriteError
+
+from .models import Prompt, QUERY_ONLY_FIELDS, QUERY_ONLY_PROJECTION
+from .cache import prompt_cache
+from .events import prompts_written, prompts_deleted
+from .api_routes import token_required, error_response, reject_oversized_body, parse_write_concern_args
+from .tokens import SCOPE_READ
+from .serialization import prompt_serializer
+from .templating import prompt_warnings
+from .storage import hydrate_rows
+from .writes import build_document, build_changes
+from .db import write_collection, cache_fill_read_preference
+
+batch_bp = Blueprint('batch', __name__, url_prefix='/api')
+batch_bp.before_request(reject_oversized_body)
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 500
+BATCH_OPERATIONS = ('create', 'update', 'delete')
+
+
+def parse_batch_list(payload, key):
+    if payload is None or not isinstance(payload, dict):
+        return None, 'Invalid request payload'
+    items = payload.get(key)
+    if not isinstance(items, list) or not items:
+        return None, f"Invalid request payload: '{key}' must be a non-empty list."
+    if len(items) > MAX_BATCH_SIZE:
+        return None, f'Too many items: at most {MAX_BATCH_SIZE} are allowed.'
+    return items, None
+
+
+@batch_bp.route('/prompts:batchGet', methods=['POST'])
+@token_required(scope=SCOPE_READ)
+def batch_get_prompts():
+    """
+    Fetch several prompts in one request.
+
+    Request body: ``{"prompt_ids": ["...", ...]}``. Cached payloads are reused and
+    the remaining prompts are loaded with a single ``$in`` query, which fills
+    the cache (see :func:`api.db.cache_fill_read_preference`).
+
+    :return: JSON response with the found prompts in request order and the missing ids.
+    """
+    try:
+        prompt_ids, error = parse_batch_list(request.get_json(silent=True), 'prompt_ids')
+        if error:
+            return error_response(error, 400)
+        if not all(isinstance(prompt_id, str) for prompt_id in prompt_ids):
+            return error_response('Invalid request payload', 400)
+
+        found = {}
+        uncached_ids = []
+        for prompt_id in dict.fromkeys(prompt_ids):
+            prompt_data = prompt_cache.get(prompt_id)
+            if prompt_data is None:
+                uncached_ids.append(prompt_id)
+            else:
+                found[prompt_id] = prompt_data
+        if uncached_ids:
+            read_preference = cache_fill_read_preference(prompt_cache)
+            rows = Prompt.objects(prompt_id__in=uncached_ids).read_preference(read_preference) \
+                .exclude(*QUERY_ONLY_FIELDS).as_pymongo()
+            for row in hydrate_rows(list(rows), read_preference):
+                prompt_data = prompt_serializer(row)
+                prompt_cache.set(row['prompt_id'], prompt_data)
+                found[row['prompt_id']] = prompt_data
+
+        return jsonify({
+            'data': [found[prompt_id] for prompt_id in prompt_ids if prompt_id in found],
+            'missing': [prompt_id for prompt_id in prompt_ids if prompt_id not in found],
+        }), 200
+    except Exception as e:
+        logger.exception(f"Error retrieving prompts: {str(e)}")
+        return error_response('Failed to retrieve prompts', 500)
+
+
+def build_insert(data, prompt_schema):
+    document = build_document({**data, 'prompt_id': str(uuid.uuid4())}, prompt_schema)
+    return document, InsertOne(document)
+
+
+def build_update(previous, data, prompt_schema):
+    # Conditional on the state read by the existence check, see report_unmatched_writes.
+    changes = build_changes(data, prompt_schema)
+    return changes, UpdateOne(version_filter(previous), {'$set': changes})
+
+
+def version_filter(previous):
+    return {'prompt_id': previous['prompt_id'], 'updated_at': previous.get('updated_at')}
+
+
+def mark_error(results, index, message):
+    results[index] = {**results[index], 'status': 'error', 'error': message}
+
+
+def report_unmatched_writes(operations, results, write_indexes, written_fields, details):
+    """
+    Mark the updates and deletes that matched nothing as errors: their prompt
+    was modified or deleted after the existence check. A bulk write only
+    reports counts, so the prompts are read back only when they fall short.
+    """
+    pending = {op: [index for index in write_indexes
+                    if results[index]['status'] != 'error' and operations[index]['op'] == op]
+               for op in ('update', 'delete')}
+    short_updates = details.get('nMatched', 0) < len(pending['update'])
+    short_deletes = details.get('nRemoved', 0) < len(pending['delete'])
+    if not short_updates and not short_deletes:
+        return
+    prompt_ids = [results[index]['prompt_id'] for index in pending['update'] + pending['delete']]
+    current = {row['prompt_id']: row.get('updated_at')
+               for row in Prompt._get_collection().find({'prompt_id': {'$in': prompt_ids}},
+                                                        {'prompt_id': 1, 'updated_at': 1})}
+    for index in pending['update'] if short_updates else ():
+        prompt_id = results[index]['prompt_id']
+        if prompt_id not in current:
+            mark_error(results, index, 'Prompt not found')
+        elif current[prompt_id] != written_fields[index]['updated_at']:
+            mark_error(results, index, 'Prompt was modified concurrently')
+    # Deletions by a concurrent request are told apart by their tombstones (apply_write_side_effects).
+    for index in pending['delete'] if short_deletes else ():
+        if results[index]['prompt_id'] in current:
+            mark_error(results, index, 'Prompt was modified concurrently')
+
+
+def apply_write_side_effects(operations, results, write_indexes, written_fields, existing):
+    written, updated_ids, deleted = [], [], []
+    for index in write_indexes:
+        if results[index]['status'] == 'error':
+            continue
+        op = operations[index]['op']
+        prompt_id = results[index]['prompt_id']
+        if op == 'create':
+            written.append(written_fields[index])
+        elif op == 'update':
+            # The new state is the previous one with the $set applied: no read back needed.
+            updated_ids.append(prompt_id)
+            written.append({**existing[prompt_id], **written_fields[index]})
+        else:
+            deleted.append(existing[prompt_id])
+    result_indexes = {results[index]['prompt_id']: index for index in write_indexes}
+    for state in written:
+        warnings = prompt_warnings(state)
+        if warnings:
+            results[result_indexes[state['prompt_id']]]['warnings'] = warnings
+    prompts_written(written, previous=[existing[prompt_id] for prompt_id in updated_ids])
+    recorded = prompts_deleted(deleted)
+    for document in deleted:
+        if document['prompt_id'] not in recorded:
+            mark_error(results, result_indexes[document['prompt_id']], 'Prompt not found')
+
+
+@batch_bp.route('/prompts:batchWrite', methods=['POST'])
+@token_required
+def batch_write_prompts():
+    """
+    Create, update and delete several prompts in one request.
+
+    Request body::
+
+        {"operations": [
+            {"op": "create", "prompt": {...}},
+            {"op": "update", "prompt_id": "...", "prompt": {...}},
+            {"op": "delete", "prompt_id": "..."}
+        ]}
+
+    The whole batch is validated first, then written with one unordered
+    ``bulk_write``, with the write concern of the ``w``, ``j`` and ``wtimeout``
+    query parameters. Every operation gets its own result, so invalid items or
+    write errors do not fail the rest of the batch. Updates and deletes only
+    apply to the state read when the batch started: a prompt modified or
+    deleted meanwhile by another request is reported as an error. A prompt may
+    appear in at most one operation per batch.
+
+    :return: JSON response containing one result per operation, in request order.
+    """
+    # Loaded on first write: marshmallow is not needed to serve reads.
+    from .schemas import PromptSchema, ValidationError
+    try:
+        operations, error = parse_batch_list(request.get_json(silent=True), 'operations')
+        if error:
+            return error_response(error, 400)
+        write_concern, error = parse_write_concern_args()
+        if error:
+            return error_response(error, 400)
+
+        results = [None] * len(operations)
+        targets = {}
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict) or operation.get('op') not in BATCH_OPERATIONS:
+                results[index] = {'status': 'error', 'error': 'Invalid operation'}
+                continue
+            if operation['op'] == 'create':
+                continue
+            prompt_id = operation.get('prompt_id')
+            if not isinstance(prompt_id, str):
+                results[index] = {'status': 'error', 'error': 'Missing prompt_id'}
+            elif prompt_id in targets:
+                results[index] = {'status': 'error', 'error': 'Duplicate prompt_id in batch', 'prompt_id': prompt_id}
+            else:
+                targets[prompt_id] = index
+
+        # Existence check that also captures the states the writes will change.
+        existing = {}
+        if targets:
+            rows = Prompt._get_collection().find({'prompt_id': {'$in': list(targets)}}, QUERY_ONLY_PROJECTION)
+            existing = {row['prompt_id']: row for row in rows}
+
+        prompt_schema = PromptSchema(partial=True)
+        writes = []
+        write_indexes = []
+        written_fields = {}
+        for index, operation in enumerate(operations):
+            if results[index] is not None:
+                continue
+            op = operation['op']
+            prompt_id = operation.get('prompt_id')
+            try:
+                if op != 'create' and prompt_id not in existing:
+                    results[index] = {'status': 'error', 'error': 'Prompt not found', 'prompt_id': prompt_id}
+                    continue
+                if op == 'delete':
+                    writes.append(DeleteOne(version_filter(existing[prompt_id])))
+                else:
+                    data = operation.get('prompt')
+                    if not isinstance(data, dict):
+                        raise ValidationError({'prompt': ['Must be an object.']})
+                    if op == 'create':
+                        fields, write = build_insert(data, prompt_schema)
+                        prompt_id = fields['prompt_id']
+                    else:
+                        fields, write = build_update(existing[prompt_id], data, prompt_schema)
+                    written_fields[index] = fields
+                    writes.append(write)
+            except (ValidationError, MongoValidationError, KeyError):
+                results[index] = {'status': 'error', 'error': 'Invalid request payload', 'prompt_id': prompt_id}
+                continue
+            write_indexes.append(index)
+            results[index] = {'status': f'{op}d', 'prompt_id': prompt_id}
+
+        if writes:
+            try:
+                details = write_collection(Prompt, write_concern).bulk_write(writes, ordered=False).bulk_api_result
+            except BulkWriteError as e:
+                details = e.details
+                for write_error in details.get('writeErrors', []):
+                    index = write_indexes[write_error['index']]
+                    logger.error(f"Batch write failed for operation {index}: {write_error.get('errmsg')}")
+                    mark_error(results, index, 'Write failed')
+            report_unmatched_writes(operations, results, write_indexes, written_fields, details)
+            apply_write_side_effects(operations, results, write_indexes, written_fields, existing)
+
+        for index, operation in enumerate(operations):
+            results[index] = {'index': index, 'op': operation.get('op') if isinstance(operation, dict) else None,
+                              **results[index]}
+        logger.info(f"Batch write processed {len(operations)} operations")
+        return jsonify({'results': results}), 200
+    except Exception as e:
+        logger.exception(f"Error writing prompts: {str(e)}")
+        return error_response('Failed to write prompts', 500)
+
+
+@batch_bp.route('/prompts:export', methods=['GET'])
+@token_required
+def export_prompts():
+    """
+    Stream the whole catalog as NDJSON, one prompt per line.
+
+    :return: Streaming ``application/x-ndjson`` response.
+    """
+    from .catalog import iter_export_lines
+    return Response(stream_with_context(iter_export_lines()), mimetype='application/x-ndjson')
+
+
+@batch_bp.route('/prompts:import', methods=['POST'])
+@token_required
+def import_prompts():
+    """
+    Upsert prompts by ``prompt_id`` from an NDJSON request body.
+
+    The body is read line by line and written in chunks, so large uploads are
+    never held in memory at once.
+
+    :return: JSON response summarizing processed, upserted, updated and failed lines.
+    """
+    from .catalog import import_lines
+    try:
+        write_concern, error = parse_write_concern_args()
+        if error:
+            return error_response(error, 400)
+        summary = import_lines(request.stream, write_concern=write_concern)
+        return jsonify(summary.to_dict()), 200
+    except Exception as e:
+        logger.exception(f"Error importing prompts: {str(e)}")
+        return error_response('Failed to import prompts', 500)
+
@@ -0,0 +1,85 @@
+import time
+import threading
+from collections import OrderedDict
+
+from .config import PROMPT_CACHE_SIZE, PROMPT_CACHE_TTL
+
+
+class LRUCache:
+    """
+    A small thread-safe least-recently-used cache.
+
+    Entries optionally expire ``ttl`` seconds after they were stored. Hits,
+    misses, evictions (capacity or expiry) and explicit invalidations are
+    counted and reported by :meth:`stats`.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl or None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires_at, value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.evictions += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry is not None else None
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Serialized prompt payloads returned by the detail endpoint, keyed by prompt_id.
+prompt_cache = LRUCache(PROMPT_CACHE_SIZE, ttl=PROMPT_CACHE_TTL)
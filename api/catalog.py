@@ -0,0 +1,181 @@
+import json
+import logging
+from mongoengine.errors import ValidationError as MongoValidationError
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .models import Prompt, QUERY_ONLY_PROJECTION
+from .schemas import PromptSchema, ValidationError
+from .events import prompts_written
+from .changes import clear_tombstones
+from .facets import FACET_FIELDS
+from .serialization import prompt_serializer
+from .storage import hydrate_rows, search_words
+from .writes import build_document
+from .templating import analyze_template
+from .db import read_collection, write_collection, API_READ_PREFERENCE
+
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 1000
+IMPORT_CHUNK_SIZE = 500
+# Keep at most this many error details in an import summary; the count stays exact.
+MAX_REPORTED_ERRORS = 100
+
+
+def iter_export_lines(batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield every prompt as one NDJSON line.
+
+    Documents come from a single server-side cursor and are serialized one at a
+    time, so memory use does not depend on the catalog size.
+    """
+    cursor = read_collection(Prompt).find({}, QUERY_ONLY_PROJECTION, batch_size=batch_size)
+    try:
+        batch = []
+        for document in cursor:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                yield from serialize_batch(batch)
+                batch = []
+        yield from serialize_batch(batch)
+    finally:
+        cursor.close()
+
+
+def serialize_batch(documents):
+    # Externalized bodies are loaded with one query per batch.
+    for document in hydrate_rows(documents, API_READ_PREFERENCE):
+        yield json.dumps(prompt_serializer(document), ensure_ascii=False) + '\n'
+
+
+def analyze_prompts(batch_size=EXPORT_BATCH_SIZE):
+    """
+    Recompute the stored template metadata (see ``Prompt.clean``) and the
+    ``search_text`` of packed contents of every prompt, e.g. after upgrading or
+    editing prompts in the database directly.
+
+    :return: Number of prompts whose metadata changed.
+    """
+    collection = Prompt._get_collection()
+    cursor = collection.find({}, {'content': 1, 'content_blob': 1}, batch_size=batch_size)
+    modified = 0
+    try:
+        batch = []
+        for document in cursor:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                modified += write_analysis(collection, batch)
+                batch = []
+        modified += write_analysis(collection, batch)
+    finally:
+        cursor.close()
+    return modified
+
+
+def write_analysis(collection, documents):
+    if not documents:
+        return 0
+    packed = {document['_id'] for document in documents if document.get('content_blob')}
+    result = collection.bulk_write([
+        UpdateOne({'_id': document['_id']}, {'$set': {
+            **analyze_template(document.get('content')),
+            'search_text': search_words(document.get('content') or '') if document['_id'] in packed else None,
+        }})
+        for document in hydrate_rows(documents)
+    ], ordered=False)
+    return result.modified_count
+
+
+class ImportSummary:
+    def __init__(self):
+        self.processed = 0
+        self.upserted = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def to_dict(self):
+        return {
+            'processed': self.processed,
+            'upserted': self.upserted,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def build_replacement(line, prompt_schema):
+    data = json.loads(line)
+    if not isinstance(data, dict) or not isinstance(data.get('prompt_id'), str):
+        raise ValidationError({'prompt_id': ['Missing prompt_id.']})
+    return build_document(data, prompt_schema)
+
+
+def flush_chunk(chunk, summary, write_concern=None):
+    writes = [ReplaceOne({'prompt_id': document['prompt_id']}, document, upsert=True) for _, document in chunk]
+    # States being replaced, for the facet counts.
+    previous = {
+        document['prompt_id']: document
+        for document in Prompt._get_collection().find(
+            {'prompt_id': {'$in': [document['prompt_id'] for _, document in chunk]}},
+            {'prompt_id': 1, **{field: 1 for field in FACET_FIELDS}},
+        )
+    }
+    failed = set()
+    try:
+        result = write_collection(Prompt, write_concern).bulk_write(writes, ordered=False)
+        details = result.bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        for write_error in details.get('writeErrors', []):
+            failed.add(write_error['index'])
+            summary.add_error(chunk[write_error['index']][0], write_error.get('errmsg', 'Write failed'))
+    summary.upserted += details.get('nUpserted', 0)
+    summary.updated += details.get('nModified', 0)
+    # A prompt repeated within the chunk ends up in its last written state.
+    written = {document['prompt_id']: document for index, (_, document) in enumerate(chunk) if index not in failed}
+    prompts_written(list(written.values()),
+                    previous=[previous[prompt_id] for prompt_id in written if prompt_id in previous])
+    # Imports are the only writes with client chosen ids, so only they can bring back a deleted prompt.
+    clear_tombstones(list(written))
+
+
+def import_lines(lines, chunk_size=IMPORT_CHUNK_SIZE, write_concern=None):
+    """
+    Upsert prompts by ``prompt_id`` from an iterable of NDJSON lines.
+
+    Lines are validated one by one and written in unordered ``bulk_write``
+    chunks of ``chunk_size``, so only one chunk is held in memory. Invalid lines
+    are reported with their line number and do not stop the import.
+    ``write_concern`` (see :func:`api.db.build_write_concern`) applies to every chunk.
+
+    :return: :class:`ImportSummary` of the run.
+    """
+    summary = ImportSummary()
+    prompt_schema = PromptSchema(partial=True)
+    chunk = []
+    for line_number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        if not line.strip():
+            continue
+        summary.processed += 1
+        try:
+            chunk.append((line_number, build_replacement(line, prompt_schema)))
+        except (ValueError, ValidationError, MongoValidationError) as e:
+            summary.add_error(line_number, str(e))
+            continue
+        if len(chunk) >= chunk_size:
+            flush_chunk(chunk, summary, write_concern)
+            chunk = []
+    if chunk:
+        flush_chunk(chunk, summary, write_concern)
+    logger.info(f"Imported {summary.processed} prompts with {summary.error_count} errors")
+    return summary
@@ -0,0 +1,162 @@
+"""
+Change feed of the prompt catalog: prompts by ``updated_at`` merged with the
+tombstones left by deletions.
+
+Both streams are read in ``(timestamp, prompt_id)`` order from their own index
+and merged, so a poll reads about as many documents as there were changes. The
+position in the merged stream is an opaque cursor ``(timestamp, prompt_id,
+kind)`` that a replica stores and passes back to resume.
+
+Timestamps are taken by the API servers before the write reaches MongoDB, so
+a write can become visible after a newer one. A replica resuming from its
+cursor therefore reads again the last ``CHANGES_SETTLE_SECONDS`` before it;
+changes it already holds come back with the same state and are skipped. The
+cursors of the following pages of the same read do not go back, so paging
+always moves forward.
+"""
+import json
+import base64
+import logging
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .models import Prompt, PromptTombstone, QUERY_ONLY_PROJECTION
+from .db import read_collection
+from .config import CHANGES_SETTLE_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+# Order of a prompt write and a deletion sharing a timestamp and prompt_id.
+KIND_WRITTEN = 0
+KIND_DELETED = 1
+DUPLICATE_KEY_ERROR = 11000
+
+
+def encode_change_cursor(timestamp, prompt_id, kind, continuation=False):
+    """
+    :param continuation: The cursor continues a paginated read (``has_more``)
+        and is resumed without going back (see :func:`start_position`).
+    """
+    values = [timestamp.isoformat(), prompt_id, kind] + ([1] if continuation else [])
+    raw = json.dumps(values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_change_cursor(cursor):
+    """
+    :return: ``((timestamp, prompt_id, kind), continuation)``.
+    :raises ValueError: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        # Cursors issued before deletions were tracked only hold (updated_at, prompt_id).
+        if len(values) == 2:
+            values = [*values, KIND_WRITTEN]
+        timestamp, prompt_id, kind, *continuation = values
+        if kind not in (KIND_WRITTEN, KIND_DELETED) or continuation not in ([], [1]):
+            raise ValueError('Invalid cursor')
+        return (datetime.fromisoformat(timestamp), str(prompt_id), kind), bool(continuation)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+
+def start_position(position, continuation, settle_seconds=None):
+    """
+    Position to read the changes after, for a decoded cursor: the cursor itself
+    for the next page of a read, ``settle_seconds`` before it when a replica
+    resumes, to pick up the writes that became visible late.
+    """
+    settle_seconds = CHANGES_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+    if position is None or continuation or not settle_seconds:
+        return position
+    return position[0] - timedelta(seconds=settle_seconds), '', KIND_WRITTEN
+
+
+def after_position(field, position, kind):
+    """Filter on the entries of one stream that come after ``position`` in the merged order."""
+    if position is None:
+        return {}
+    timestamp, prompt_id, position_kind = position
+    same_timestamp = {field: timestamp, 'prompt_id': {'$gt': prompt_id}}
+    if kind > position_kind:
+        same_timestamp['prompt_id'] = {'$gte': prompt_id}
+    return {'$or': [{field: {'$gt': timestamp}}, same_timestamp]}
+
+
+def record_tombstones(documents):
+    """
+    Leave a tombstone for every deleted prompt so replicas following the feed
+    learn about the deletion. One tombstone is kept per ``prompt_id``, and only
+    replaced when it predates the deleted state: of two requests deleting the
+    same prompt, only the first to get here records the deletion.
+
+    Best effort like the other write side effects: a failure is logged and
+    never fails the delete.
+
+    :param documents: The deleted prompts (at least ``prompt_id`` and ``updated_at``).
+    :return: The ``prompt_id`` of the deletions recorded by this call (all of
+        them when the tombstones could not be written).
+    """
+    prompt_ids = [document['prompt_id'] for document in documents]
+    deleted_at = datetime.now()
+    operations = [
+        UpdateOne({'prompt_id': document['prompt_id'],
+                   'deleted_at': {'$lt': document.get('updated_at') or deleted_at}},
+                  {'$set': {'deleted_at': deleted_at}}, upsert=True)
+        for document in documents
+    ]
+    try:
+        if operations:
+            PromptTombstone._get_collection().bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # A duplicate prompt_id: a current tombstone exists, the deletion was recorded already.
+        recorded = {index for index, _ in enumerate(prompt_ids)}
+        for write_error in e.details.get('writeErrors', []):
+            if write_error.get('code') == DUPLICATE_KEY_ERROR:
+                recorded.discard(write_error['index'])
+            else:
+                logger.error(f"Failed to record the tombstone of {prompt_ids[write_error['index']]}: "
+                             f"{write_error.get('errmsg')}")
+        return {prompt_ids[index] for index in recorded}
+    except Exception as e:
+        logger.exception(f"Failed to record prompt tombstones: {str(e)}")
+    return set(prompt_ids)
+
+
+def clear_tombstones(prompt_ids):
+    """
+    Remove the tombstones of prompts restored by an import, so the feed does
+    not report a live prompt as deleted. Other writes create fresh ids and
+    never need this. Best effort, like :func:`record_tombstones`.
+    """
+    try:
+        if prompt_ids:
+            PromptTombstone._get_collection().delete_many({'prompt_id': {'$in': list(prompt_ids)}})
+    except Exception as e:
+        logger.exception(f"Failed to clear prompt tombstones: {str(e)}")
+
+
+def list_changes(position, limit):
+    """
+    Read the next ``limit`` changes after ``position`` (None for the start of the feed).
+
+    :return: ``(changes, has_more)``; ``changes`` is a list of
+        ``(timestamp, prompt_id, kind, row)`` in feed order, ``row`` being the
+        raw prompt document for writes and the tombstone for deletions.
+    """
+    # Fetch one extra entry per stream to learn whether another page exists without counting.
+    written = read_collection(Prompt).find(after_position('updated_at', position, KIND_WRITTEN),
+                                           QUERY_ONLY_PROJECTION) \
+        .sort([('updated_at', 1), ('prompt_id', 1)]).limit(limit + 1)
+    deleted = read_collection(PromptTombstone).find(after_position('deleted_at', position, KIND_DELETED), {'_id': 0}) \
+        .sort([('deleted_at', 1), ('prompt_id', 1)]).limit(limit + 1)
+    changes = sorted(
+        [(row['updated_at'], row['prompt_id'], KIND_WRITTEN, row) for row in written]
+        + [(row['deleted_at'], row['prompt_id'], KIND_DELETED, row) for row in deleted],
+        key=lambda change: change[:3],
+    )
+    return changes[:limit], len(changes) > limit
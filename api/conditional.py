@@ -0,0 +1,63 @@
+import hashlib
+from datetime import datetime, timezone
+
+from flask import request, Response
+
+
+def version_token(prompt_id, updated_at):
+    if isinstance(updated_at, datetime):
+        updated_at = updated_at.isoformat()
+    return f"{prompt_id}@{updated_at or ''}"
+
+
+def make_etag(*parts):
+    """Build a strong entity tag from ``parts`` (see :func:`version_token`)."""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def to_http_datetime(value):
+    """Convert a stored ``updated_at`` (naive local time or ISO string) to an aware UTC datetime."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        return None
+    # HTTP dates have second precision.
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def preconditions_match(etag, last_modified, if_none_match, if_modified_since):
+    """
+    Evaluate parsed ``If-None-Match`` (:class:`~werkzeug.datastructures.ETags`) and
+    ``If-Modified-Since`` values; True means the client copy is still current.
+
+    ``If-None-Match`` takes precedence when present, as required by RFC 9110.
+    """
+    if if_none_match:
+        return if_none_match.contains(etag)
+    if if_modified_since and last_modified is not None:
+        return last_modified <= if_modified_since
+    return False
+
+
+def is_not_modified(etag, last_modified=None):
+    """Evaluate ``If-None-Match`` / ``If-Modified-Since`` for the current request."""
+    return preconditions_match(etag, last_modified, request.if_none_match, request.if_modified_since)
+
+
+def has_conditional_headers():
+    return bool(request.if_none_match or request.if_modified_since)
+
+
+def set_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+
+def not_modified_response(etag, last_modified=None):
+    return set_validators(Response(status=304), etag, last_modified)
@@ -1,11 +1,83 @@
 import os
 
 
+def optional_int(name):
+    value = os.getenv(name, '').strip()
+    return int(value) if value else None
+
+
+# Client tuning passed to pymongo; unset values keep the driver defaults.
+# MONGODB_COMPRESSORS is a comma separated preference list, e.g. "zstd,snappy,zlib"
+# (zstd and snappy need the zstandard / python-snappy packages).
+MONGODB_CLIENT_OPTIONS = {
+    'maxPoolSize': optional_int('MONGODB_MAX_POOL_SIZE'),
+    'minPoolSize': optional_int('MONGODB_MIN_POOL_SIZE'),
+    'maxIdleTimeMS': optional_int('MONGODB_MAX_IDLE_TIME_MS'),
+    'maxConnecting': optional_int('MONGODB_MAX_CONNECTING'),
+    'waitQueueTimeoutMS': optional_int('MONGODB_WAIT_QUEUE_TIMEOUT_MS'),
+    'connectTimeoutMS': optional_int('MONGODB_CONNECT_TIMEOUT_MS'),
+    'serverSelectionTimeoutMS': optional_int('MONGODB_SERVER_SELECTION_TIMEOUT_MS'),
+    'socketTimeoutMS': optional_int('MONGODB_SOCKET_TIMEOUT_MS'),
+    'compressors': os.getenv('MONGODB_COMPRESSORS', '').strip() or None,
+}
+
 MONGODB_SETTINGS = {
-    'db': 'prompt',
-    'host': os.getenv("MONGODB_HOST")
+    'db': os.getenv('MONGODB_DB', 'prompt'),
+    'host': os.getenv("MONGODB_HOST"),
+    **{name: value for name, value in MONGODB_CLIENT_OPTIONS.items() if value is not None},
 }
 
+# Read preference of the read-only API endpoints (prompt reads, lists, renders,
+# revisions and export), e.g. "secondaryPreferred" to spread them over replica
+# set secondaries. Writes and the admin UI always use the primary.
+# MONGODB_READ_MAX_STALENESS_SECONDS (>= 90) skips secondaries lagging further behind.
+MONGODB_READ_PREFERENCE = os.getenv('MONGODB_READ_PREFERENCE', 'primary').strip()
+MONGODB_READ_MAX_STALENESS_SECONDS = optional_int('MONGODB_READ_MAX_STALENESS_SECONDS')
+
+# Indexes declared on the documents are created on first collection access by
+# default. Set to false when indexes are managed with `python manage.py indexes`.
+AUTO_CREATE_INDEXES = os.getenv('MONGODB_AUTO_CREATE_INDEXES', 'true').strip().lower() not in ('0', 'false', 'no')
+
+# Number of compiled prompt templates kept in memory for rendering.
+TEMPLATE_CACHE_SIZE = int(os.getenv('TEMPLATE_CACHE_SIZE', '1024'))
+
+# Serialized prompt payloads cached per process for detail reads. The TTL (in
+# seconds) bounds how long another worker's edits can stay invisible; 0 disables it.
+PROMPT_CACHE_SIZE = int(os.getenv('PROMPT_CACHE_SIZE', '1024'))
+PROMPT_CACHE_TTL = float(os.getenv('PROMPT_CACHE_TTL', '60'))
+
+# Follow the prompts change stream to evict cached prompts edited by other
+# workers. Requires MongoDB to run as a replica set.
+PROMPT_CHANGE_STREAM_ENABLED = os.getenv('PROMPT_CHANGE_STREAM', 'false').strip().lower() in ('1', 'true', 'yes')
+
+# Prompt bodies (content or example) larger than this many bytes are compressed
+# into the prompt_blobs collection and the prompt keeps a short summary. 0 disables it.
+PROMPT_BLOB_THRESHOLD = int(os.getenv('PROMPT_BLOB_THRESHOLD', '0'))
+PROMPT_SUMMARY_LENGTH = int(os.getenv('PROMPT_SUMMARY_LENGTH', '280'))
+
+# Add a Server-Timing header (db, serialize, auth and total durations) to every
+# response. Useful in browser dev tools; off by default since it exposes timings.
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING', 'false').strip().lower() in ('1', 'true', 'yes')
+
+# A replica resuming the change feed (GET /api/prompts:changes) reads again this
+# many seconds before its cursor: updated_at is stamped before the write reaches
+# MongoDB, so a slow write can become visible after a newer one. Cover the
+# slowest write plus the clock skew between API servers.
+CHANGES_SETTLE_SECONDS = float(os.getenv('CHANGES_SETTLE_SECONDS', '10'))
+
+# Threads running the Flask app for the routes the ASGI entry point (api.asgi)
+# does not serve natively.
+ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '32'))
+
+# Request body limits (see api.payloads). MAX_CONTENT_LENGTH bounds every request
+# except the streamed NDJSON import, bounded by MAX_IMPORT_LENGTH (unset: unbounded).
+MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', str(16 * 1024 * 1024)))
+MAX_IMPORT_LENGTH = optional_int('MAX_IMPORT_LENGTH')
+MAX_JSON_DEPTH = int(os.getenv('MAX_JSON_DEPTH', '64'))
+MAX_EXAMPLE_LENGTH = int(os.getenv('MAX_EXAMPLE_LENGTH', str(1024 * 1024)))
+# Opt-in: encode responses with orjson (when it is installed).
+USE_ORJSON = os.getenv('USE_ORJSON', 'false').strip().lower() in ('1', 'true', 'yes')
+
 DEFAULT_AUTH_TOKEN_PLACEHOLDER = 'your_token_here'
 
 
@@ -14,3 +86,11 @@ def get_auth_token():
     if not token or token == DEFAULT_AUTH_TOKEN_PLACEHOLDER:
         return None
     return token
+
+
+def get_api_token_specs():
+    """
+    Extra API tokens, as ``name:scope:sha256[:quota]`` entries separated by commas
+    or whitespace (see :mod:`api.tokens`).
+    """
+    return os.getenv('API_TOKENS', '').replace(',', ' ').split()
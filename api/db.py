@@ -0,0 +1,80 @@
+from mongoengine import register_connection, DEFAULT_CONNECTION_NAME
+from pymongo.write_concern import WriteConcern
+from pymongo.read_preferences import ReadPreference, read_pref_mode_from_name, make_read_preference
+
+from .config import MONGODB_SETTINGS, MONGODB_READ_PREFERENCE, MONGODB_READ_MAX_STALENESS_SECONDS
+
+
+# The documented connection string names of the read preference modes.
+READ_PREFERENCE_MODES = ('primary', 'primaryPreferred', 'secondary', 'secondaryPreferred', 'nearest')
+
+
+def register_default_connection(settings=MONGODB_SETTINGS):
+    """
+    Register the MongoDB connection without opening it.
+
+    MongoEngine builds the client on the first query and keeps it for the life
+    of the process, so importing the app does no DNS lookups (``mongodb+srv``)
+    or socket work and warm invocations reuse the same client and pool.
+    """
+    register_connection(DEFAULT_CONNECTION_NAME, **{'uuidRepresentation': 'standard', **settings})
+
+
+def build_read_preference(name, max_staleness=None):
+    """
+    Build a read preference from its connection string name, e.g. ``secondaryPreferred``.
+
+    :raises ValueError: If ``name`` is not a read preference mode.
+    """
+    if name not in READ_PREFERENCE_MODES:
+        raise ValueError(f"Invalid read preference {name!r}: must be one of {', '.join(READ_PREFERENCE_MODES)}.")
+    return make_read_preference(read_pref_mode_from_name(name), None,
+                                -1 if max_staleness is None else max_staleness)
+
+
+API_READ_PREFERENCE = build_read_preference(MONGODB_READ_PREFERENCE, MONGODB_READ_MAX_STALENESS_SECONDS)
+
+
+def for_reads(queryset):
+    """Route a read-only API queryset with ``API_READ_PREFERENCE``; writes keep using the primary."""
+    return queryset.read_preference(API_READ_PREFERENCE)
+
+
+def cache_fill_read_preference(cache):
+    """
+    Read preference of a read whose result goes into ``cache``: the primary while
+    the cache is on, since a miss right after a write's invalidation could read a
+    lagging secondary and keep serving that state for the whole cache TTL.
+    """
+    return ReadPreference.PRIMARY if cache.maxsize > 0 else API_READ_PREFERENCE
+
+
+def read_collection(document):
+    """The collection of ``document`` with ``API_READ_PREFERENCE``, for raw read-only queries."""
+    return document._get_collection().with_options(read_preference=API_READ_PREFERENCE)
+
+
+def build_write_concern(w=None, j=None, wtimeout=None):
+    """
+    Build an acknowledged write concern, e.g. ``w='majority'``; all None keeps the client default.
+
+    :raises ValueError: If ``w`` is neither ``majority`` nor a positive number of members. The
+        write paths need the acknowledged result (e.g. the previous state for the facet counts).
+    """
+    if w is None and j is None and wtimeout is None:
+        return None
+    if w is not None and w != 'majority':
+        if isinstance(w, str) and not w.isdigit():
+            raise ValueError("Invalid write concern 'w': must be 'majority' or a positive integer.")
+        w = int(w)
+        if w < 1:
+            raise ValueError("Invalid write concern 'w': must be 'majority' or a positive integer.")
+    if wtimeout is not None and wtimeout < 0:
+        raise ValueError("Invalid write concern 'wtimeout': must not be negative.")
+    return WriteConcern(w=w, j=j, wtimeout=wtimeout)
+
+
+def write_collection(document, write_concern=None):
+    """The collection of ``document`` for raw writes, with ``write_concern`` when one is given."""
+    collection = document._get_collection()
+    return collection if write_concern is None else collection.with_options(write_concern=write_concern)
@@ -0,0 +1,38 @@
+from .cache import prompt_cache
+from .changes import record_tombstones
+from .facets import update_facet_counts
+from .history import record_revisions, document_state
+
+
+def prompts_written(documents, previous=()):
+    """
+    Run the side effects of creating or updating prompts.
+
+    :param documents: The written prompts in their new state, as ``Prompt``
+        instances or raw ``prompts`` documents.
+    :param previous: The updated prompts in their state before the write (at
+        least their facet fields); empty for creates.
+    """
+    documents = [document_state(document) for document in documents]
+    for document in documents:
+        prompt_cache.invalidate(document['prompt_id'])
+    record_revisions(documents)
+    update_facet_counts([document_state(document) for document in previous], documents)
+
+
+def prompts_deleted(documents):
+    """
+    Run the side effects of deleting prompts.
+
+    :param documents: The deleted prompts in their last state (at least
+        ``prompt_id``, ``updated_at`` and the facet fields).
+    :return: The ``prompt_id`` of the deletions recorded by this call; the
+        others were recorded by a concurrent request deleting the same prompt,
+        which also applied their facet counts (see :func:`api.changes.record_tombstones`).
+    """
+    documents = [document_state(document) for document in documents]
+    for document in documents:
+        prompt_cache.invalidate(document['prompt_id'])
+    recorded = record_tombstones(documents)
+    update_facet_counts([document for document in documents if document['prompt_id'] in recorded], ())
+    return recorded
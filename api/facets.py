@@ -0,0 +1,92 @@
+"""
+Tag, ``applicable_llm`` and ``version`` counts for filter navigation.
+
+Counts live in the ``prompt_facets`` collection and are adjusted with ``$inc``
+from the before and after states of every write (see :mod:`api.events`), so
+reading them costs one document per facet value whatever the catalog size.
+Concurrent edits of the same prompt can make the counts drift; ``python
+manage.py facets`` rebuilds them from the prompts.
+"""
+import logging
+from collections import Counter
+
+from pymongo import UpdateOne
+
+from .models import Prompt, PromptFacet
+from .db import read_collection
+
+
+logger = logging.getLogger(__name__)
+
+FACET_FIELDS = ('tags', 'applicable_llm', 'version')
+
+
+def facet_values(state):
+    """Return the ``(facet, value)`` pairs a prompt state counts towards, each once."""
+    pairs = {('tags', tag) for tag in state.get('tags') or () if tag}
+    for field in ('applicable_llm', 'version'):
+        if state.get(field):
+            pairs.add((field, state[field]))
+    return pairs
+
+
+def count_deltas(before, after):
+    deltas = Counter()
+    for state in after:
+        deltas.update(facet_values(state))
+    for state in before:
+        deltas.subtract(facet_values(state))
+    return {pair: delta for pair, delta in deltas.items() if delta}
+
+
+def update_facet_counts(before, after):
+    """
+    Apply the count changes of prompts moving from the ``before`` to the ``after`` states.
+
+    Creates have no before state and deletes no after state. Like the history,
+    counts are best effort: a failure is logged and never fails the write.
+    """
+    try:
+        deltas = count_deltas(before, after)
+        if not deltas:
+            return
+        collection = PromptFacet._get_collection()
+        collection.bulk_write([
+            UpdateOne({'facet': facet, 'value': value}, {'$inc': {'count': delta}}, upsert=True)
+            for (facet, value), delta in deltas.items()
+        ], ordered=False)
+        if any(delta < 0 for delta in deltas.values()):
+            collection.delete_many({'count': {'$lte': 0}})
+    except Exception as e:
+        logger.exception(f"Failed to update facet counts: {str(e)}")
+
+
+def get_facet_counts(facets=FACET_FIELDS):
+    """
+    :return: Mapping of each facet in ``facets`` to ``[{'value', 'count'}]``,
+        most frequent first.
+    """
+    result = {facet: [] for facet in facets}
+    rows = read_collection(PromptFacet).find({'facet': {'$in': list(facets)}},
+                                             {'_id': 0, 'facet': 1, 'value': 1, 'count': 1})
+    for row in sorted(rows, key=lambda row: (-row['count'], row['value'])):
+        result[row['facet']].append({'value': row['value'], 'count': row['count']})
+    return result
+
+
+def rebuild_facet_counts():
+    """
+    Recount every facet from the prompts, in one pass over the collection.
+
+    :return: Number of facet values stored.
+    """
+    counts = Counter()
+    for state in Prompt._get_collection().find({}, {field: 1 for field in FACET_FIELDS}):
+        counts.update(facet_values(state))
+    collection = PromptFacet._get_collection()
+    collection.delete_many({})
+    if counts:
+        collection.insert_many([
+            {'facet': facet, 'value': value, 'count': count} for (facet, value), count in counts.items()
+        ])
+    return len(counts)
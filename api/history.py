@@ -0,0 +1,60 @@
+import json
+import zlib
+import hashlib
+import logging
+
+from mongoengine import Document
+
+from .models import PromptRevision
+
+
+logger = logging.getLogger(__name__)
+
+# Blob references are kept so that snapshots of externalized prompts can be hydrated.
+SNAPSHOT_FIELDS = ('content', 'variables', 'example', 'tags', 'version', 'applicable_llm', 'family',
+                   'content_blob', 'example_blob')
+
+
+def document_state(document):
+    if isinstance(document, Document):
+        return document.to_mongo().to_dict()
+    return document
+
+
+def compress_snapshot(state):
+    snapshot = {field: state.get(field) for field in SNAPSHOT_FIELDS}
+    raw = json.dumps(snapshot, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(raw).hexdigest(), zlib.compress(raw)
+
+
+def load_snapshot(revision):
+    return json.loads(zlib.decompress(revision.snapshot).decode('utf-8'))
+
+
+def build_revision(document):
+    state = document_state(document)
+    content_hash, snapshot = compress_snapshot(state)
+    return PromptRevision(
+        prompt_id=state['prompt_id'],
+        family=state.get('family'),
+        version=state.get('version'),
+        applicable_llm=state.get('applicable_llm'),
+        updated_at=state.get('updated_at'),
+        content_hash=content_hash,
+        snapshot=snapshot,
+    )
+
+
+def record_revisions(documents):
+    """
+    Append one revision per written prompt with a single insert.
+
+    History is best effort: a failure is logged and never fails the write that
+    already happened.
+    """
+    try:
+        revisions = [build_revision(document) for document in documents]
+        if revisions:
+            PromptRevision.objects.insert(revisions, load_bulk=False)
+    except Exception as e:
+        logger.exception(f"Failed to record prompt revisions: {str(e)}")
@@ -2,22 +2,33 @@ import os
 from datetime import timedelta
 
 from flask import Flask
-from flask_mongoengine import MongoEngine
 
-from .config import MONGODB_SETTINGS
+from .config import PROMPT_CHANGE_STREAM_ENABLED, SERVER_TIMING_ENABLED
+from .db import register_default_connection
+from . import metrics, payloads
 from .api_routes import bp
+from .batch_routes import batch_bp
 from .admin_routes import admin_bp
 
 
 app = Flask(__name__)
+payloads.init_app(app)
 
-# 配置 MongoDB
-app.config['MONGODB_SETTINGS'] = MONGODB_SETTINGS
+# Command listeners must be registered before the MongoDB client is created.
+metrics.register_command_listener()
 
-# 初始化 MongoEngine
-db = MongoEngine(app)
+# 配置 MongoDB：首次查询时才建立连接
+register_default_connection()
 
 app.register_blueprint(bp)
+app.register_blueprint(batch_bp)
 app.register_blueprint(admin_bp)
+metrics.init_app(app, server_timing=SERVER_TIMING_ENABLED)
 app.secret_key = os.environ.get('SECRET_KEY')
 app.permanent_session_lifetime = timedelta(hours=2)
+
+if PROMPT_CHANGE_STREAM_ENABLED:
+    # Threads do not survive fork: with `gunicorn --preload` call
+    # api.watcher.start_change_watcher() from a post_fork hook instead.
+    from .watcher import start_change_watcher
+    start_change_watcher()
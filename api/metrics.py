@@ -0,0 +1,228 @@
+"""
+Per-request performance instrumentation exported in the Prometheus text format.
+
+Request latency, MongoDB round trips (through a pymongo command listener),
+serialization and auth time are recorded per endpoint. Timings of the current
+request are kept in a thread local so they can also be reported in a
+``Server-Timing`` response header.
+"""
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+from flask import request, Response, current_app
+from pymongo import monitoring
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield f'{self.name}{format_labels(self.labels, label_values)} {value}'
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            items = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._series.items())
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                labels = format_labels((*self.labels, 'le'), (*label_values, bound))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = format_labels(self.labels, label_values)
+            yield f'{self.name}_sum{labels} {total}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+REQUEST_DURATION = Histogram('promptdoc_http_request_duration_seconds',
+                             'Request latency by endpoint.', ('endpoint', 'method'))
+REQUESTS = Counter('promptdoc_http_requests_total', 'Requests by endpoint and status.',
+                   ('endpoint', 'method', 'status'))
+DB_COMMAND_DURATION = Histogram('promptdoc_db_command_duration_seconds',
+                                'MongoDB command round-trip time.', ('command',))
+DB_COMMAND_FAILURES = Counter('promptdoc_db_command_failures_total', 'Failed MongoDB commands.', ('command',))
+DB_ROUND_TRIPS = Histogram('promptdoc_db_round_trips_per_request', 'MongoDB commands issued per request.',
+                           ('endpoint',), buckets=COUNT_BUCKETS)
+DB_TIME = Histogram('promptdoc_db_time_per_request_seconds', 'Time spent waiting on MongoDB per request.',
+                    ('endpoint',))
+SERIALIZATION_DURATION = Histogram('promptdoc_serialization_duration_seconds',
+                                   'Time spent serializing responses.', ('endpoint',))
+AUTH_DURATION = Histogram('promptdoc_auth_duration_seconds', 'Time spent authenticating requests.', ('endpoint',))
+TOKEN_REQUESTS = Counter('promptdoc_api_token_requests_total', 'Authenticated API requests by token and outcome.',
+                         ('token', 'outcome'))
+
+METRICS = [REQUEST_DURATION, REQUESTS, DB_COMMAND_DURATION, DB_COMMAND_FAILURES, DB_ROUND_TRIPS, DB_TIME,
+           SERIALIZATION_DURATION, AUTH_DURATION, TOKEN_REQUESTS]
+
+_local = threading.local()
+
+
+def current_timings():
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def timed(phase):
+    """Add the wall time of the block to ``phase`` of the current request (``db``, ``serialize``, ``auth``)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = current_timings()
+        if timings is not None:
+            timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Record every MongoDB command, globally and against the request running on this thread."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.record(event)
+
+    def failed(self, event):
+        DB_COMMAND_FAILURES.inc(event.command_name)
+        self.record(event)
+
+    def record(self, event):
+        duration = event.duration_micros / 1e6
+        DB_COMMAND_DURATION.observe(duration, event.command_name)
+        timings = current_timings()
+        if timings is not None:
+            timings['db'] = timings.get('db', 0.0) + duration
+            timings['db_count'] = timings.get('db_count', 0) + 1
+
+
+def endpoint_label():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def start_request():
+    _local.timings = {'start': time.perf_counter()}
+
+
+def finish_request(response, server_timing=False):
+    timings = current_timings()
+    if timings is None:
+        return response
+    _local.timings = None
+    total = time.perf_counter() - timings['start']
+    endpoint = endpoint_label()
+    REQUEST_DURATION.observe(total, endpoint, request.method)
+    REQUESTS.inc(endpoint, request.method, response.status_code)
+    DB_ROUND_TRIPS.observe(timings.get('db_count', 0), endpoint)
+    DB_TIME.observe(timings.get('db', 0.0), endpoint)
+    if 'serialize' in timings:
+        SERIALIZATION_DURATION.observe(timings['serialize'], endpoint)
+    if 'auth' in timings:
+        AUTH_DURATION.observe(timings['auth'], endpoint)
+    if server_timing:
+        entries = [f'db;dur={timings.get("db", 0.0) * 1000:.3f};desc="{timings.get("db_count", 0)} commands"']
+        for phase in ('serialize', 'auth'):
+            if phase in timings:
+                entries.append(f'{phase};dur={timings[phase] * 1000:.3f}')
+        entries.append(f'total;dur={total * 1000:.3f}')
+        response.headers['Server-Timing'] = ', '.join(entries)
+    return response
+
+
+def collect_cache_metrics(caches):
+    lines = []
+    for metric, key, kind in (('promptdoc_cache_hits_total', 'hits', 'counter'),
+                              ('promptdoc_cache_misses_total', 'misses', 'counter'),
+                              ('promptdoc_cache_evictions_total', 'evictions', 'counter'),
+                              ('promptdoc_cache_invalidations_total', 'invalidations', 'counter'),
+                              ('promptdoc_cache_size', 'size', 'gauge')):
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, cache in caches.items():
+            lines.append(f'{metric}{{cache="{name}"}} {cache.stats()[key]}')
+    return lines
+
+
+def render_metrics(caches=None):
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.collect())
+    lines.extend(collect_cache_metrics(caches or {}))
+    return '\n'.join(lines) + '\n'
+
+
+def register_command_listener():
+    """Must run before the MongoDB client is created; pymongo reads listeners at client construction."""
+    monitoring.register(CommandTimer())
+
+
+def init_app(app, server_timing=False):
+    from .api_routes import token_required
+    from .cache import prompt_cache
+    from .templating import compiled_templates
+
+    app.config.setdefault('SERVER_TIMING', server_timing)
+
+    @app.before_request
+    def metrics_before_request():
+        start_request()
+
+    @app.after_request
+    def metrics_after_request(response):
+        return finish_request(response, current_app.config['SERVER_TIMING'])
+
+    @token_required
+    def metrics():
+        caches = {'prompt': prompt_cache, 'template': compiled_templates}
+        return Response(render_metrics(caches), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
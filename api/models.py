@@ -1,7 +1,25 @@
+import re
 from datetime import datetime
 
-from marshmallow_mongoengine import ModelSchema
-from mongoengine import Document, StringField,  ListField, DateTimeField, DictField
+from mongoengine import Document, StringField,  ListField, DateTimeField, DictField, BinaryField, IntField
+
+from .config import AUTO_CREATE_INDEXES
+from .templating import analyze_template
+
+
+VERSION_TOKEN_PATTERN = re.compile(r'\d+|[^\W\d_]+')
+TEXT_INDEX_NAME = 'prompt_text_search'
+TEXT_INDEX_WEIGHTS = {'applicable_llm': 3, 'content': 1, 'search_text': 1, 'tags': 5, 'variables': 3}
+
+
+def make_version_key(version):
+    """
+    Build a sort key so that versions compare naturally ("1.10" > "1.9", "v10" > "v2").
+
+    Numeric parts are zero padded and text parts lower-cased.
+    """
+    tokens = VERSION_TOKEN_PATTERN.findall((version or '').lower())
+    return '.'.join(token.zfill(10) if token.isdigit() else token for token in tokens)
 
 
 class Prompt(Document):
@@ -14,11 +32,191 @@ class Prompt(Document):
     created_at = DateTimeField(default=datetime.now)
     updated_at = DateTimeField(default=datetime.now)
     tags = ListField(StringField())
+    # Groups the versions of one logical prompt; defaults to the prompt_id.
+    family = StringField()
+    # Derived from version, see make_version_key.
+    version_key = StringField()
+    # Set when the body was moved to prompt_blobs (see api.storage); content then
+    # only holds a summary and example is empty.
+    content_blob = StringField()
+    example_blob = StringField()
+    # Distinct words of a packed content, covered by search (see api.storage).
+    search_text = StringField()
+    # Derived from content on every write, see api.templating.analyze_template.
+    placeholders = ListField(StringField())
+    segments = ListField(ListField(IntField()))
+    content_length = IntField()
+    token_estimate = IntField()
+
+    meta = {
+        'collection': 'prompts',
+        'auto_create_index': AUTO_CREATE_INDEXES,
+        'indexes': [
+            # Tag filtered listing.
+            ('tags', '-created_at', '-prompt_id'),
+            # Model and model + version filtered listing (and scenario lookups),
+            # in listing order.
+            ('applicable_llm', '-created_at', '-prompt_id'),
+            ('applicable_llm', 'version', '-created_at', '-prompt_id'),
+            # Default listing order, also used as the keyset for cursor pagination.
+            # The trailing token_estimate serves the token budget filter from the
+            # same index, in listing order.
+            ('-created_at', '-prompt_id', 'token_estimate'),
+            # Change feed keyset (GET /api/prompts:changes).
+            ('updated_at', 'prompt_id'),
+            # Latest version of a family, optionally for one model.
+            ('family', 'applicable_llm', '-version_key', '-updated_at'),
+            ('family', '-version_key', '-updated_at'),
+            # Full-text search. Fields are listed alphabetically to match how the
+            # server reports text index weights.
+            {
+                'fields': ['$' + field for field in sorted(TEXT_INDEX_WEIGHTS)],
+                'default_language': 'none',
+                'weights': TEXT_INDEX_WEIGHTS,
+                'name': TEXT_INDEX_NAME,
+            },
+        ],
+    }
+
+    @classmethod
+    def ensure_indexes(cls):
+        # A collection has at most one text index: replace one built on other
+        # fields (e.g. before search_text) instead of failing to create it.
+        text_index = cls._get_collection().index_information().get(TEXT_INDEX_NAME)
+        if text_index and set(text_index.get('weights', TEXT_INDEX_WEIGHTS)) != set(TEXT_INDEX_WEIGHTS):
+            cls._get_collection().drop_index(TEXT_INDEX_NAME)
+        super().ensure_indexes()
+
+    def clean(self):
+        if not self.family:
+            self.family = self.prompt_id
+        self.version_key = make_version_key(self.version)
+        # A packed content only holds a summary; its metadata was computed
+        # before packing (see api.writes.build_document).
+        if not self.content_blob:
+            for name, value in analyze_template(self.content).items():
+                setattr(self, name, value)
+
+    @staticmethod
+    def derived_changes(changes):
+        """Return the derived fields to write alongside a partial update."""
+        derived = {}
+        if 'version' in changes:
+            derived['version_key'] = make_version_key(changes['version'])
+        if 'content' in changes:
+            derived.update(analyze_template(changes['content']))
+        return derived
+
+
+class PromptRevision(Document):
+    """
+    An immutable snapshot of a prompt, recorded after every create and update.
+
+    The snapshot is zlib compressed JSON of the editable fields, so history
+    grows by a fraction of the prompt size per revision.
+    """
+    prompt_id = StringField(required=True)
+    family = StringField()
+    version = StringField()
+    applicable_llm = StringField()
+    updated_at = DateTimeField()
+    content_hash = StringField()
+    snapshot = BinaryField()
+
+    meta = {
+        'collection': 'prompt_revisions',
+        'auto_create_index': AUTO_CREATE_INDEXES,
+        'indexes': [
+            ('prompt_id', '-updated_at'),
+        ],
+    }
+
+
+class PromptBlob(Document):
+    """A zlib compressed prompt body, addressed by the SHA-256 of its raw bytes."""
+    id = StringField(primary_key=True)
+    data = BinaryField(required=True)
+    size = IntField()
+
+    meta = {'collection': 'prompt_blobs'}
+
+
+class PromptFacet(Document):
+    """
+    Number of prompts per tag, ``applicable_llm`` and ``version`` value.
+
+    Maintained incrementally by :mod:`api.facets` on every write, so facet
+    navigation reads one small document per value instead of aggregating prompts.
+    """
+    facet = StringField(required=True)
+    value = StringField(required=True)
+    count = IntField(default=0)
+
+    meta = {
+        'collection': 'prompt_facets',
+        'auto_create_index': AUTO_CREATE_INDEXES,
+        'indexes': [
+            {'fields': ('facet', 'value'), 'unique': True},
+        ],
+    }
+
+
+class PromptTombstone(Document):
+    """Marks a deleted prompt in the change feed (see :mod:`api.changes`)."""
+    prompt_id = StringField(required=True)
+    deleted_at = DateTimeField(required=True)
+
+    meta = {
+        'collection': 'prompt_tombstones',
+        'auto_create_index': AUTO_CREATE_INDEXES,
+        'indexes': [
+            {'fields': ('prompt_id',), 'unique': True},
+            ('deleted_at', 'prompt_id'),
+        ],
+    }
+
+
+# Fields maintained by the server and never accepted from clients.
+INTERNAL_FIELDS = ['version_key', 'content_blob', 'example_blob', 'search_text']
+# Internal fields only read by queries, left out of every document read.
+QUERY_ONLY_FIELDS = ['search_text']
+QUERY_ONLY_PROJECTION = {field: 0 for field in QUERY_ONLY_FIELDS}
+# Computed from the content on write: returned to clients, never accepted from them.
+DERIVED_FIELDS = ['placeholders', 'segments', 'content_length', 'token_estimate']
+
+
+INDEXED_DOCUMENTS = (Prompt, PromptRevision, PromptFacet, PromptTombstone)
+
+
+def ensure_indexes():
+    """Create every index declared on the documents. Existing indexes are left untouched."""
+    for document in INDEXED_DOCUMENTS:
+        document.ensure_indexes()
+
+
+def check_indexes():
+    """
+    Compare declared indexes with the ones present in the database.
+
+    :return: Mapping of collection name to ``{'missing': [...], 'extra': [...]}``.
+    """
+    return {
+        document._get_collection_name(): document.compare_indexes()
+        for document in INDEXED_DOCUMENTS
+    }
 
-    meta = {'collection': 'prompts'}
 
+def drop_extra_indexes():
+    """
+    Drop the indexes that are no longer declared, e.g. one superseded by a longer
+    index with the same prefix, which every write would otherwise keep maintaining.
 
-class PromptSchema(ModelSchema):
-    class Meta:
-        model = Prompt
-        exclude = ['id']
+    :return: Mapping of collection name to the key specs of the dropped indexes.
+    """
+    dropped = {}
+    for document in INDEXED_DOCUMENTS:
+        extra = document.compare_indexes()['extra']
+        for keys in extra:
+            document._get_collection().drop_index(keys)
+        dropped[document._get_collection_name()] = extra
+    return dropped
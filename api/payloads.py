@@ -0,0 +1,143 @@
+"""
+Bounded parsing of client payloads.
+
+Request bodies are limited to ``MAX_CONTENT_LENGTH`` bytes and JSON documents
+to ``MAX_JSON_DEPTH`` levels of nesting, so an oversized or deeply nested
+payload is rejected before it can hold a worker. With ``USE_ORJSON`` responses
+are encoded with orjson (``pip install orjson``); request bodies are always
+parsed by the standard library, so the same bodies are valid either way.
+"""
+import re
+import ast
+import json
+
+from flask import Request, current_app
+from flask.json.provider import DefaultJSONProvider
+
+from .config import MAX_CONTENT_LENGTH, MAX_IMPORT_LENGTH, MAX_JSON_DEPTH, MAX_EXAMPLE_LENGTH, USE_ORJSON
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# The Python literal fallback of the admin example field is much slower than
+# JSON, so it only accepts small inputs.
+MAX_LITERAL_EXAMPLE_LENGTH = 64 * 1024
+BRACKETS_PATTERN = re.compile(r'[^\[\]{}()]+')
+# Streamed line by line, so bounded separately (see MAX_IMPORT_LENGTH).
+STREAMED_ENDPOINTS = ('batch.import_prompts',)
+
+
+def json_depth(value):
+    """Nesting depth of a parsed JSON value, computed without recursion."""
+    max_depth = 0
+    pending = [(value, 1)]
+    while pending:
+        value, depth = pending.pop()
+        if isinstance(value, dict):
+            value = value.values()
+        elif not isinstance(value, list):
+            continue
+        max_depth = max(max_depth, depth)
+        pending.extend((item, depth + 1) for item in value)
+    return max_depth
+
+
+def bracket_depth(text):
+    """Upper bound of the nesting depth of a literal, counting brackets inside strings too."""
+    depth = max_depth = 0
+    for char in BRACKETS_PATTERN.sub('', text):
+        if char in '[{(':
+            depth += 1
+            max_depth = max(max_depth, depth)
+        else:
+            depth -= 1
+    return max_depth
+
+
+def check_depth(value, max_depth=MAX_JSON_DEPTH):
+    if json_depth(value) > max_depth:
+        raise ValueError(f'JSON nesting deeper than {max_depth} levels')
+    return value
+
+
+def parse_example(text, max_length=MAX_EXAMPLE_LENGTH):
+    """
+    Parse the example field of the admin form: a JSON object, or for
+    compatibility a small Python dict literal (e.g. with single quotes).
+
+    :return: The example as a dict.
+    :raises ValueError: If the text is too large, too deeply nested or not a dict.
+    """
+    if len(text) > max_length:
+        raise ValueError(f'Example is larger than {max_length} characters.')
+    try:
+        example = json.loads(text)
+    except RecursionError:
+        raise ValueError('Example is nested too deeply.')
+    except ValueError:
+        example = parse_literal_example(text)
+    if not isinstance(example, dict):
+        raise ValueError('Example must be a dictionary.')
+    check_depth(example)
+    return example
+
+
+def parse_literal_example(text):
+    if len(text) > MAX_LITERAL_EXAMPLE_LENGTH or bracket_depth(text) > MAX_JSON_DEPTH:
+        raise ValueError('Example is not valid JSON.')
+    try:
+        example = ast.literal_eval(text)
+        # Sets, tuples as keys, bytes... cannot be stored as an example.
+        json.dumps(example)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        raise ValueError('Example is neither valid JSON nor a Python dictionary.')
+    return example
+
+
+class BoundedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, rejecting documents nested deeper than ``MAX_JSON_DEPTH``."""
+
+    def loads(self, s, **kwargs):
+        try:
+            return check_depth(super().loads(s, **kwargs))
+        except RecursionError:
+            raise ValueError('JSON nested too deeply')
+
+
+class OrjsonProvider(BoundedJSONProvider):
+    """
+    JSON provider encoding with orjson. Produces the same documents as the
+    default provider: sorted keys and datetimes as HTTP dates.
+
+    Parsing is inherited: orjson turns integers beyond 64 bits into floats and
+    rejects ``NaN`` / ``Infinity``, which the standard library accepts.
+    """
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+        except orjson.JSONEncodeError:
+            # E.g. integers beyond 64 bits.
+            return super().dumps(obj, **kwargs)
+
+
+class PromptRequest(Request):
+    @property
+    def max_content_length(self):
+        if self.endpoint in STREAMED_ENDPOINTS:
+            return current_app.config['MAX_IMPORT_LENGTH']
+        return super().max_content_length
+
+
+def init_app(app):
+    app.config.setdefault('MAX_CONTENT_LENGTH', MAX_CONTENT_LENGTH)
+    app.config.setdefault('MAX_IMPORT_LENGTH', MAX_IMPORT_LENGTH)
+    app.request_class = PromptRequest
+    provider_class = OrjsonProvider if USE_ORJSON and orjson is not None else BoundedJSONProvider
+    app.json = provider_class(app)
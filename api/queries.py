@@ -0,0 +1,164 @@
+import re
+from datetime import datetime
+
+from mongoengine.queryset.visitor import Q
+
+
+SEARCH_MODE_TEXT = 'text'
+SEARCH_MODE_SUBSTRING = 'substring'
+SEARCH_MODES = (SEARCH_MODE_TEXT, SEARCH_MODE_SUBSTRING)
+TAG_MODE_ANY = 'any'
+TAG_MODE_ALL = 'all'
+TAG_MODES = (TAG_MODE_ANY, TAG_MODE_ALL)
+# Query parameter -> (field, operator). Lower bounds are inclusive, upper bounds exclusive.
+DATE_RANGE_ARGS = {
+    'created_after': ('created_at', '$gte'),
+    'created_before': ('created_at', '$lt'),
+    'updated_after': ('updated_at', '$gte'),
+    'updated_before': ('updated_at', '$lt'),
+}
+
+
+def apply_search(query, search, mode=SEARCH_MODE_TEXT, rank=True):
+    """
+    Restrict a prompt queryset to documents matching ``search``.
+
+    ``text`` mode goes through the collection's text index, which covers
+    ``content``, ``tags``, ``variables`` and ``applicable_llm`` and matches
+    whole words. ``substring`` mode keeps the legacy case-insensitive regex on
+    ``content``; it cannot use an index and scans every document. Both also
+    match ``search_text``, the full text of contents packed into blobs.
+
+    :param rank: Order text matches by relevance, newest first on ties.
+    """
+    if mode == SEARCH_MODE_SUBSTRING:
+        return query.filter(Q(content__icontains=search) | Q(search_text__icontains=search))
+    query = query.search_text(search, text_score=rank)
+    if rank:
+        query = query.order_by('$text_score', '-created_at', '-prompt_id')
+    return query
+
+
+def split_list_arg(args, name):
+    """Collect a list parameter given repeated and/or comma separated, without duplicates."""
+    values = []
+    for raw in args.getlist(name):
+        values.extend(value.strip() for value in raw.split(',') if value.strip())
+    return list(dict.fromkeys(values))
+
+
+def parse_datetime_arg(name, raw_value):
+    try:
+        value = datetime.fromisoformat(raw_value)
+    except ValueError:
+        return None, f"Invalid '{name}' parameter: must be an ISO 8601 date or datetime."
+    if value.tzinfo is not None:
+        # Timestamps are stored as naive local time.
+        value = value.astimezone().replace(tzinfo=None)
+    return value, None
+
+
+def parse_filter_args(args):
+    """
+    Translate the filter parameters shared by the API and admin prompt lists into a raw MongoDB filter.
+
+    * ``tag`` / ``tags``: one or more tags (repeated or comma separated);
+      ``tag_mode=all`` requires every tag, the default ``any`` at least one.
+    * ``applicable_llm`` / ``version``: one or more accepted values.
+    * ``max_tokens``: upper bound of the stored ``token_estimate``.
+    * ``created_after`` / ``created_before`` / ``updated_after`` /
+      ``updated_before``: ISO 8601 bounds, lower inclusive and upper exclusive.
+
+    Equality filters come first and ranges on ``created_at`` match the listing
+    sort, so the ``tags`` and ``applicable_llm`` compound indexes serve filter,
+    sort and range together.
+
+    :return: ``(filter, error)``.
+    """
+    query = {}
+    tags = split_list_arg(args, 'tag') + split_list_arg(args, 'tags')
+    tag_mode = args.get('tag_mode', TAG_MODE_ANY)
+    if tag_mode not in TAG_MODES:
+        return None, f"Invalid 'tag_mode' parameter: must be one of {', '.join(TAG_MODES)}."
+    if tags:
+        query['tags'] = {'$all' if tag_mode == TAG_MODE_ALL else '$in': list(dict.fromkeys(tags))}
+    for field in ('applicable_llm', 'version'):
+        values = split_list_arg(args, field)
+        if values:
+            query[field] = values[0] if len(values) == 1 else {'$in': values}
+    if args.get('max_tokens'):
+        try:
+            max_tokens = int(args['max_tokens'])
+        except ValueError:
+            return None, "Invalid 'max_tokens' parameter: must be an integer."
+        query['token_estimate'] = {'$lte': max_tokens}
+    for name, (field, operator) in DATE_RANGE_ARGS.items():
+        if args.get(name):
+            value, error = parse_datetime_arg(name, args[name])
+            if error:
+                return None, error
+            query.setdefault(field, {})[operator] = value
+    return query, None
+
+
+def raw_list_query(filters=None, search=None, mode=SEARCH_MODE_TEXT, rank=True):
+    """
+    Build the raw MongoDB equivalent of the ``GET /api/prompts`` queryset, for
+    drivers other than MongoEngine (see :mod:`api.asgi`).
+
+    :param filters: Filter built by :func:`parse_filter_args`.
+    :return: ``(filter, sort, projection)``; ``projection`` only holds the text
+        score when results are ranked.
+    """
+    query = dict(filters or {})
+    sort = [('created_at', -1), ('prompt_id', -1)]
+    projection = {}
+    if search:
+        if mode == SEARCH_MODE_SUBSTRING:
+            pattern = {'$regex': re.escape(search), '$options': 'i'}
+            query['$or'] = [{'content': pattern}, {'search_text': pattern}]
+        else:
+            query['$text'] = {'$search': search}
+            if rank:
+                projection['_text_score'] = {'$meta': 'textScore'}
+                sort.insert(0, ('_text_score', {'$meta': 'textScore'}))
+    return query, sort, projection
+
+
+def after_cursor(query, created_at, prompt_id):
+    """Restrict a raw filter to documents after the keyset position ``(created_at, prompt_id)``."""
+    position = {'$or': [
+        {'created_at': {'$lt': created_at}},
+        {'created_at': created_at, 'prompt_id': {'$lt': prompt_id}},
+    ]}
+    return {'$and': [query, position]} if query else position
+
+
+def summarize_plan(explain):
+    """
+    Reduce ``explain`` output to what matters when tuning filters: the stages of
+    the winning plan, the indexes it used and how much it examined.
+    """
+    winning_plan = explain.get('queryPlanner', {}).get('winningPlan', {})
+    # The slot based engine nests the classic plan under queryPlan.
+    winning_plan = winning_plan.get('queryPlan', winning_plan)
+    stages, indexes = [], []
+    pending = [winning_plan]
+    while pending:
+        stage = pending.pop()
+        stages.append(stage.get('stage'))
+        if stage.get('indexName'):
+            indexes.append(stage['indexName'])
+        pending.extend(stage.get('inputStages', ()))
+        if stage.get('inputStage'):
+            pending.append(stage['inputStage'])
+    stats = explain.get('executionStats', {})
+    return {
+        'stages': stages,
+        'indexes': indexes,
+        'collection_scan': 'COLLSCAN' in stages,
+        'in_memory_sort': 'SORT' in stages,
+        'keys_examined': stats.get('totalKeysExamined'),
+        'docs_examined': stats.get('totalDocsExamined'),
+        'returned': stats.get('nReturned'),
+    }
@@ -0,0 +1,26 @@
+"""
+Marshmallow schemas validating client supplied prompts.
+
+Kept apart from :mod:`api.models` so that serving reads never imports
+marshmallow; the write paths import this module when they first run.
+"""
+from marshmallow import ValidationError, pre_load
+from marshmallow_mongoengine import ModelSchema
+
+from .models import Prompt, INTERNAL_FIELDS, DERIVED_FIELDS
+
+__all__ = ['PromptSchema', 'ValidationError']
+
+
+class PromptSchema(ModelSchema):
+    class Meta:
+        model = Prompt
+        exclude = ['id'] + INTERNAL_FIELDS
+        dump_only = DERIVED_FIELDS
+
+    @pre_load
+    def drop_derived_fields(self, data, **kwargs):
+        # Prompts read from the API (e.g. an export) carry them; they are recomputed on write.
+        if isinstance(data, dict):
+            data = {key: value for key, value in data.items() if key not in DERIVED_FIELDS}
+        return data
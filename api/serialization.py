@@ -0,0 +1,72 @@
+from functools import lru_cache
+
+from mongoengine import DateTimeField
+
+from .models import Prompt, INTERNAL_FIELDS
+
+
+# Mirrors PromptSchema: empty values are left out of the output.
+SKIP_VALUES = (None, [], {})
+PUBLIC_FIELDS = tuple(name for name in Prompt._fields if name != 'id' and name not in INTERNAL_FIELDS)
+
+
+def isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+class PromptSerializer:
+    """
+    Serialize raw ``prompts`` documents (``as_pymongo()`` rows) to API payloads.
+
+    Produces the same output as ``PromptSchema().dump`` without building
+    ``Prompt`` instances or going through marshmallow. The per-field plan is
+    computed once, so serializing a row is a single pass over the requested fields.
+    """
+
+    def __init__(self, fields=PUBLIC_FIELDS):
+        self.fields = tuple(fields)
+        self._plan = tuple(
+            (
+                name,
+                Prompt._fields[name].db_field,
+                isoformat if isinstance(Prompt._fields[name], DateTimeField) else None,
+            )
+            for name in self.fields
+        )
+
+    def __call__(self, document):
+        data = {}
+        for name, db_field, convert in self._plan:
+            value = document.get(db_field)
+            if value in SKIP_VALUES:
+                continue
+            data[name] = convert(value) if convert is not None else value
+        if document.get('content_blob') and 'content' in data:
+            # The body lives in prompt_blobs and was not hydrated (see api.storage).
+            data['content_truncated'] = True
+        return data
+
+    def many(self, documents):
+        return [self(document) for document in documents]
+
+
+prompt_serializer = PromptSerializer()
+
+
+@lru_cache(maxsize=128)
+def get_prompt_serializer(fields):
+    """Return a serializer restricted to ``fields`` (a tuple of public field names)."""
+    return PromptSerializer(fields)
+
+
+def parse_fields(raw_fields):
+    """
+    Parse a comma separated ``fields`` parameter.
+
+    :return: ``(fields, error)``; ``fields`` is a tuple in public field order.
+    """
+    requested = {field.strip() for field in raw_fields.split(',') if field.strip()}
+    unknown = requested.difference(PUBLIC_FIELDS)
+    if not requested or unknown:
+        return None, f"Invalid 'fields' parameter: must be a comma separated subset of {', '.join(PUBLIC_FIELDS)}."
+    return tuple(field for field in PUBLIC_FIELDS if field in requested), None
@@ -0,0 +1,137 @@
+"""
+Size-aware storage of prompt bodies.
+
+When ``PROMPT_BLOB_THRESHOLD`` is set, a ``content`` or ``example`` larger than
+the threshold is compressed into ``prompt_blobs`` and the prompt document only
+keeps a summary of the content (and an empty example) plus the blob hash in
+``content_blob`` / ``example_blob``. Listings then only load the small
+documents; full bodies are loaded on demand with :func:`hydrate_rows`.
+
+The distinct words of a packed content are kept in ``search_text``, which the
+text index and substring search cover next to ``content``, so search still
+matches past the summary without keeping the body in the prompt document.
+Substring search past the summary then matches within single words. The field
+is only read by queries (see ``QUERY_ONLY_FIELDS``).
+
+Blobs are content addressed and immutable, so identical bodies are stored once
+and revision snapshots can keep referring to them.
+"""
+import re
+import json
+import zlib
+import hashlib
+
+from pymongo import UpdateOne
+
+from .models import PromptBlob
+from .config import PROMPT_BLOB_THRESHOLD, PROMPT_SUMMARY_LENGTH
+
+
+BLOB_FIELDS = (('content', 'content_blob'), ('example', 'example_blob'))
+SEARCH_FIELD = 'search_text'
+SEARCH_WORD_PATTERN = re.compile(r'\w+')
+
+
+def encode_body(field, value):
+    if field == 'content':
+        return value.encode('utf-8')
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8')
+
+
+def decode_body(field, raw):
+    text = raw.decode('utf-8')
+    return text if field == 'content' else json.loads(text)
+
+
+def summarize(field, value):
+    return value[:PROMPT_SUMMARY_LENGTH] if field == 'content' else {}
+
+
+def search_words(content):
+    """Return the distinct lower-cased words of ``content`` in order of first use, space separated."""
+    return ' '.join(dict.fromkeys(word.lower() for word in SEARCH_WORD_PATTERN.findall(content)))
+
+
+def store_blobs(blobs):
+    if not blobs:
+        return
+    PromptBlob._get_collection().bulk_write([
+        UpdateOne({'_id': blob_id}, {'$setOnInsert': {'data': data, 'size': size}}, upsert=True)
+        for blob_id, (data, size) in blobs.items()
+    ], ordered=False)
+
+
+def pack_fields(fields, threshold=None):
+    """
+    Move oversized ``content`` / ``example`` values of ``fields`` into blobs.
+
+    ``fields`` is a raw document or a partial ``$set`` mapping and is modified
+    in place. Every body field present gets its blob reference (and for
+    ``content`` its ``search_text``) set or cleared, even with packing turned
+    off, so partial updates never leave a stale blob behind.
+    """
+    threshold = PROMPT_BLOB_THRESHOLD if threshold is None else threshold
+    blobs = {}
+    for field, blob_field in BLOB_FIELDS:
+        if field not in fields or fields[field] is None:
+            continue
+        fields[blob_field] = None
+        if field == 'content':
+            fields[SEARCH_FIELD] = None
+        if not threshold:
+            continue
+        raw = encode_body(field, fields[field])
+        if len(raw) <= threshold:
+            continue
+        if field == 'content':
+            fields[SEARCH_FIELD] = search_words(fields[field])
+        blob_id = hashlib.sha256(raw).hexdigest()
+        blobs[blob_id] = (zlib.compress(raw), len(raw))
+        fields[blob_field] = blob_id
+        fields[field] = summarize(field, fields[field])
+    store_blobs(blobs)
+    return fields
+
+
+def referenced_blob_ids(rows):
+    return {row.get(blob_field) for row in rows for _, blob_field in BLOB_FIELDS if row.get(blob_field)}
+
+
+def apply_blobs(rows, blobs):
+    """Swap summaries for the bodies in ``blobs`` (blob id to compressed data) and drop the references."""
+    for row in rows:
+        for field, blob_field in BLOB_FIELDS:
+            blob_id = row.pop(blob_field, None)
+            if blob_id and blob_id in blobs:
+                row[field] = decode_body(field, zlib.decompress(blobs[blob_id]))
+    return rows
+
+
+def hydrate_rows(rows, read_preference=None):
+    """
+    Replace summaries with the full bodies in raw rows, loading all blobs in one query.
+
+    Blob references are removed from the rows.
+
+    :param read_preference: Read preference the rows were loaded with; blobs are
+        written before the prompts referring to them, so any member that has the
+        rows also has their blobs. Defaults to the primary.
+    """
+    blob_ids = referenced_blob_ids(rows)
+    blobs = {}
+    if blob_ids:
+        collection = PromptBlob._get_collection()
+        if read_preference is not None:
+            collection = collection.with_options(read_preference=read_preference)
+        blobs = {blob['_id']: blob['data'] for blob in collection.find({'_id': {'$in': list(blob_ids)}})}
+    return apply_blobs(rows, blobs)
+
+
+def hydrate_prompt(prompt):
+    """Load the full bodies into a ``Prompt`` instance, e.g. before editing it."""
+    row = {field: getattr(prompt, field) for pair in BLOB_FIELDS for field in pair}
+    hydrate_rows([row])
+    prompt.content = row['content']
+    prompt.example = row['example']
+    prompt.example_blob = None
+    return prompt
@@ -0,0 +1,138 @@
+import re
+import json
+import math
+
+from .cache import LRUCache
+from .config import TEMPLATE_CACHE_SIZE
+
+
+TEMPLATE_VAR_PATTERN = re.compile(r'\{\{\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*\}\}')
+# Kana, CJK ideographs and Hangul: roughly one token per character.
+WIDE_CHAR_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+
+def format_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+class CompiledTemplate:
+    """
+    A prompt template split into literal text and ``{{var}}`` placeholders.
+
+    The content is parsed once; rendering only fills the placeholder slots and
+    joins the parts. Placeholders without a value keep their original text.
+    """
+
+    __slots__ = ('parts', 'placeholders', 'variables')
+
+    def __init__(self, content, segments=None):
+        """
+        :param segments: Placeholder offsets precomputed by :func:`analyze_template`;
+            the content is parsed when they are not given.
+        """
+        if segments is None:
+            segments = find_segments(content)
+        parts = []
+        placeholders = []
+        position = 0
+        for start, end in segments:
+            placeholder = content[start:end]
+            parts.append(content[position:start])
+            # Strip the braces and the spaces inside them.
+            placeholders.append((len(parts), placeholder[2:-2].strip(), placeholder))
+            parts.append(placeholder)
+            position = end
+        parts.append(content[position:])
+        self.parts = parts
+        self.placeholders = tuple(placeholders)
+        self.variables = tuple(dict.fromkeys(name for _, name, _ in placeholders))
+
+    def render(self, variables):
+        parts = self.parts.copy()
+        for index, name, _ in self.placeholders:
+            if name in variables:
+                parts[index] = format_value(variables[name])
+        return ''.join(parts)
+
+    def missing_variables(self, variables):
+        return [name for name in self.variables if name not in variables]
+
+
+def find_segments(content):
+    return [[match.start(), match.end()] for match in TEMPLATE_VAR_PATTERN.finditer(content)]
+
+
+def estimate_tokens(text):
+    """
+    Approximate the token count of ``text`` without a model specific tokenizer:
+    about four characters per token, one per CJK character.
+    """
+    wide = len(WIDE_CHAR_PATTERN.findall(text))
+    return wide + math.ceil((len(text) - wide) / 4)
+
+
+def analyze_template(content):
+    """
+    Compute the template metadata stored with every prompt (see ``Prompt.clean``).
+
+    :return: Mapping with ``placeholders`` (distinct names in order of first
+        use), ``segments`` (``[start, end]`` offsets of every placeholder in
+        ``content``), ``content_length`` and ``token_estimate``.
+    """
+    content = content or ''
+    matches = list(TEMPLATE_VAR_PATTERN.finditer(content))
+    return {
+        'placeholders': list(dict.fromkeys(match.group(1) for match in matches)),
+        'segments': [[match.start(), match.end()] for match in matches],
+        'content_length': len(content),
+        'token_estimate': estimate_tokens(content),
+    }
+
+
+def template_warnings(placeholders, variables, example=None):
+    """
+    List the mismatches between the placeholders of a template and its declared
+    ``variables`` and ``example``. They are reported to the writer, not rejected.
+
+    :param example: The example values, or None to skip checking them.
+    """
+    placeholders, variables = list(placeholders or ()), list(variables or ())
+    warnings = [f"Placeholder '{name}' is not listed in variables." for name in placeholders if name not in variables]
+    warnings.extend(f"Variable '{name}' does not appear in the content." for name in variables
+                    if name not in placeholders)
+    if example:
+        warnings.extend(f"Example has no value for placeholder '{name}'." for name in placeholders
+                        if name not in example)
+        warnings.extend(f"Example value '{name}' is not used by the content." for name in example
+                        if name not in placeholders)
+    return warnings
+
+
+def prompt_warnings(state):
+    """:func:`template_warnings` of a written prompt, as a raw document. A packed example is not checked."""
+    example = None if state.get('example_blob') else state.get('example')
+    return template_warnings(state.get('placeholders'), state.get('variables'), example)
+
+
+compiled_templates = LRUCache(TEMPLATE_CACHE_SIZE)
+
+
+def get_compiled_template(prompt_id, updated_at, content):
+    """
+    Return the compiled template for a prompt revision.
+
+    Entries are keyed on ``prompt_id`` and ``updated_at`` so an edited prompt
+    is recompiled on its next use without explicit invalidation.
+    """
+    key = (prompt_id, updated_at)
+    compiled = compiled_templates.get(key)
+    if compiled is None:
+        compiled = CompiledTemplate(content)
+        compiled_templates.set(key, compiled)
+    return compiled
+
+
+def get_cached_template(prompt_id, updated_at):
+    return compiled_templates.get((prompt_id, updated_at))
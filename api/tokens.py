@@ -0,0 +1,161 @@
+"""
+In-memory registry of the API bearer tokens.
+
+Besides ``AUTH_TOKEN`` (a full access token), any number of scoped tokens can be
+configured through ``API_TOKENS``, as ``name:scope:sha256[:quota]`` entries.
+Only the SHA-256 digest of each token is configured and kept, the registry is
+built once at startup, and authenticating a request is a hash plus a dictionary
+lookup: no environment read and no database query. Generate an entry with
+``python manage.py token <name> --scope read``.
+
+``read`` tokens may call the endpoints that do not modify prompts; ``write``
+tokens may call every endpoint. ``quota`` limits the requests a token may make
+per minute and per process.
+"""
+import time
+import hashlib
+import threading
+
+from .config import get_auth_token, get_api_token_specs
+from .metrics import TOKEN_REQUESTS
+
+
+SCOPE_READ = 'read'
+SCOPE_WRITE = 'write'
+SCOPES = (SCOPE_READ, SCOPE_WRITE)
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+QUOTA_WINDOW_SECONDS = 60
+DEFAULT_TOKEN_NAME = 'default'
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def method_scope(method):
+    """Scope an endpoint requires by default: ``read`` for safe methods, ``write`` otherwise."""
+    return SCOPE_READ if method in SAFE_METHODS else SCOPE_WRITE
+
+
+class ApiToken:
+    def __init__(self, name, digest, scope=SCOPE_WRITE, quota=None):
+        self.name = name
+        self.digest = digest
+        self.scope = scope
+        self.quota = quota
+        self._window = None
+        self._window_requests = 0
+        self._lock = threading.Lock()
+
+    def allows(self, scope):
+        return self.scope == SCOPE_WRITE or scope == SCOPE_READ
+
+    def consume(self, now=None):
+        """Count one request against the quota; False when the current window is exhausted."""
+        if not self.quota:
+            return True
+        window = int((time.monotonic() if now is None else now) // QUOTA_WINDOW_SECONDS)
+        with self._lock:
+            if window != self._window:
+                self._window, self._window_requests = window, 0
+            if self._window_requests >= self.quota:
+                return False
+            self._window_requests += 1
+            return True
+
+
+def parse_token_spec(spec):
+    """
+    Parse one ``name:scope:sha256[:quota]`` entry of ``API_TOKENS``.
+
+    :raises ValueError: If the entry is malformed.
+    """
+    parts = spec.split(':')
+    if len(parts) not in (3, 4):
+        raise ValueError(f'Invalid API_TOKENS entry {spec!r}: expected name:scope:sha256[:quota]')
+    name, scope, digest = parts[:3]
+    if scope not in SCOPES:
+        raise ValueError(f"Invalid API_TOKENS entry {spec!r}: scope must be one of {', '.join(SCOPES)}")
+    digest = digest.lower()
+    if len(digest) != 64 or any(char not in '0123456789abcdef' for char in digest):
+        raise ValueError(f'Invalid API_TOKENS entry {spec!r}: the token must be given as a hex SHA-256 digest')
+    quota = None
+    if len(parts) == 4:
+        if not parts[3].isdigit():
+            raise ValueError(f'Invalid API_TOKENS entry {spec!r}: quota must be a number of requests per minute')
+        quota = int(parts[3]) or None
+    return ApiToken(name, digest, scope, quota)
+
+
+class TokenRegistry:
+    def __init__(self, tokens=()):
+        self._tokens = {}
+        for token in tokens:
+            if token.digest in self._tokens:
+                raise ValueError(f'API token {token.name!r} is configured twice')
+            self._tokens[token.digest] = token
+
+    def __bool__(self):
+        return bool(self._tokens)
+
+    def __iter__(self):
+        return iter(self._tokens.values())
+
+    def authenticate(self, authorization):
+        """
+        Find the token presented in an ``Authorization`` header.
+
+        The presented secret is never compared itself: it is hashed and its
+        digest looked up. A digest lookup leaks nothing usable about the secret
+        (matching a digest prefix is as hard as guessing the token), so the check
+        takes the same time whatever the presented token shares with a real one.
+
+        :return: The :class:`ApiToken`, or None when the header holds no known token.
+        """
+        if not authorization or not authorization.startswith('Bearer '):
+            return None
+        return self._tokens.get(hash_token(authorization[len('Bearer '):]))
+
+
+def load_token_registry():
+    tokens = [parse_token_spec(spec) for spec in get_api_token_specs()]
+    auth_token = get_auth_token()
+    if auth_token:
+        tokens.append(ApiToken(DEFAULT_TOKEN_NAME, hash_token(auth_token)))
+    return TokenRegistry(tokens)
+
+
+_registry = load_token_registry()
+
+
+def get_token_registry():
+    return _registry
+
+
+def reload_token_registry():
+    """Re-read ``AUTH_TOKEN`` and ``API_TOKENS``, e.g. after rotating a token."""
+    global _registry
+    _registry = load_token_registry()
+    return _registry
+
+
+def check_token(authorization, scope):
+    """
+    Authenticate a request and charge it to the quota of its token.
+
+    :return: ``(message, status_code)`` when the request must be rejected, otherwise None.
+    """
+    registry = get_token_registry()
+    if not registry:
+        return 'Server authentication token is not configured', 503
+    token = registry.authenticate(authorization)
+    if token is None:
+        return 'Unauthorized', 401
+    if not token.allows(scope):
+        TOKEN_REQUESTS.inc(token.name, 'forbidden')
+        return f'Token is not allowed to {scope}', 403
+    if not token.consume():
+        TOKEN_REQUESTS.inc(token.name, 'throttled')
+        return 'Token quota exceeded', 429
+    TOKEN_REQUESTS.inc(token.name, 'allowed')
+    return None
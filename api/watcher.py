@@ -0,0 +1,114 @@
+import logging
+import threading
+
+from pymongo.errors import PyMongoError, OperationFailure
+
+from .cache import prompt_cache
+from .models import Prompt
+
+
+logger = logging.getLogger(__name__)
+
+# Only ship what is needed to invalidate: the resume token, the operation and the prompt_id.
+CHANGE_STREAM_PIPELINE = [
+    {'$project': {'operationType': 1, 'documentKey': 1, 'fullDocument.prompt_id': 1}},
+]
+# Server error code for a resume token that fell off the oplog.
+CHANGE_STREAM_HISTORY_LOST = 286
+
+
+def invalidate_cached_prompt(prompt_id):
+    if prompt_id is None:
+        # Deletes only carry the ObjectId, so drop everything rather than serve a deleted prompt.
+        prompt_cache.clear()
+    else:
+        prompt_cache.invalidate(prompt_id)
+
+
+class PromptChangeWatcher(threading.Thread):
+    """
+    Follow the ``prompts`` change stream and push invalidations to this process.
+
+    Every insert, update or replace evicts the prompt from the local caches.
+    Deletes, drops and stream invalidations clear them. The watcher resumes from
+    its last token after transient errors, so edits made by other workers or by
+    the admin UI become visible within ``retry_delay`` plus the replication lag.
+    Change streams require a replica set (a single-node one is enough).
+    """
+
+    def __init__(self, listeners=None, retry_delay=1.0, max_await_time_ms=1000):
+        super().__init__(name='prompt-change-watcher', daemon=True)
+        self.listeners = list(listeners) if listeners is not None else [invalidate_cached_prompt]
+        self.retry_delay = retry_delay
+        self.max_await_time_ms = max_await_time_ms
+        self.resume_token = None
+        self.ready = threading.Event()
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def notify(self, prompt_id):
+        for listener in self.listeners:
+            try:
+                listener(prompt_id)
+            except Exception:
+                logger.exception('Prompt change listener failed')
+
+    def handle_change(self, change):
+        operation = change.get('operationType')
+        if operation in ('insert', 'update', 'replace'):
+            self.notify((change.get('fullDocument') or {}).get('prompt_id'))
+        else:
+            # delete, drop, rename, dropDatabase and invalidate.
+            self.notify(None)
+
+    def watch_once(self):
+        collection = Prompt._get_collection()
+        with collection.watch(
+            CHANGE_STREAM_PIPELINE,
+            full_document='updateLookup',
+            resume_after=self.resume_token,
+            max_await_time_ms=self.max_await_time_ms,
+        ) as stream:
+            self.ready.set()
+            while not self._stopped.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is None:
+                    continue
+                self.resume_token = change['_id']
+                self.handle_change(change)
+                if change.get('operationType') == 'invalidate':
+                    self.resume_token = None
+                    return
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                self.watch_once()
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning('Prompt change stream history lost, restarting from now')
+                    self.resume_token = None
+                    self.notify(None)
+                else:
+                    logger.exception(f"Prompt change stream failed: {str(e)}")
+                self._stopped.wait(self.retry_delay)
+            except PyMongoError as e:
+                logger.warning(f"Prompt change stream interrupted, retrying: {str(e)}")
+                if self.resume_token is None:
+                    # Nothing to resume from, so changes made meanwhile cannot be replayed.
+                    self.notify(None)
+                self._stopped.wait(self.retry_delay)
+
+
+_watcher = None
+
+
+def start_change_watcher():
+    """Start the process wide watcher once. Call it after workers fork."""
+    global _watcher
+    if _watcher is None or not _watcher.is_alive():
+        _watcher = PromptChangeWatcher()
+        _watcher.start()
+    return _watcher
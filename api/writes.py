@@ -0,0 +1,113 @@
+"""
+Single round trip prompt writes.
+
+A payload is validated once (the marshmallow ``load`` followed by the
+MongoEngine field validation) and written with one ``insert_one`` or
+``find_one_and_update``. The update returns the document as it was before the
+write, which is all the side effects in :mod:`api.events` need, and checks an
+optional ``updated_at`` precondition in the same atomic query.
+"""
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+from .models import Prompt, DERIVED_FIELDS
+from .storage import pack_fields
+from .db import write_collection
+
+
+class WriteConflict(Exception):
+    """The prompt exists but was modified after the version the client expected."""
+
+
+def stored_now():
+    # MongoDB keeps milliseconds: the in-memory state must match what a later read returns.
+    now = datetime.now()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def to_stored_datetime(value):
+    """Convert an aware datetime to the naive local time ``updated_at`` is stored in."""
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def build_document(data, prompt_schema):
+    """
+    Validate a new prompt. ``updated_at`` is stamped here, whatever the payload
+    holds: the change feed (:mod:`api.changes`) resumes from it.
+
+    :return: The packed raw document, ready for ``insert_one``.
+    """
+    prompt = prompt_schema.load(data)
+    prompt.validate()
+    document = pack_fields(prompt.to_mongo().to_dict())
+    document.pop('_id', None)
+    document['updated_at'] = stored_now()
+    return document
+
+
+def build_changes(data, prompt_schema):
+    """
+    Validate a partial prompt.
+
+    :return: The packed ``$set`` document, with the derived fields and a new ``updated_at``.
+    """
+    data = {key: value for key, value in data.items() if key != 'prompt_id' and key not in DERIVED_FIELDS}
+    prompt = prompt_schema.load(data)
+    changes = {}
+    for name in data:
+        field = Prompt._fields[name]
+        value = getattr(prompt, name)
+        if value is not None:
+            field.validate(value)
+        changes[field.db_field] = field.to_mongo(value)
+    changes.update(Prompt.derived_changes(data))
+    changes['updated_at'] = stored_now()
+    return pack_fields(changes)
+
+
+def insert_prompt_document(document, write_concern=None):
+    write_collection(Prompt, write_concern).insert_one(document)
+    return document
+
+
+def update_prompt_document(prompt_id, changes, expected_updated_at=None, unmodified_since=None, write_concern=None):
+    """
+    Apply ``changes`` (see :func:`build_changes`) with one ``find_one_and_update``.
+
+    :param expected_updated_at: Only write if the stored ``updated_at`` is exactly this datetime.
+    :param unmodified_since: Only write if ``updated_at`` is not later than this datetime, compared
+        with the second precision of ``If-Unmodified-Since``.
+    :return: ``(previous, current)`` states of the prompt as raw documents.
+    :raises Prompt.DoesNotExist: If there is no such prompt.
+    :raises WriteConflict: If the prompt does not satisfy the precondition.
+    """
+    condition = {}
+    if expected_updated_at is not None:
+        condition['$eq'] = to_stored_datetime(expected_updated_at)
+    if unmodified_since is not None:
+        condition['$lt'] = to_stored_datetime(unmodified_since) + timedelta(seconds=1)
+    query = {'prompt_id': prompt_id, **({'updated_at': condition} if condition else {})}
+    collection = write_collection(Prompt, write_concern)
+    previous = collection.find_one_and_update(query, {'$set': changes}, return_document=ReturnDocument.BEFORE)
+    if previous is None:
+        # Only failed conditional writes pay for a second query.
+        if condition and collection.count_documents({'prompt_id': prompt_id}, limit=1):
+            raise WriteConflict(prompt_id)
+        raise Prompt.DoesNotExist
+    return previous, {**previous, **changes}
+
+
+def delete_prompt_document(prompt_id, write_concern=None):
+    """
+    Delete a prompt with one ``find_one_and_delete``.
+
+    :return: The deleted document.
+    :raises Prompt.DoesNotExist: If there is no such prompt.
+    """
+    previous = write_collection(Prompt, write_concern).find_one_and_delete({'prompt_id': prompt_id})
+    if previous is None:
+        raise Prompt.DoesNotExist
+    return previous
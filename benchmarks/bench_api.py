@@ -0,0 +1,242 @@
+"""
+Latency and throughput benchmarks for the API and admin routes.
+
+Seeds the configured MongoDB (``MONGODB_HOST`` / ``MONGODB_DB``) with synthetic
+prompts, drives the Flask app in-process and reports p50/p95/p99 latency and
+requests per second per scenario as JSON. Use a dedicated database, e.g.::
+
+    MONGODB_DB=prompt_bench python -m benchmarks.bench_api --sizes 1000,100000 -o bench.json
+    python -m benchmarks.bench_api --sizes 1000 --compare bench.json
+
+``--mongomock`` runs against mongomock (if installed) for a quick smoke run;
+its numbers say nothing about MongoDB itself. Benchmark documents use the
+``bench-`` prompt_id prefix and are reused across runs; ``--cleanup`` removes them.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+
+BENCH_TAG = '__bench__'
+BENCH_PREFIX = 'bench-'
+TAGS = ['qa', 'summarize', 'translate', 'classify', 'extract', 'chat', 'code', 'rewrite']
+LLMS = ['gpt-4o', 'claude', 'llama', 'qwen']
+WORDS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet']
+SEED_CHUNK_SIZE = 5000
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the Prompt Doc API.')
+    parser.add_argument('--sizes', default='1000', help='Comma separated corpus sizes, e.g. 1000,100000,1000000.')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+    parser.add_argument('--concurrency', type=int, default=1, help='Concurrent client threads.')
+    parser.add_argument('--scenarios', default='', help='Comma separated subset of scenarios to run.')
+    parser.add_argument('--content-size', type=int, default=400, help='Approximate content length in characters.')
+    parser.add_argument('-o', '--output', help='Write JSON results to this file.')
+    parser.add_argument('--compare', help='Baseline JSON file; exit with 1 on p95 regressions.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative p95 increase.')
+    parser.add_argument('--mongomock', action='store_true', help='Use mongomock instead of a MongoDB server.')
+    parser.add_argument('--cleanup', action='store_true', help='Delete benchmark prompts and exit.')
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def configure_backend(args):
+    os.environ.setdefault('AUTH_TOKEN', 'bench_auth_token')
+    os.environ.setdefault('SECRET_KEY', 'bench_secret_key')
+    os.environ.setdefault('PROMPT_CHANGE_STREAM', 'false')
+    if args.mongomock:
+        import mongomock
+        from api import config
+        config.MONGODB_SETTINGS['mongo_client_class'] = mongomock.MongoClient
+        config.MONGODB_SETTINGS['host'] = config.MONGODB_SETTINGS.get('host') or 'mongodb://localhost'
+
+
+def build_document(index, rng, content_size):
+    from api.models import make_version_key
+
+    words = ' '.join(rng.choice(WORDS) for _ in range(max(1, content_size // 7)))
+    created_at = datetime(2024, 1, 1) + timedelta(seconds=index)
+    version = f'{rng.randint(1, 3)}.{rng.randint(0, 12)}'
+    return {
+        'prompt_id': f'{BENCH_PREFIX}{index:09d}',
+        'content': f'Answer {{{{question}}}} about {{{{topic}}}}. {words}',
+        'variables': ['question', 'topic'],
+        'example': {'question': 'What is it?', 'topic': rng.choice(WORDS)},
+        'version': version,
+        'version_key': make_version_key(version),
+        'applicable_llm': rng.choice(LLMS),
+        'family': f'{BENCH_PREFIX}family-{index % 1000}',
+        'created_at': created_at,
+        'updated_at': created_at,
+        'tags': [BENCH_TAG, *rng.sample(TAGS, 2)],
+    }
+
+
+def seed(size, rng, content_size):
+    """Top the corpus up to ``size`` benchmark prompts; existing ones are reused."""
+    from api.models import Prompt
+
+    collection = Prompt._get_collection()
+    existing = collection.count_documents({'tags': BENCH_TAG})
+    start = time.perf_counter()
+    for chunk_start in range(existing, size, SEED_CHUNK_SIZE):
+        chunk_end = min(size, chunk_start + SEED_CHUNK_SIZE)
+        collection.insert_many(
+            [build_document(index, rng, content_size) for index in range(chunk_start, chunk_end)],
+            ordered=False,
+        )
+    if size > existing:
+        print(f'Seeded {size - existing} prompts in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+
+
+def cleanup():
+    from api.models import Prompt, PromptRevision
+
+    Prompt.objects(prompt_id__startswith=BENCH_PREFIX).delete()
+    PromptRevision.objects(prompt_id__startswith=BENCH_PREFIX).delete()
+
+
+def build_scenarios(size, rng):
+    """Map scenario name to a factory returning ``(method, url, kwargs)`` per request."""
+    def random_id():
+        return f'{BENCH_PREFIX}{rng.randrange(size):09d}'
+
+    deep_page = max(1, (size // 10) // 2)
+    scenarios = {
+        'detail': lambda: ('GET', f'/api/prompt/{random_id()}', {}),
+        'detail_uncached': lambda: ('GET', f'/api/prompt/{random_id()}', {'clear_cache': True}),
+        'list_first_page': lambda: ('GET', '/api/prompts?per_page=10', {}),
+        'list_deep_page': lambda: ('GET', f'/api/prompts?per_page=10&page={deep_page}', {}),
+        'list_cursor_first_page': lambda: ('GET', '/api/prompts?per_page=10&cursor=', {}),
+        'list_tag_filter': lambda: ('GET', f'/api/prompts?per_page=10&tag={rng.choice(TAGS)}', {}),
+        'list_fields_projection': lambda: ('GET', '/api/prompts?per_page=100&fields=prompt_id,tags', {}),
+        'search_text': lambda: ('GET', f'/api/prompts?per_page=10&search={rng.choice(WORDS)}', {}),
+        'search_substring': lambda: (
+            'GET', f'/api/prompts?per_page=10&search_mode=substring&search={rng.choice(WORDS)}', {}),
+        'render': lambda: ('POST', f'/api/prompt/{random_id()}/render',
+                           {'json': {'variables': {'question': 'Why?', 'topic': 'benchmarks'}}}),
+        'admin_prompt_detail': lambda: ('GET', f'/admin/prompt/{random_id()}', {'admin': True}),
+    }
+    return scenarios
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(app, make_request, count, concurrency):
+    from api.cache import prompt_cache
+
+    headers = {'Authorization': f"Bearer {os.environ['AUTH_TOKEN']}"}
+
+    def worker(n):
+        latencies, errors = [], 0
+        with app.test_client() as client:
+            with client.session_transaction() as session_data:
+                session_data['logged_in'] = True
+            for _ in range(n):
+                method, url, options = make_request()
+                if options.get('clear_cache'):
+                    prompt_cache.clear()
+                start = time.perf_counter()
+                response = client.open(url, method=method, headers=headers, json=options.get('json'))
+                latencies.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    errors += 1
+        return latencies, errors
+
+    shares = [count // concurrency + (1 if i < count % concurrency else 0) for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(worker, shares))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for worker_latencies, _ in outcomes for latency in worker_latencies)
+    return {
+        'count': len(latencies),
+        'errors': sum(errors for _, errors in outcomes),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+    }
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path, encoding='utf-8') as baseline_file:
+        baseline = {(item['size'], item['scenario']): item for item in json.load(baseline_file)['results']}
+    regressions = []
+    for item in results:
+        previous = baseline.get((item['size'], item['scenario']))
+        if not previous or not previous.get('p95_ms') or item.get('p95_ms') is None:
+            continue
+        if item['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{item['scenario']}@{item['size']}: p95 {previous['p95_ms']}ms -> {item['p95_ms']}ms")
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_backend(args)
+
+    from api.index import app
+
+    with app.app_context():
+        if args.cleanup:
+            cleanup()
+            return 0
+
+        rng = random.Random(args.seed)
+        selected = {name.strip() for name in args.scenarios.split(',') if name.strip()}
+        results = []
+        for size in sorted(int(size) for size in args.sizes.split(',')):
+            seed(size, rng, args.content_size)
+            for name, make_request in build_scenarios(size, rng).items():
+                if selected and name not in selected:
+                    continue
+                # Warm up connections, caches and indexes before measuring.
+                run_scenario(app, make_request, min(20, args.requests), 1)
+                result = {'size': size, 'scenario': name,
+                          **run_scenario(app, make_request, args.requests, args.concurrency)}
+                results.append(result)
+                print(f"{size:>9} {name:<24} p50={result['p50_ms']}ms p95={result['p95_ms']}ms "
+                      f"p99={result['p99_ms']}ms rps={result['rps']} errors={result['errors']}", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'backend': 'mongomock' if args.mongomock else 'mongodb',
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Cold-start budget for the serverless entry point.
+
+Imports ``api.index`` in fresh interpreters, like a new serverless instance
+does, and reports the import time and the modules that must stay deferred::
+
+    python -m benchmarks.import_time --runs 10 --budget-ms 400
+
+Exits with 1 when the median import time exceeds ``--budget-ms``, when a
+deferred module (admin, schema or async-only dependency) was imported, or when
+importing the app opened a MongoDB connection.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+
+# Only needed by the admin UI, the write paths or the ASGI entry point.
+DEFERRED_MODULES = ('marshmallow', 'marshmallow_mongoengine', 'pyotp', 'flask_mongoengine', 'motor')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import sys, json, time
+start = time.perf_counter()
+import api.index
+elapsed = time.perf_counter() - start
+from mongoengine import connection
+print(json.dumps({
+    "import_ms": elapsed * 1000,
+    "loaded": [name for name in %r if name in sys.modules],
+    "connections": len(connection._connections),
+}))
+''' % (DEFERRED_MODULES,)
+
+
+def probe_import():
+    env = {**os.environ, 'SECRET_KEY': os.environ.get('SECRET_KEY', 'import_time'),
+           'PROMPT_CHANGE_STREAM': 'false'}
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure(runs):
+    probes = [probe_import() for _ in range(runs)]
+    timings = sorted(probe['import_ms'] for probe in probes)
+    return {
+        'runs': runs,
+        'median_ms': round(statistics.median(timings), 1),
+        'max_ms': round(timings[-1], 1),
+        'deferred_modules_loaded': sorted({name for probe in probes for name in probe['loaded']}),
+        'connections_opened': max(probe['connections'] for probe in probes),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the import time of api.index.')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to start.')
+    parser.add_argument('--budget-ms', type=float, default=None, help='Fail when the median exceeds this.')
+    args = parser.parse_args(argv)
+
+    report = measure(args.runs)
+    print(json.dumps(report, indent=2))
+    failed = bool(report['deferred_modules_loaded'] or report['connections_opened'])
+    if args.budget_ms is not None and report['median_ms'] > args.budget_ms:
+        print(f"Median import time {report['median_ms']}ms exceeds the {args.budget_ms}ms budget", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
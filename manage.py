@@ -0,0 +1,118 @@
+import sys
+import secrets
+import argparse
+
+from api.index import app
+from api.models import ensure_indexes, check_indexes, drop_extra_indexes
+from api.catalog import iter_export_lines, import_lines, analyze_prompts, IMPORT_CHUNK_SIZE
+from api.facets import rebuild_facet_counts
+from api.tokens import hash_token, SCOPES, SCOPE_READ
+
+
+def run_indexes(args):
+    if not args.check:
+        ensure_indexes()
+        if args.drop_extra:
+            for collection, dropped in drop_extra_indexes().items():
+                for index in dropped:
+                    print(f'{collection}: dropped index {index}')
+    report = check_indexes()
+    missing_any = False
+    for collection, result in report.items():
+        for index in result['missing']:
+            missing_any = True
+            print(f'{collection}: missing index {index}')
+        for index in result['extra']:
+            print(f'{collection}: extra index {index}')
+    if missing_any:
+        return 1
+    print('All declared indexes are present.')
+    return 0
+
+
+def run_export(args):
+    output = open(args.output, 'w', encoding='utf-8') if args.output != '-' else sys.stdout
+    try:
+        for line in iter_export_lines():
+            output.write(line)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+def run_import(args):
+    source = open(args.input, 'r', encoding='utf-8') if args.input != '-' else sys.stdin
+    try:
+        summary = import_lines(source, chunk_size=args.chunk_size)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    print(f'Processed {summary.processed} lines: {summary.upserted} inserted, '
+          f'{summary.updated} updated, {summary.error_count} failed.', file=sys.stderr)
+    for error in summary.errors:
+        print(f"line {error['line']}: {error['error']}", file=sys.stderr)
+    return 1 if summary.error_count else 0
+
+
+def run_facets(args):
+    count = rebuild_facet_counts()
+    print(f'Rebuilt counts for {count} facet values.')
+    return 0
+
+
+def run_analyze(args):
+    count = analyze_prompts()
+    print(f'Updated the template metadata of {count} prompts.')
+    return 0
+
+
+def run_token(args):
+    token = secrets.token_urlsafe(32)
+    entry = f'{args.name}:{args.scope}:{hash_token(token)}' + (f':{args.quota}' if args.quota else '')
+    print(f'Token (give it to the caller, it is not stored): {token}')
+    print(f'API_TOKENS entry: {entry}')
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Prompt Doc maintenance commands.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    indexes_parser = subparsers.add_parser('indexes', help='Create and verify MongoDB indexes.')
+    indexes_parser.add_argument('--check', action='store_true',
+                                help='Only report missing indexes, exit with 1 if any.')
+    indexes_parser.add_argument('--drop-extra', action='store_true',
+                                help='Drop indexes that are no longer declared.')
+    indexes_parser.set_defaults(handler=run_indexes)
+
+    export_parser = subparsers.add_parser('export', help='Export all prompts as NDJSON.')
+    export_parser.add_argument('-o', '--output', default='-', help='Output file, "-" for stdout.')
+    export_parser.set_defaults(handler=run_export)
+
+    import_parser = subparsers.add_parser('import', help='Upsert prompts by prompt_id from NDJSON.')
+    import_parser.add_argument('-i', '--input', default='-', help='Input file, "-" for stdin.')
+    import_parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+                               help='Number of prompts per bulk write.')
+    import_parser.set_defaults(handler=run_import)
+
+    facets_parser = subparsers.add_parser('facets', help='Recount tag, LLM and version facets from the prompts.')
+    facets_parser.set_defaults(handler=run_facets)
+
+    analyze_parser = subparsers.add_parser(
+        'analyze', help='Recompute placeholders, token estimates and search copies of all prompts.')
+    analyze_parser.set_defaults(handler=run_analyze)
+
+    token_parser = subparsers.add_parser('token', help='Generate an API token and its API_TOKENS entry.')
+    token_parser.add_argument('name', help='Caller name, used as the metrics label.')
+    token_parser.add_argument('--scope', choices=SCOPES, default=SCOPE_READ)
+    token_parser.add_argument('--quota', type=int, default=None, help='Requests per minute and process.')
+    token_parser.set_defaults(handler=run_token)
+
+    args = parser.parse_args(argv)
+    with app.app_context():
+        return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
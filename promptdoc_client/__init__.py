@@ -0,0 +1,9 @@
+"""
+Python client for the Prompt Doc API with a local replica of the catalog.
+
+Only depends on the standard library, so it can be vendored into any service.
+"""
+from .client import PromptClient, PromptClientError
+from .templating import CompiledTemplate
+
+__all__ = ['PromptClient', 'PromptClientError', 'CompiledTemplate']
@@ -0,0 +1,181 @@
+import json
+import logging
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from .snapshot import load_snapshot, save_snapshot
+from .templating import CompiledTemplate
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_INTERVAL = 30.0
+DEFAULT_TIMEOUT = 5.0
+CHANGES_PAGE_SIZE = 500
+
+
+class PromptClientError(Exception):
+    """Raised when the Prompt Doc API cannot be reached or answers with an error."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class PromptClient:
+    """
+    In-process replica of the prompt catalog.
+
+    The catalog is kept in memory (and in ``snapshot_path`` when given, so a
+    restarted service can serve prompts before the API answers) and kept up to
+    date from ``GET /api/prompts:changes``: each refresh only transfers the
+    prompts changed or deleted since the previous one. Lookups and rendering never touch
+    the network; during an API outage the last known catalog keeps being served.
+
+    Usage::
+
+        client = PromptClient('https://prompts.example.com', token, snapshot_path='/var/cache/prompts.json')
+        client.start()  # initial sync, then refresh in the background
+        text = client.render('summarize', {'text': document})
+    """
+
+    def __init__(self, base_url, token, snapshot_path=None, refresh_interval=DEFAULT_REFRESH_INTERVAL,
+                 timeout=DEFAULT_TIMEOUT, page_size=CHANGES_PAGE_SIZE):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self.page_size = page_size
+        self._prompts, self._cursor = load_snapshot(snapshot_path) if snapshot_path else ({}, None)
+        self._templates = {}
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._prompts)
+
+    def get(self, prompt_id, default=None):
+        """Return the prompt as served by ``GET /api/prompt/<prompt_id>``, or ``default``."""
+        return self._prompts.get(prompt_id, default)
+
+    def render(self, prompt_id, variables=None):
+        """
+        Render a prompt locally, like ``POST /api/prompt/<prompt_id>/render``.
+
+        :raises KeyError: If the prompt is not in the catalog.
+        """
+        return self.template(prompt_id).render(variables or {})
+
+    def template(self, prompt_id):
+        prompt = self._prompts.get(prompt_id)
+        if prompt is None:
+            raise KeyError(prompt_id)
+        key = (prompt_id, prompt.get('updated_at'))
+        compiled = self._templates.get(key)
+        if compiled is None:
+            content = prompt.get('content', '')
+            # Precomputed offsets are only trusted when they describe this content.
+            segments = prompt.get('segments') if prompt.get('content_length') == len(content) else None
+            compiled = self._templates[key] = CompiledTemplate(content, segments)
+        return compiled
+
+    def refresh(self):
+        """
+        Pull the changes since the last refresh and apply them.
+
+        :return: Number of prompts changed or deleted.
+        :raises PromptClientError: If the API cannot be reached; the catalog is left unchanged.
+        """
+        with self._refresh_lock:
+            cursor, changed, deleted = self._cursor, {}, set()
+            while True:
+                params = {'per_page': self.page_size}
+                if cursor:
+                    params['cursor'] = cursor
+                page = self.request('/api/prompts:changes', params)
+                for prompt in page['data']:
+                    changed[prompt['prompt_id']] = prompt
+                    deleted.discard(prompt['prompt_id'])
+                for tombstone in page.get('deleted', ()):
+                    changed.pop(tombstone['prompt_id'], None)
+                    deleted.add(tombstone['prompt_id'])
+                cursor = page['next_cursor'] or cursor
+                if not page['has_more']:
+                    break
+            # Recent changes are sent again until they settle on the server: keep only news.
+            changed = {prompt_id: prompt for prompt_id, prompt in changed.items()
+                       if self._prompts.get(prompt_id) != prompt}
+            deleted = {prompt_id for prompt_id in deleted if prompt_id in self._prompts}
+            if changed or deleted or cursor != self._cursor:
+                # Readers keep using the previous dict until the new one is complete.
+                prompts = {**self._prompts, **changed}
+                for prompt_id in deleted:
+                    prompts.pop(prompt_id, None)
+                self._prompts, self._cursor = prompts, cursor
+                self._templates = {key: compiled for key, compiled in self._templates.items()
+                                   if key[0] not in changed and key[0] not in deleted}
+                if self.snapshot_path:
+                    save_snapshot(self.snapshot_path, prompts, cursor)
+            return len(changed) + len(deleted)
+
+    def start(self):
+        """
+        Synchronize once, then keep refreshing in a daemon thread.
+
+        A failed initial synchronization is logged, not raised, when a snapshot
+        was loaded: the service starts with the catalog it had.
+        """
+        try:
+            self.refresh()
+        except PromptClientError:
+            if not self._prompts:
+                raise
+            logger.warning('Prompt Doc API unavailable, serving the local snapshot', exc_info=True)
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='promptdoc-refresh', daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.timeout + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.warning('Prompt refresh failed, keeping the current catalog', exc_info=True)
+
+    def request(self, path, params=None):
+        url = self.base_url + path
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        http_request = urllib.request.Request(url, headers={
+            'Authorization': f'Bearer {self.token}',
+            'Accept': 'application/json',
+        })
+        try:
+            with urllib.request.urlopen(http_request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('error', e.reason)
+            except ValueError:
+                message = e.reason
+            raise PromptClientError(f'{path}: {message}', status=e.code) from e
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise PromptClientError(f'{path}: {e}') from e
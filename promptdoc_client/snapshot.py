@@ -0,0 +1,43 @@
+import os
+import json
+import logging
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+
+
+def load_snapshot(path):
+    """
+    Read a snapshot written by :func:`save_snapshot`.
+
+    :return: ``(prompts, cursor)``; an empty catalog when the file is missing or unreadable.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        if snapshot.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f"unsupported snapshot format {snapshot.get('format')!r}")
+        return snapshot['prompts'], snapshot.get('cursor')
+    except FileNotFoundError:
+        return {}, None
+    except (OSError, ValueError, KeyError, AttributeError) as e:
+        logger.warning(f'Ignoring unreadable prompt snapshot {path}: {e}')
+        return {}, None
+
+
+def save_snapshot(path, prompts, cursor):
+    """Write the catalog atomically: readers see the previous or the new snapshot, never a partial one."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix='.promptdoc-', suffix='.json')
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as snapshot_file:
+            json.dump({'format': SNAPSHOT_FORMAT, 'cursor': cursor, 'prompts': prompts}, snapshot_file,
+                      ensure_ascii=False, separators=(',', ':'))
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
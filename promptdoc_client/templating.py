@@ -0,0 +1,55 @@
+import re
+import json
+
+
+# Same placeholder syntax and rendering rules as api.templating on the server.
+TEMPLATE_VAR_PATTERN = re.compile(r'\{\{\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*\}\}')
+
+
+def format_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+class CompiledTemplate:
+    """
+    A prompt template split into literal text and ``{{var}}`` placeholders.
+
+    Renders exactly like ``POST /api/prompt/<id>/render``: placeholders without
+    a value keep their original text.
+    """
+
+    __slots__ = ('parts', 'placeholders', 'variables')
+
+    def __init__(self, content, segments=None):
+        """
+        :param segments: The ``segments`` the server stores with the prompt
+            (``[start, end]`` of every placeholder); the content is parsed when
+            they are not given.
+        """
+        if segments is None:
+            segments = [(match.start(), match.end()) for match in TEMPLATE_VAR_PATTERN.finditer(content)]
+        parts = []
+        placeholders = []
+        position = 0
+        for start, end in segments:
+            parts.append(content[position:start])
+            # Strip the braces and the spaces inside them.
+            placeholders.append((len(parts), content[start + 2:end - 2].strip()))
+            parts.append(content[start:end])
+            position = end
+        parts.append(content[position:])
+        self.parts = parts
+        self.placeholders = tuple(placeholders)
+        self.variables = tuple(dict.fromkeys(name for _, name in placeholders))
+
+    def render(self, variables):
+        parts = self.parts.copy()
+        for index, name in self.placeholders:
+            if name in variables:
+                parts[index] = format_value(variables[name])
+        return ''.join(parts)
+
+    def missing_variables(self, variables):
+        return [name for name in self.variables if name not in variables]
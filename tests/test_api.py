@@ -1,5 +1,10 @@
 import os
+import html
+import json
+import asyncio
+import time
 import uuid
+from datetime import datetime, timedelta
 
 import pytest
 
@@ -7,8 +12,17 @@ import pytest
 os.environ.setdefault('AUTH_TOKEN', 'test_auth_token')
 
 from api.index import app
-from api import admin_routes
-from api.models import Prompt
+from api import (admin_routes, api_routes, batch_routes, writes, events, storage, metrics, asgi, db, tokens, changes,
+                 catalog, payloads)
+from api.cache import prompt_cache, LRUCache
+from api.watcher import PromptChangeWatcher
+from api.models import (Prompt, PromptRevision, PromptBlob, PromptFacet, PromptTombstone, ensure_indexes,
+                        check_indexes, drop_extra_indexes)
+from api.facets import get_facet_counts, rebuild_facet_counts
+from api.schemas import PromptSchema
+from api.serialization import prompt_serializer
+from api.queries import summarize_plan
+from benchmarks import import_time
 
 
 TEST_MARKER_TAG = '__pytest__'
@@ -35,8 +49,13 @@ def build_prompt_payload(**overrides):
 @pytest.fixture(autouse=True)
 def cleanup_test_prompts():
     yield
+    marked_ids = list(Prompt.objects(tags__in=[TEST_MARKER_TAG]).scalar('prompt_id'))
+    PromptRevision.objects(prompt_id__in=marked_ids).delete()
+    PromptRevision.objects(prompt_id__startswith='test-').delete()
     Prompt.objects(tags__in=[TEST_MARKER_TAG]).delete()
     Prompt.objects(prompt_id__startswith='test-').delete()
+    PromptFacet.objects(value__startswith='facet-').delete()
+    PromptTombstone.objects(prompt_id__startswith='test-').delete()
 
 
 @pytest.fixture
@@ -96,11 +115,52 @@ def test_create_prompt_rejects_missing_required_fields(client):
 def test_api_requires_configured_token(client, monkeypatch):
     monkeypatch.delenv('AUTH_TOKEN', raising=False)
     monkeypatch.delenv('AUTH_SECRET', raising=False)
+    monkeypatch.delenv('API_TOKENS', raising=False)
+    monkeypatch.setattr(tokens, '_registry', tokens.load_token_registry())
     response = client.get('/api/prompts', headers=auth_headers(token='your_token_here'))
     assert response.status_code == 503
     assert response.json == {'error': 'Server authentication token is not configured'}
 
 
+@pytest.fixture
+def scoped_tokens(monkeypatch):
+    monkeypatch.setenv('API_TOKENS', ','.join([
+        f"reader:read:{tokens.hash_token('reader-secret')}",
+        f"limited:write:{tokens.hash_token('limited-secret')}:2",
+    ]))
+    monkeypatch.setattr(tokens, '_registry', tokens.load_token_registry())
+
+
+def test_read_token_cannot_write(client, scoped_tokens, created_prompt):
+    headers = auth_headers('reader-secret')
+    assert client.get(f'/api/prompt/{created_prompt.prompt_id}', headers=headers).status_code == 200
+    render = client.post(f'/api/prompt/{created_prompt.prompt_id}/render', json={'variables': {}}, headers=headers)
+    assert render.status_code == 200
+    response = client.delete(f'/api/prompt/{created_prompt.prompt_id}', headers=headers)
+    assert response.status_code == 403
+    assert Prompt.objects(prompt_id=created_prompt.prompt_id).count() == 1
+    # AUTH_TOKEN keeps full access alongside the scoped tokens.
+    assert client.get(f'/api/prompt/{created_prompt.prompt_id}', headers=auth_headers()).status_code == 200
+
+
+def test_token_quota_and_counters(client, scoped_tokens):
+    statuses = [client.get('/api/prompts?per_page=1', headers=auth_headers('limited-secret')).status_code
+                for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    assert client.get('/api/prompts', headers=auth_headers('unknown-secret')).status_code == 401
+
+    body = client.get('/metrics', headers=auth_headers()).get_data(as_text=True)
+    assert 'promptdoc_api_token_requests_total{token="limited",outcome="allowed"} 2' in body
+    assert 'promptdoc_api_token_requests_total{token="limited",outcome="throttled"} 1' in body
+
+
+@pytest.mark.parametrize('spec', ['reader:read', 'reader:admin:' + '0' * 64, 'reader:read:not-a-digest',
+                                  'reader:read:' + '0' * 64 + ':many'])
+def test_invalid_token_specs_are_rejected(spec):
+    with pytest.raises(ValueError):
+        tokens.parse_token_spec(spec)
+
+
 def test_update_prompt(client, created_prompt):
     updated_data = build_prompt_payload(
         content='Updated prompt content',
@@ -121,13 +181,95 @@ def test_update_prompt(client, created_prompt):
         headers=auth_headers(),
     )
     assert response.status_code == 200
-    assert response.json == {'message': 'Prompt updated successfully'}
-
     updated_prompt = Prompt.objects.get(prompt_id=created_prompt.prompt_id)
+    assert response.json == {
+        'message': 'Prompt updated successfully',
+        'updated_at': updated_prompt.updated_at.isoformat(),
+        # The content uses none of its declared variables.
+        'warnings': [f"Variable '{name}' does not appear in the content." for name in updated_data['variables']]
+        + [f"Example value '{name}' is not used by the content." for name in updated_data['example']],
+    }
     assert updated_prompt.content == updated_data['content']
     assert updated_prompt.variables == updated_data['variables']
 
 
+def test_update_prompt_checks_expected_version(client, created_prompt):
+    url = f'/api/prompt/{created_prompt.prompt_id}'
+    read_version = client.get(url, headers=auth_headers()).json['updated_at']
+
+    response = client.put(url, json={'content': 'First {{x}}', 'expected_updated_at': read_version},
+                          headers=auth_headers())
+    assert response.status_code == 200
+    assert response.json['updated_at'] == client.get(url, headers=auth_headers()).json['updated_at']
+
+    # A writer still holding the version it read does not overwrite the first edit.
+    response = client.put(url, json={'content': 'Second', 'expected_updated_at': read_version},
+                          headers=auth_headers())
+    assert response.status_code == 409
+    response = client.put(url, json={'content': 'Second'},
+                          headers={**auth_headers(), 'If-Unmodified-Since': 'Mon, 01 Jan 2001 00:00:00 GMT'})
+    assert response.status_code == 412
+    assert Prompt.objects.get(prompt_id=created_prompt.prompt_id).content == 'First {{x}}'
+
+    response = client.put(url, json={'content': 'Second', 'expected_updated_at': 'yesterday'}, headers=auth_headers())
+    assert response.status_code == 400
+    response = client.put('/api/prompt/test-missing', json={'content': 'x', 'expected_updated_at': read_version},
+                          headers=auth_headers())
+    assert response.status_code == 404
+
+
+def test_write_endpoints_accept_write_concern(client, created_prompt):
+    url = f'/api/prompt/{created_prompt.prompt_id}'
+    for params in ({'w': 'none'}, {'w': 0}, {'j': 'maybe'}, {'wtimeout': -1}):
+        response = client.put(url, query_string=params, json={'content': 'x'}, headers=auth_headers())
+        assert response.status_code == 400
+    response = client.post('/api/prompts:batchWrite', query_string={'w': 0}, headers=auth_headers(),
+                           json={'operations': [{'op': 'delete', 'prompt_id': created_prompt.prompt_id}]})
+    assert response.status_code == 400
+
+    response = client.put(url, query_string={'w': 1, 'j': 'false', 'wtimeout': 1000}, json={'content': 'Updated'},
+                          headers=auth_headers())
+    assert response.status_code == 200
+    response = client.post('/api/prompt', query_string={'w': 1}, json=build_prompt_payload(), headers=auth_headers())
+    assert response.status_code == 201
+
+
+def test_template_metadata_is_stored_on_write(client):
+    content = 'Hi {{ name }}, {{topic}} and {{name}}'
+    response = client.post('/api/prompt', json=build_prompt_payload(
+        content=content, variables=['name', 'unused'], example={'name': 'Ada'}), headers=auth_headers())
+    assert response.status_code == 201
+    assert response.json['warnings'] == [
+        "Placeholder 'topic' is not listed in variables.",
+        "Variable 'unused' does not appear in the content.",
+        "Example has no value for placeholder 'topic'.",
+    ]
+    prompt_id = response.json['prompt_id']
+
+    detail = client.get(f'/api/prompt/{prompt_id}', headers=auth_headers()).json
+    assert detail['placeholders'] == ['name', 'topic']
+    assert [content[start:end] for start, end in detail['segments']] == ['{{ name }}', '{{topic}}', '{{name}}']
+    assert detail['content_length'] == len(content)
+    assert detail['token_estimate'] == 10  # 37 characters, about four per token
+
+    response = client.put(f'/api/prompt/{prompt_id}', json={'content': '你好 {{name}}'}, headers=auth_headers())
+    assert 'warnings' in response.json
+    detail = client.get(f'/api/prompt/{prompt_id}', headers=auth_headers()).json
+    assert detail['placeholders'] == ['name']
+    assert detail['token_estimate'] == 2 + 3
+
+    listed = client.get('/api/prompts', query_string={'tag': TEST_MARKER_TAG, 'max_tokens': 5},
+                        headers=auth_headers()).json['data']
+    assert [item['prompt_id'] for item in listed] == [prompt_id]
+
+
+def test_analyze_prompts_backfills_metadata(created_prompt):
+    Prompt.objects(prompt_id=created_prompt.prompt_id).update(content='{{a}} b', unset__token_estimate=True)
+    assert catalog.analyze_prompts() >= 1
+    prompt = Prompt.objects.get(prompt_id=created_prompt.prompt_id)
+    assert (prompt.placeholders, prompt.segments, prompt.content_length) == (['a'], [[0, 5]], 7)
+
+
 def test_delete_prompt(client, created_prompt):
     response = client.delete(f'/api/prompt/{created_prompt.prompt_id}', headers=auth_headers())
     assert response.status_code == 200
@@ -174,6 +316,101 @@ def test_admin_edit_prompt_rejects_invalid_example(logged_in_client, created_pro
     assert 'Invalid example format' in response.get_data(as_text=True)
 
 
+def test_admin_edit_does_not_overwrite_newer_changes(logged_in_client, created_prompt):
+    url = f'/admin/prompt/{created_prompt.prompt_id}/edit'
+    page = logged_in_client.get(url).get_data(as_text=True)
+    read_version = Prompt.objects.get(prompt_id=created_prompt.prompt_id).updated_at.isoformat()
+    assert f'name="expected_updated_at" value="{read_version}"' in page
+    form = {
+        'content': 'Edited {{name}}',
+        'variables': 'name',
+        'example': '{"name": "Ada"}',
+        'tags': TEST_MARKER_TAG,
+        'expected_updated_at': read_version,
+    }
+
+    assert logged_in_client.post(url, data=form).status_code == 302
+    # Submitting the form loaded before that edit is refused.
+    response = logged_in_client.post(url, data={**form, 'content': 'Stale {{name}}'})
+    assert response.status_code == 409
+    assert Prompt.objects.get(prompt_id=created_prompt.prompt_id).content == 'Edited {{name}}'
+
+
+def test_admin_edit_form_round_trips_example_as_json(logged_in_client, created_prompt):
+    page = logged_in_client.get(f'/admin/prompt/{created_prompt.prompt_id}/edit').get_data(as_text=True)
+    # JSON, so saving the form unchanged takes the JSON path of parse_example.
+    example = page.split('name="example"', 1)[1].split('>', 1)[1].split('</textarea>', 1)[0]
+    assert json.loads(html.unescape(example)) == {'variable1': 'example1', 'variable2': 'example2'}
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('{"a": {"b": [1, 2]}}', {'a': {'b': [1, 2]}}),
+    ("{'a': 'single quoted', 'b': None}", {'a': 'single quoted', 'b': None}),
+])
+def test_parse_example_accepts_json_and_python_literals(text, expected):
+    assert payloads.parse_example(text) == expected
+
+
+@pytest.mark.parametrize('text', [
+    '[1, 2]',
+    '{"a": ' * 100 + '1' + '}' * 100,
+    "{'a': " * 100 + '1' + '}' * 100,
+    "{'a': {1, 2}}",
+    '{"a": "' + 'x' * 100 + '"}',
+    "{'a': __import__('os')}",
+])
+def test_parse_example_rejects_unsafe_input(text):
+    with pytest.raises(ValueError):
+        payloads.parse_example(text, max_length=90)
+
+
+def test_api_rejects_oversized_and_deeply_nested_bodies(client, monkeypatch):
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 1024)
+    response = client.post('/api/prompt', json=build_prompt_payload(content='x' * 2048), headers=auth_headers())
+    assert response.status_code == 413
+    assert response.json == {'error': 'Request payload too large'}
+    response = client.post('/api/prompts:batchGet', json={'prompt_ids': ['x' * 2048]}, headers=auth_headers())
+    assert response.status_code == 413
+
+    nested = '{"content": "x", "example": ' + '{"a": ' * 100 + '1' + '}' * 100 + '}'
+    response = client.post('/api/prompt', data=nested, content_type='application/json', headers=auth_headers())
+    assert response.status_code == 400
+
+    # The streamed import is bounded by MAX_IMPORT_LENGTH instead.
+    line = json.dumps({**build_prompt_payload(content='y' * 2048), 'prompt_id': f'test-{uuid.uuid4()}'})
+    response = client.post('/api/prompts:import', data=line + '\n', headers=auth_headers())
+    assert response.status_code == 200
+    assert response.json['upserted'] == 1
+
+
+def test_orjson_provider_matches_default_output():
+    pytest.importorskip('orjson')
+    value = {'b': [1, 2.5, None], 'a': 'é', 'when': datetime(2024, 1, 2, 3, 4, 5), 'big': 2 ** 64}
+    default_provider = payloads.BoundedJSONProvider(app)
+    orjson_provider = payloads.OrjsonProvider(app)
+    assert json.loads(orjson_provider.dumps(value)) == json.loads(default_provider.dumps(value))
+    with pytest.raises(ValueError):
+        orjson_provider.loads('[' * 100 + ']' * 100)
+
+
+@pytest.mark.parametrize('body', [
+    '{"big": 18446744073709551616, "negative": -9223372036854775809}',
+    '{"a": NaN, "b": Infinity, "c": -Infinity}',
+    '{"huge": 1e400}',
+])
+def test_json_providers_accept_the_same_bodies(body):
+    pytest.importorskip('orjson')
+    parsed = payloads.BoundedJSONProvider(app).loads(body)
+    assert repr(payloads.OrjsonProvider(app).loads(body)) == repr(parsed)
+    assert not payloads.USE_ORJSON or isinstance(app.json, payloads.OrjsonProvider)
+
+
+def test_admin_rejects_oversized_form_with_413(logged_in_client, monkeypatch):
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 1024)
+    response = logged_in_client.post('/admin/prompt/create', data={'content': 'x' * 4096, 'tags': TEST_MARKER_TAG})
+    assert response.status_code == 413
+
+
 def test_admin_preview_does_not_execute_template_expression(logged_in_client, created_prompt):
     created_prompt.update(
         content='Danger: {{7*7}} - {{variable1}}',
@@ -194,3 +431,883 @@ def test_admin_login_returns_503_when_secret_missing(client, monkeypatch):
     response = client.post('/admin/login', data={'auth_code': '123456'})
     assert response.status_code == 503
     assert 'Admin secret is not configured' in response.get_data(as_text=True)
+
+
+def test_get_prompt_list_cursor_pagination_walks_all_prompts(client):
+    created_ids = set()
+    for index in range(5):
+        prompt = Prompt(**build_prompt_payload(prompt_id=f"test-{uuid.uuid4()}", content=f'Cursor {index}'))
+        prompt.save()
+        created_ids.add(prompt.prompt_id)
+
+    seen_ids = []
+    cursor = ''
+    while True:
+        response = client.get(
+            '/api/prompts',
+            query_string={'cursor': cursor, 'per_page': 2, 'tag': TEST_MARKER_TAG},
+            headers=auth_headers(),
+        )
+        assert response.status_code == 200
+        pagination = response.json['pagination']
+        assert pagination['total_count'] is None
+        seen_ids.extend(item['prompt_id'] for item in response.json['data'])
+        if not pagination['has_more']:
+            assert pagination['next_cursor'] is None
+            break
+        cursor = pagination['next_cursor']
+
+    assert len(seen_ids) == len(set(seen_ids))
+    assert set(seen_ids) == created_ids
+
+
+def test_get_prompt_list_cursor_include_total(client, created_prompt):
+    response = client.get(
+        '/api/prompts?cursor=&include_total=true&tag=' + TEST_MARKER_TAG,
+        headers=auth_headers(),
+    )
+    assert response.status_code == 200
+    assert response.json['pagination']['total_count'] == 1
+
+
+def test_get_prompt_list_rejects_invalid_cursor(client):
+    response = client.get('/api/prompts?cursor=not-a-cursor', headers=auth_headers())
+    assert response.status_code == 400
+    assert "Invalid 'cursor' parameter" in response.json['error']
+
+
+def test_declared_indexes_are_created():
+    ensure_indexes()
+    for result in check_indexes().values():
+        assert result['missing'] == []
+
+
+def test_no_declared_index_is_a_prefix_of_another():
+    specs = [tuple(spec['fields']) for spec in Prompt._meta['index_specs']]
+    for spec in specs:
+        assert not any(other != spec and other[:len(spec)] == spec for other in specs), spec
+
+
+def test_drop_extra_indexes_removes_superseded_index():
+    ensure_indexes()
+    collection = Prompt._get_collection()
+    collection.create_index([('created_at', -1), ('prompt_id', -1)])
+    assert [('created_at', -1), ('prompt_id', -1)] in check_indexes()['prompts']['extra']
+
+    assert [('created_at', -1), ('prompt_id', -1)] in drop_extra_indexes()['prompts']
+    assert check_indexes()['prompts'] == {'missing': [], 'extra': []}
+
+
+def test_get_prompt_list_text_search_matches_tags_and_variables(client):
+    keyword = f"kw{uuid.uuid4().hex[:12]}"
+    by_tag = Prompt(**build_prompt_payload(prompt_id=f"test-{uuid.uuid4()}", tags=[keyword, TEST_MARKER_TAG]))
+    by_tag.save()
+    by_variable = Prompt(**build_prompt_payload(prompt_id=f"test-{uuid.uuid4()}", variables=[keyword]))
+    by_variable.save()
+    Prompt(**build_prompt_payload(prompt_id=f"test-{uuid.uuid4()}")).save()
+
+    response = client.get(f'/api/prompts?search={keyword}', headers=auth_headers())
+    assert response.status_code == 200
+    returned_ids = [item['prompt_id'] for item in response.json['data']]
+    assert returned_ids[0] == by_tag.prompt_id
+    assert set(returned_ids) == {by_tag.prompt_id, by_variable.prompt_id}
+
+
+def test_get_prompt_list_substring_search(client, created_prompt):
+    response = client.get(
+        '/api/prompts?search_mode=substring&search=PROMPT CONT&tag=' + TEST_MARKER_TAG,
+        headers=auth_headers(),
+    )
+    assert response.status_code == 200
+    assert [item['prompt_id'] for item in response.json['data']] == [created_prompt.prompt_id]
+
+
+def test_get_prompt_list_rejects_invalid_search_mode(client):
+    response = client.get('/api/prompts?search=x&search_mode=fuzzy', headers=auth_headers())
+    assert response.status_code == 400
+    assert "Invalid 'search_mode' parameter" in response.json['error']
+
+
+def test_prompt_changes_resume_after_cursor_and_report_deletions(client, monkeypatch):
+    monkeypatch.setattr(changes, 'CHANGES_SETTLE_SECONDS', 0)
+
+    def poll(cursor=None):
+        response = client.get('/api/prompts:changes', query_string={'cursor': cursor or '', 'per_page': 500},
+                              headers=auth_headers())
+        assert response.status_code == 200
+        return response.json
+
+    cursor = poll()['next_cursor']
+    kept = Prompt(**build_prompt_payload(prompt_id=f"test-{uuid.uuid4()}"))
+    kept.save()
+    removed = Prompt(**build_prompt_payload(prompt_id=f"test-{uuid.uuid4()}"))
+    removed.save()
+    assert client.delete(f'/api/prompt/{removed.prompt_id}', headers=auth_headers()).status_code == 200
+
+    page = poll(cursor)
+    assert [item['prompt_id'] for item in page['data']] == [kept.prompt_id]
+    assert [item['prompt_id'] for item in page['deleted']] == [removed.prompt_id]
+    assert page['data'][0]['content'] == 'Test prompt content'
+    assert poll(page['next_cursor']) == {'data': [], 'deleted': [], 'next_cursor': page['next_cursor'],
+                                            'has_more': False}
+
+
+def test_prompt_changes_resume_behind_cursor_for_late_writes(client, monkeypatch):
+    monkeypatch.setattr(changes, 'CHANGES_SETTLE_SECONDS', 0)
+
+    def read_all(cursor=None):
+        seen = []
+        while True:
+            page = client.get('/api/prompts:changes', query_string={'cursor': cursor or '', 'per_page': 1},
+                              headers=auth_headers()).json
+            seen.extend(item['prompt_id'] for item in page['data'])
+            cursor = page['next_cursor'] or cursor
+            if not page['has_more']:
+                return seen, cursor
+
+    # A client supplied updated_at does not move the prompt behind the replicas.
+    response = client.post('/api/prompt', json=build_prompt_payload(updated_at='2001-01-01T00:00:00'),
+                           headers=auth_headers())
+    latest = Prompt.objects.get(prompt_id=response.json['prompt_id'])
+    assert latest.updated_at > datetime.now() - timedelta(minutes=1)
+    _, cursor = read_all()
+
+    # Stamped before the latest write but visible only now, as a slow concurrent write would be.
+    late = Prompt(**build_prompt_payload(prompt_id=f"test-{uuid.uuid4()}"))
+    late.save()
+    Prompt.objects(prompt_id=late.prompt_id).update(set__updated_at=latest.updated_at - timedelta(seconds=1))
+    assert read_all(cursor)[0] == []
+
+    monkeypatch.setattr(changes, 'CHANGES_SETTLE_SECONDS', 5)
+    seen, next_cursor = read_all(cursor)
+    # Paging with per_page=1 moves forward although every page start is recent.
+    assert seen == [late.prompt_id, latest.prompt_id]
+    assert changes.decode_change_cursor(next_cursor)[0] == changes.decode_change_cursor(cursor)[0]
+
+
+def test_prompt_changes_report_prompts_restored_after_deletion(client):
+    response = client.post('/api/prompt', json=build_prompt_payload(), headers=auth_headers())
+    prompt_id = response.json['prompt_id']
+    exported = next(line for line in client.get('/api/prompts:export', headers=auth_headers()).get_data(as_text=True)
+                    .splitlines() if json.loads(line)['prompt_id'] == prompt_id)
+    assert client.delete(f'/api/prompt/{prompt_id}', headers=auth_headers()).status_code == 200
+
+    response = client.post('/api/prompts:import', data=exported + '\n', headers=auth_headers())
+    assert response.json['upserted'] == 1
+    page = client.get('/api/prompts:changes', query_string={'per_page': 500}, headers=auth_headers()).json
+    assert prompt_id in [item['prompt_id'] for item in page['data']]
+    assert prompt_id not in [item['prompt_id'] for item in page['deleted']]
+
+
+def test_change_cursor_orders_writes_before_deletions():
+    position, continuation = changes.decode_change_cursor(changes.encode_change_cursor(datetime(2024, 1, 1), 'b', 0))
+    assert (position, continuation) == ((datetime(2024, 1, 1), 'b', 0), False)
+    assert changes.decode_change_cursor(changes.encode_change_cursor(*position, continuation=True))[1] is True
+    same_time = changes.after_position('deleted_at', position, changes.KIND_DELETED)['$or'][1]
+    assert same_time['prompt_id'] == {'$gte': 'b'}
+    same_time = changes.after_position('updated_at', position, changes.KIND_WRITTEN)['$or'][1]
+    assert same_time['prompt_id'] == {'$gt': 'b'}
+    with pytest.raises(ValueError):
+        changes.decode_change_cursor('not-a-cursor')
+
+
+def test_get_prompt_list_combines_tag_and_field_filters(client):
+    tag_a, tag_b = f"facet-{uuid.uuid4().hex[:8]}", f"facet-{uuid.uuid4().hex[:8]}"
+    both = Prompt(**build_prompt_payload(prompt_id=f"test-{uuid.uuid4()}", tags=[tag_a, tag_b, TEST_MARKER_TAG]))
+    both.save()
+    only_a = Prompt(**build_prompt_payload(prompt_id=f"test-{uuid.uuid4()}", tags=[tag_a, TEST_MARKER_TAG],
+                                           applicable_llm='LLM2', version='2'))
+    only_a.save()
+
+    def listed_ids(**params):
+        response = client.get('/api/prompts', query_string=params, headers=auth_headers())
+        assert response.status_code == 200
+        return {item['prompt_id'] for item in response.json['data']}
+
+    assert listed_ids(tags=f'{tag_a},{tag_b}') == {both.prompt_id, only_a.prompt_id}
+    assert listed_ids(tags=f'{tag_a},{tag_b}', tag_mode='all') == {both.prompt_id}
+    assert listed_ids(tags=tag_a, applicable_llm='LLM2') == {only_a.prompt_id}
+    assert listed_ids(tags=tag_a, applicable_llm='LLM1,LLM2', version='1') == {both.prompt_id}
+
+
+def test_get_prompt_list_filters_date_ranges(client, created_prompt):
+    created_at = Prompt.objects.get(prompt_id=created_prompt.prompt_id).created_at
+
+    def listed_ids(**params):
+        response = client.get('/api/prompts', query_string={'tag': TEST_MARKER_TAG, **params}, headers=auth_headers())
+        assert response.status_code == 200
+        return [item['prompt_id'] for item in response.json['data']]
+
+    assert listed_ids(created_after=created_at.isoformat()) == [created_prompt.prompt_id]
+    assert listed_ids(created_before=created_at.isoformat()) == []
+    assert listed_ids(updated_before=(created_at + timedelta(days=1)).date().isoformat()) == [created_prompt.prompt_id]
+
+
+@pytest.mark.parametrize('params, message', [
+    ({'created_after': 'yesterday'}, "Invalid 'created_after' parameter"),
+    ({'tags': 'a,b', 'tag_mode': 'some'}, "Invalid 'tag_mode' parameter"),
+])
+def test_get_prompt_list_rejects_invalid_filters(client, params, message):
+    response = client.get('/api/prompts', query_string=params, headers=auth_headers())
+    assert response.status_code == 400
+    assert message in response.json['error']
+
+
+def test_summarize_plan_reports_index_use():
+    plan = summarize_plan({
+        'queryPlanner': {'winningPlan': {'queryPlan': {
+            'stage': 'LIMIT',
+            'inputStage': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': 'tags_1_created_at_-1'}},
+        }}},
+        'executionStats': {'totalKeysExamined': 3, 'totalDocsExamined': 3, 'nReturned': 3},
+    })
+    assert plan['stages'] == ['LIMIT', 'FETCH', 'IXSCAN']
+    assert plan['indexes'] == ['tags_1_created_at_-1']
+    assert plan['collection_scan'] is False and plan['in_memory_sort'] is False
+    assert plan['docs_examined'] == 3
+
+    assert summarize_plan({'queryPlanner': {'winningPlan': {'stage': 'SORT', 'inputStage': {'stage': 'COLLSCAN'}}}})[
+        'collection_scan'] is True
+
+
+def test_get_prompt_list_explain_uses_compound_index(client, created_prompt):
+    ensure_indexes()
+    response = client.get('/api/prompts', query_string={'tags': TEST_MARKER_TAG, 'explain': 'true'},
+                          headers=auth_headers())
+    assert response.status_code == 200
+    plan = response.json['explain']
+    assert plan['collection_scan'] is False
+    assert plan['in_memory_sort'] is False
+    assert any(index.startswith('tags_1') for index in plan['indexes'])
+
+
+def test_render_prompt(client, created_prompt):
+    created_prompt.update(content='Hello {{ name }}, data: {{data}} {{missing}}')
+    response = client.post(
+        f'/api/prompt/{created_prompt.prompt_id}/render',
+        json={'variables': {'name': 'Ada', 'data': {'k': 1}}},
+        headers=auth_headers(),
+    )
+    assert response.status_code == 200
+    assert response.json['content'] == 'Hello Ada, data: {"k": 1} {{missing}}'
+    assert response.json['missing_variables'] == ['missing']
+
+
+def test_render_prompt_strict_rejects_missing_variables(client, created_prompt):
+    created_prompt.update(content='Hello {{name}}')
+    response = client.post(
+        f'/api/prompt/{created_prompt.prompt_id}/render',
+        json={'variables': {}, 'strict': True},
+        headers=auth_headers(),
+    )
+    assert response.status_code == 400
+    assert response.json['missing_variables'] == ['name']
+
+
+def test_render_prompt_not_found(client):
+    response = client.post('/api/prompt/does-not-exist/render', json={'variables': {}}, headers=auth_headers())
+    assert response.status_code == 404
+
+
+def test_batch_render_prompts(client, created_prompt):
+    created_prompt.update(content='Hi {{name}}')
+    response = client.post(
+        '/api/prompts:batchRender',
+        json={'items': [
+            {'prompt_id': created_prompt.prompt_id, 'variables': {'name': 'A'}},
+            {'prompt_id': 'does-not-exist', 'variables': {}},
+            {'prompt_id': created_prompt.prompt_id, 'variables': {'name': 'B'}},
+        ]},
+        headers=auth_headers(),
+    )
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [result.get('content') for result in results] == ['Hi A', None, 'Hi B']
+    assert results[1]['error'] == 'Prompt not found'
+
+
+def test_get_prompt_detail_is_cached_and_invalidated_on_update(client, created_prompt):
+    prompt_cache.clear()
+    url = f'/api/prompt/{created_prompt.prompt_id}'
+    assert client.get(url, headers=auth_headers()).json['content'] == 'Test prompt content'
+    hits_before = prompt_cache.stats()['hits']
+    assert client.get(url, headers=auth_headers()).status_code == 200
+    assert prompt_cache.stats()['hits'] == hits_before + 1
+
+    response = client.put(url, json={'content': 'Changed'}, headers=auth_headers())
+    assert response.status_code == 200
+    assert client.get(url, headers=auth_headers()).json['content'] == 'Changed'
+
+
+def test_delete_prompt_invalidates_cached_detail(client, created_prompt):
+    url = f'/api/prompt/{created_prompt.prompt_id}'
+    assert client.get(url, headers=auth_headers()).status_code == 200
+    assert client.delete(url, headers=auth_headers()).status_code == 200
+    assert client.get(url, headers=auth_headers()).status_code == 404
+
+
+def test_change_watcher_dispatches_prompt_ids():
+    seen = []
+    watcher = PromptChangeWatcher(listeners=[seen.append])
+    watcher.handle_change({'operationType': 'update', 'fullDocument': {'prompt_id': 'p1'}})
+    watcher.handle_change({'operationType': 'delete', 'documentKey': {'_id': 'x'}})
+    assert seen == ['p1', None]
+
+
+def test_change_watcher_evicts_prompts_edited_elsewhere(created_prompt):
+    try:
+        is_replica_set = bool(Prompt._get_collection().database.client.admin.command('hello').get('setName'))
+    except Exception:
+        is_replica_set = False
+    if not is_replica_set:
+        pytest.skip('change streams require a replica set')
+
+    prompt_cache.set(created_prompt.prompt_id, {'content': 'stale'})
+    watcher = PromptChangeWatcher(max_await_time_ms=100)
+    watcher.start()
+    try:
+        assert watcher.ready.wait(10)
+        # Bypass the API so only the change stream can evict the entry.
+        Prompt._get_collection().update_one(
+            {'prompt_id': created_prompt.prompt_id}, {'$set': {'content': 'fresh'}}
+        )
+        deadline = time.monotonic() + 10
+        while prompt_cache.get(created_prompt.prompt_id) is not None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert prompt_cache.get(created_prompt.prompt_id) is None
+    finally:
+        watcher.stop()
+        watcher.join(5)
+
+
+def test_get_prompt_detail_conditional_request(client, created_prompt):
+    url = f'/api/prompt/{created_prompt.prompt_id}'
+    response = client.get(url, headers=auth_headers())
+    etag = response.headers['ETag']
+    assert response.headers.get('Last-Modified')
+
+    prompt_cache.clear()
+    response = client.get(url, headers={**auth_headers(), 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    client.put(url, json={'content': 'Changed'}, headers=auth_headers())
+    response = client.get(url, headers={**auth_headers(), 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_get_prompt_list_conditional_request(client, created_prompt):
+    url = f'/api/prompts?tag={TEST_MARKER_TAG}'
+    etag = client.get(url, headers=auth_headers()).headers['ETag']
+    response = client.get(url, headers={**auth_headers(), 'If-None-Match': etag})
+    assert response.status_code == 304
+
+    client.put(f'/api/prompt/{created_prompt.prompt_id}', json={'version': '2'}, headers=auth_headers())
+    response = client.get(url, headers={**auth_headers(), 'If-None-Match': etag})
+    assert response.status_code == 200
+
+
+def test_batch_get_prompts(client, created_prompt):
+    response = client.post(
+        '/api/prompts:batchGet',
+        json={'prompt_ids': ['does-not-exist', created_prompt.prompt_id]},
+        headers=auth_headers(),
+    )
+    assert response.status_code == 200
+    assert [item['prompt_id'] for item in response.json['data']] == [created_prompt.prompt_id]
+    assert response.json['missing'] == ['does-not-exist']
+
+
+def test_batch_write_prompts_reports_per_item_results(client, created_prompt):
+    other = Prompt(**build_prompt_payload(prompt_id=f"test-{uuid.uuid4()}"))
+    other.save()
+
+    response = client.post(
+        '/api/prompts:batchWrite',
+        json={'operations': [
+            {'op': 'create', 'prompt': build_prompt_payload()},
+            {'op': 'create', 'prompt': {'content': 'missing required'}},
+            {'op': 'update', 'prompt_id': created_prompt.prompt_id, 'prompt': {'content': 'Batch updated'}},
+            {'op': 'delete', 'prompt_id': other.prompt_id},
+            {'op': 'delete', 'prompt_id': 'does-not-exist'},
+            {'op': 'rename'},
+        ]},
+        headers=auth_headers(),
+    )
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [result['status'] for result in results] == ['created', 'error', 'updated', 'deleted', 'error', 'error']
+    assert results[4]['error'] == 'Prompt not found'
+
+    assert Prompt.objects(prompt_id=results[0]['prompt_id']).count() == 1
+    assert Prompt.objects.get(prompt_id=created_prompt.prompt_id).content == 'Batch updated'
+    assert Prompt.objects(prompt_id=other.prompt_id).count() == 0
+
+
+def test_batch_write_reports_prompts_changed_after_the_existence_check(client, monkeypatch):
+    llm = f'facet-{uuid.uuid4().hex}'
+    prompt_ids = []
+    for _ in range(4):
+        response = client.post('/api/prompt', json=build_prompt_payload(applicable_llm=llm), headers=auth_headers())
+        prompt_ids.append(response.get_json()['prompt_id'])
+    modified, removed, deleted_elsewhere, untouched = prompt_ids
+    write_collection = batch_routes.write_collection
+
+    class ConcurrentRequests:
+        """Writes of other requests landing between the existence check and the bulk write."""
+        def __init__(self, collection):
+            self.collection = collection
+
+        def bulk_write(self, operations, **kwargs):
+            edit = {'updated_at': writes.stored_now() + timedelta(seconds=1)}
+            previous, current = writes.update_prompt_document(modified, edit)
+            events.prompts_written([current], previous=[previous])
+            events.prompts_deleted([writes.delete_prompt_document(removed)])
+            events.prompts_deleted([writes.delete_prompt_document(deleted_elsewhere)])
+            return self.collection.bulk_write(operations, **kwargs)
+
+    monkeypatch.setattr(batch_routes, 'write_collection', lambda document, write_concern=None: ConcurrentRequests(
+        write_collection(document, write_concern)))
+    response = client.post('/api/prompts:batchWrite', headers=auth_headers(), json={'operations': [
+        {'op': 'update', 'prompt_id': modified, 'prompt': {'content': 'Lost update'}},
+        {'op': 'update', 'prompt_id': removed, 'prompt': {'content': 'Lost update'}},
+        {'op': 'delete', 'prompt_id': deleted_elsewhere},
+        {'op': 'update', 'prompt_id': untouched, 'prompt': {'content': 'Batch updated'}},
+    ]})
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [result['status'] for result in results] == ['error', 'error', 'error', 'updated']
+    assert [result.get('error') for result in results[:3]] == [
+        'Prompt was modified concurrently', 'Prompt not found', 'Prompt not found']
+    assert Prompt.objects.get(prompt_id=modified).content == 'Test prompt content'
+    assert Prompt.objects.get(prompt_id=untouched).content == 'Batch updated'
+    # Each deletion was counted once, by the request that made it.
+    assert facet_count(client, 'applicable_llm', llm) == 2
+
+
+def test_batch_write_reports_a_deleted_prompt_modified_concurrently(client, created_prompt, monkeypatch):
+    write_collection = batch_routes.write_collection
+
+    class ConcurrentUpdate:
+        def __init__(self, collection):
+            self.collection = collection
+
+        def bulk_write(self, operations, **kwargs):
+            edit = {'content': 'Concurrent edit', 'updated_at': writes.stored_now() + timedelta(seconds=1)}
+            writes.update_prompt_document(created_prompt.prompt_id, edit)
+            return self.collection.bulk_write(operations, **kwargs)
+
+    monkeypatch.setattr(batch_routes, 'write_collection', lambda document, write_concern=None: ConcurrentUpdate(
+        write_collection(document, write_concern)))
+    response = client.post('/api/prompts:batchWrite', headers=auth_headers(), json={'operations': [
+        {'op': 'delete', 'prompt_id': created_prompt.prompt_id},
+    ]})
+    assert response.json['results'][0]['error'] == 'Prompt was modified concurrently'
+    assert Prompt.objects.get(prompt_id=created_prompt.prompt_id).content == 'Concurrent edit'
+    assert not PromptTombstone.objects(prompt_id=created_prompt.prompt_id)
+
+
+def test_batch_write_rejects_oversized_batch(client):
+    operations = [{'op': 'delete', 'prompt_id': str(index)} for index in range(501)]
+    response = client.post('/api/prompts:batchWrite', json={'operations': operations}, headers=auth_headers())
+    assert response.status_code == 400
+
+
+def test_export_and_import_prompts_roundtrip(client, created_prompt):
+    response = client.get('/api/prompts:export', headers=auth_headers())
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    exported = next(line for line in lines if line['prompt_id'] == created_prompt.prompt_id)
+    assert exported['content'] == created_prompt.content
+    assert '_id' not in exported
+
+    imported_id = f"test-{uuid.uuid4()}"
+    body = '\n'.join([
+        json.dumps({**exported, 'content': 'Imported update'}),
+        json.dumps({**exported, 'prompt_id': imported_id}),
+        '{not json',
+        json.dumps({'content': 'no prompt id'}),
+    ])
+    response = client.post('/api/prompts:import', data=body, headers=auth_headers())
+    assert response.status_code == 200
+    assert response.json['processed'] == 4
+    assert response.json['upserted'] == 1
+    assert response.json['updated'] == 1
+    assert [error['line'] for error in response.json['errors']] == [3, 4]
+
+    assert Prompt.objects.get(prompt_id=created_prompt.prompt_id).content == 'Imported update'
+    assert Prompt.objects(prompt_id=imported_id).count() == 1
+
+
+def test_update_prompt_records_revisions(client):
+    response = client.post('/api/prompt', json=build_prompt_payload(content='First'), headers=auth_headers())
+    prompt_id = response.json['prompt_id']
+    client.put(f'/api/prompt/{prompt_id}', json={'content': 'Second', 'version': '2'}, headers=auth_headers())
+
+    response = client.get(f'/api/prompt/{prompt_id}/revisions', headers=auth_headers())
+    assert response.status_code == 200
+    revisions = response.json['data']
+    assert [revision['version'] for revision in revisions] == ['2', '1']
+
+    response = client.get(f"/api/prompt/{prompt_id}/revisions/{revisions[1]['revision_id']}", headers=auth_headers())
+    assert response.status_code == 200
+    assert response.json['content'] == 'First'
+
+
+def test_get_prompt_revision_reports_failures_as_json(client, monkeypatch):
+    response = client.post('/api/prompt', json=build_prompt_payload(), headers=auth_headers())
+    prompt_id = response.json['prompt_id']
+    revisions = client.get(f'/api/prompt/{prompt_id}/revisions', headers=auth_headers()).json['data']
+    revision_id = revisions[0]['revision_id']
+
+    def corrupt_snapshot(revision):
+        raise ValueError('corrupt snapshot')
+
+    monkeypatch.setattr(api_routes, 'load_snapshot', corrupt_snapshot)
+    response = client.get(f'/api/prompt/{prompt_id}/revisions/{revision_id}', headers=auth_headers())
+    assert response.status_code == 500
+    assert response.json == {'error': 'Failed to retrieve prompt revision'}
+
+
+def test_get_latest_prompt_compares_versions_naturally(client):
+    family = f"test-family-{uuid.uuid4()}"
+    for version, llm in (('1.9', 'LLM1'), ('1.10', 'LLM1'), ('2.0', 'LLM2')):
+        Prompt(**build_prompt_payload(prompt_id=f"test-{uuid.uuid4()}", family=family,
+                                      version=version, applicable_llm=llm)).save()
+
+    response = client.get(f'/api/prompt/{family}/latest?applicable_llm=LLM1', headers=auth_headers())
+    assert response.status_code == 200
+    assert response.json['version'] == '1.10'
+    response = client.get(f'/api/prompt/{family}/latest', headers=auth_headers())
+    assert response.json['version'] == '2.0'
+    response = client.get(f'/api/prompt/{family}/latest?applicable_llm=LLM3', headers=auth_headers())
+    assert response.status_code == 404
+
+
+def test_get_prompt_list_fields_projection(client, created_prompt):
+    response = client.get(f'/api/prompts?fields=prompt_id,tags&tag={TEST_MARKER_TAG}', headers=auth_headers())
+    assert response.status_code == 200
+    assert response.json['data'] == [{'prompt_id': created_prompt.prompt_id, 'tags': created_prompt.tags}]
+
+
+def test_get_prompt_list_rejects_unknown_fields(client):
+    response = client.get('/api/prompts?fields=prompt_id,secret', headers=auth_headers())
+    assert response.status_code == 400
+    assert "Invalid 'fields' parameter" in response.json['error']
+
+
+def test_prompt_serializer_matches_schema(created_prompt):
+    row = Prompt.objects(prompt_id=created_prompt.prompt_id).as_pymongo().first()
+    prompt = Prompt.objects.get(prompt_id=created_prompt.prompt_id)
+    assert prompt_serializer(row) == PromptSchema().dump(prompt)
+
+
+def test_large_prompt_bodies_are_stored_as_blobs(client, monkeypatch):
+    monkeypatch.setattr(storage, 'PROMPT_BLOB_THRESHOLD', 64)
+    content = 'Few-shot {{question}} ' + 'x' * 500
+    example = {'question': 'y' * 500}
+    response = client.post('/api/prompt', json=build_prompt_payload(content=content, example=example),
+                           headers=auth_headers())
+    prompt_id = response.json['prompt_id']
+
+    row = Prompt.objects(prompt_id=prompt_id).as_pymongo().first()
+    assert len(row['content']) < len(content)
+    assert row['example'] == {}
+    blob_ids = [row['content_blob'], row['example_blob']]
+    assert PromptBlob.objects(id__in=blob_ids).count() == 2
+
+    listed = client.get(f'/api/prompts?tag={TEST_MARKER_TAG}', headers=auth_headers()).json['data']
+    assert next(item for item in listed if item['prompt_id'] == prompt_id)['content_truncated'] is True
+
+    detail = client.get(f'/api/prompt/{prompt_id}', headers=auth_headers()).json
+    assert detail['content'] == content
+    assert detail['example'] == example
+    assert 'content_blob' not in detail
+
+    rendered = client.post(f'/api/prompt/{prompt_id}/render', json={'variables': {'question': 'Q'}},
+                           headers=auth_headers()).json
+    assert rendered['content'] == content.replace('{{question}}', 'Q')
+
+    client.put(f'/api/prompt/{prompt_id}', json={'content': 'short'}, headers=auth_headers())
+    row = Prompt.objects(prompt_id=prompt_id).as_pymongo().first()
+    assert row['content'] == 'short'
+    assert not row.get('content_blob')
+    assert client.get(f'/api/prompt/{prompt_id}', headers=auth_headers()).json['example'] == example
+    PromptBlob.objects(id__in=blob_ids).delete()
+
+
+def test_updates_replace_packed_bodies_after_packing_is_turned_off(client, monkeypatch):
+    monkeypatch.setattr(storage, 'PROMPT_BLOB_THRESHOLD', 10)
+    payload = build_prompt_payload(content='Packed {{question}} ' + 'x' * 100, example={'question': 'y' * 100})
+    prompt_id = client.post('/api/prompt', json=payload, headers=auth_headers()).json['prompt_id']
+    blob_ids = Prompt.objects(prompt_id=prompt_id).only('content_blob', 'example_blob').as_pymongo().first()
+
+    monkeypatch.setattr(storage, 'PROMPT_BLOB_THRESHOLD', 0)
+    client.put(f'/api/prompt/{prompt_id}', json={'content': 'Inline {{question}}', 'example': {'question': 'Q'}},
+               headers=auth_headers())
+    row = Prompt.objects(prompt_id=prompt_id).as_pymongo().first()
+    assert not row.get('content_blob') and not row.get('example_blob') and not row.get('search_text')
+    detail = client.get(f'/api/prompt/{prompt_id}', headers=auth_headers()).json
+    assert (detail['content'], detail['example']) == ('Inline {{question}}', {'question': 'Q'})
+    rendered = client.post(f'/api/prompt/{prompt_id}/render', json={'variables': {'question': 'Q'}},
+                           headers=auth_headers()).json
+    assert rendered['content'] == 'Inline Q'
+    PromptBlob.objects(id__in=[blob_ids['content_blob'], blob_ids['example_blob']]).delete()
+
+
+def test_packed_prompt_bodies_stay_searchable(client, monkeypatch):
+    monkeypatch.setattr(storage, 'PROMPT_BLOB_THRESHOLD', 64)
+    word = uuid.uuid4().hex
+    content = 'Repeated filler words. ' * 50 + f'Needle{word} at the end'
+    response = client.post('/api/prompt', json=build_prompt_payload(content=content), headers=auth_headers())
+    prompt_id = response.json['prompt_id']
+    row = Prompt.objects(prompt_id=prompt_id).as_pymongo().first()
+    assert word not in row['content']
+    # Only the distinct words are kept next to the summary, not a second copy of the body.
+    assert row['search_text'] == f'repeated filler words needle{word} at the end'
+
+    response = client.get(f'/api/prompts?search_mode=substring&search=NEEDLE{word}', headers=auth_headers())
+    assert [item['prompt_id'] for item in response.json['data']] == [prompt_id]
+    assert 'search_text' not in client.get(f'/api/prompt/{prompt_id}', headers=auth_headers()).json
+    feed, _ = changes.list_changes(None, 10000)
+    assert any(prompt_id == change[1] for change in feed)
+    assert all('search_text' not in row for *_, row in feed)
+
+    # Prompts packed before search_text existed get it from analyze.
+    Prompt._get_collection().update_one({'prompt_id': prompt_id}, {'$unset': {'search_text': 1}})
+    catalog.analyze_prompts()
+    assert Prompt.objects(prompt_id=prompt_id).as_pymongo().first()['search_text'] == row['search_text']
+
+    client.put(f'/api/prompt/{prompt_id}', json={'content': 'short'}, headers=auth_headers())
+    assert Prompt.objects(prompt_id=prompt_id).as_pymongo().first()['search_text'] is None
+    PromptBlob.objects(id=row['content_blob']).delete()
+
+
+def test_metrics_endpoint_requires_auth(client):
+    response = client.get('/metrics')
+    assert response.status_code == 401
+
+
+def test_metrics_endpoint_reports_requests_and_caches(client, created_prompt):
+    client.get(f'/api/prompt/{created_prompt.prompt_id}', headers=auth_headers())
+
+    response = client.get('/metrics', headers=auth_headers())
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert 'promptdoc_http_request_duration_seconds_count{endpoint="/api/prompt/<prompt_id>",method="GET"}' in body
+    assert 'promptdoc_serialization_duration_seconds_bucket{endpoint="/api/prompt/<prompt_id>",le="+Inf"}' in body
+    assert 'promptdoc_cache_hits_total{cache="prompt"}' in body
+
+
+def test_server_timing_header_is_optional(client, created_prompt, monkeypatch):
+    response = client.get(f'/api/prompt/{created_prompt.prompt_id}', headers=auth_headers())
+    assert 'Server-Timing' not in response.headers
+
+    monkeypatch.setitem(app.config, 'SERVER_TIMING', True)
+    response = client.get(f'/api/prompt/{created_prompt.prompt_id}', headers=auth_headers())
+    server_timing = response.headers['Server-Timing']
+    assert server_timing.startswith('db;dur=')
+    assert 'auth;dur=' in server_timing
+    assert 'total;dur=' in server_timing
+
+
+def test_command_timer_counts_round_trips_of_current_request():
+    class Event:
+        command_name = 'find'
+        duration_micros = 1500
+
+    metrics.start_request()
+    try:
+        metrics.CommandTimer().succeeded(Event())
+        metrics.CommandTimer().succeeded(Event())
+        timings = metrics.current_timings()
+        assert timings['db_count'] == 2
+        assert timings['db'] == pytest.approx(0.003)
+    finally:
+        metrics._local.timings = None
+
+
+def call_asgi(asgi_app, method, path, headers=None, body=b'', query_string=b'', messages=None):
+    messages = messages or [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': query_string,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in (headers or {}).items()],
+    }
+    asyncio.run(asgi_app(scope, receive, send))
+    start = sent[0]
+    response_headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in start['headers']}
+    response_body = b''.join(message.get('body', b'') for message in sent[1:])
+    return start['status'], response_headers, response_body
+
+
+def test_asgi_read_endpoints_check_auth_and_arguments():
+    status, _, body = call_asgi(asgi.app, 'GET', '/api/prompts')
+    assert status == 401
+    assert json.loads(body) == {'error': 'Unauthorized'}
+
+    status, headers, body = call_asgi(asgi.app, 'GET', '/api/prompts', headers=auth_headers(),
+                                      query_string=b'per_page=0')
+    assert status == 400
+    assert headers['content-type'] == 'application/json'
+    assert json.loads(body) == {'error': "Invalid 'per_page' parameter: must be greater than 0."}
+
+
+def test_asgi_falls_back_to_flask_for_other_routes():
+    payload = json.dumps(build_prompt_payload()).encode('utf-8')
+    status, _, body = call_asgi(asgi.app, 'POST', '/api/prompt',
+                                headers={**auth_headers(), 'Content-Type': 'application/json'}, body=payload)
+    assert status == 201
+    prompt_id = json.loads(body)['prompt_id']
+    assert Prompt.objects(prompt_id=prompt_id).count() == 1
+
+    status, _, body = call_asgi(asgi.app, 'GET', f'/api/prompt/{prompt_id}/revisions', headers=auth_headers())
+    assert status == 200
+    assert len(json.loads(body)['data']) == 1
+
+
+def test_asgi_streams_request_bodies_to_flask(monkeypatch):
+    monkeypatch.setitem(app.config, 'MAX_IMPORT_LENGTH', None)
+    lines = [json.dumps(build_prompt_payload(prompt_id=f'test-{uuid.uuid4()}')).encode('utf-8') + b'\n'
+             for _ in range(3)]
+    # Chunked upload without a Content-Length, split in the middle of a line.
+    body = b''.join(lines)
+    messages = [{'type': 'http.request', 'body': body[start:start + 50], 'more_body': start + 50 < len(body)}
+                for start in range(0, len(body), 50)]
+    status, _, response_body = call_asgi(asgi.app, 'POST', '/api/prompts:import', headers=auth_headers(),
+                                         messages=messages)
+    assert status == 200
+    assert json.loads(response_body)['upserted'] == 3
+
+
+def test_asgi_aborts_requests_whose_client_disconnects():
+    prompt_id = f'test-{uuid.uuid4()}'
+    line = json.dumps(build_prompt_payload(prompt_id=prompt_id)).encode('utf-8') + b'\n'
+    # The client goes away after a complete line: the import must not run on the truncated body.
+    messages = [{'type': 'http.request', 'body': line, 'more_body': True}, {'type': 'http.disconnect'}]
+    status, _, _ = call_asgi(asgi.app, 'POST', '/api/prompts:import', headers=auth_headers(), messages=messages)
+    assert status == 500
+    assert Prompt.objects(prompt_id=prompt_id).count() == 0
+
+
+def test_asgi_rejects_oversized_bodies_before_running_flask(monkeypatch):
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 10)
+    status, _, body = call_asgi(asgi.app, 'POST', '/api/prompt', headers={**auth_headers(), 'Content-Length': '11'},
+                                body=b'{"content": 1}')
+    assert status == 413
+    assert json.loads(body) == {'error': 'Request payload too large'}
+
+
+def test_asgi_serves_prompt_detail_with_motor(client, created_prompt):
+    pytest.importorskip('motor')
+    expected = client.get(f'/api/prompt/{created_prompt.prompt_id}', headers=auth_headers())
+    prompt_cache.clear()
+
+    status, headers, body = call_asgi(asgi.PromptASGIApp(app), 'GET', f'/api/prompt/{created_prompt.prompt_id}',
+                                      headers=auth_headers())
+    assert status == 200
+    assert json.loads(body) == expected.get_json()
+    assert headers['etag'] == expected.headers['ETag']
+
+
+def test_importing_the_app_defers_admin_dependencies_and_connection():
+    probe = import_time.probe_import()
+    assert probe['loaded'] == []
+    assert probe['connections'] == 0
+
+
+def test_build_read_preference_from_connection_string_names():
+    read_preference = db.build_read_preference('secondaryPreferred', 120)
+    assert read_preference.mongos_mode == 'secondaryPreferred'
+    assert read_preference.max_staleness == 120
+    assert db.build_read_preference('primary').mongos_mode == 'primary'
+    with pytest.raises(ValueError):
+        db.build_read_preference('secondary_preferred')
+
+
+def test_read_only_endpoints_use_api_read_preference(client, created_prompt, monkeypatch):
+    read_preference = db.build_read_preference('secondaryPreferred')
+    monkeypatch.setattr(db, 'API_READ_PREFERENCE', read_preference)
+    assert db.read_collection(Prompt).read_preference == read_preference
+    # Writes keep going to the primary.
+    assert Prompt._get_collection().read_preference.mongos_mode == 'primary'
+
+    response = client.get('/api/prompts', headers=auth_headers(), query_string={'tag': TEST_MARKER_TAG})
+    assert response.status_code == 200
+    assert [item['prompt_id'] for item in response.get_json()['data']] == [created_prompt.prompt_id]
+
+
+def test_cache_fills_read_from_the_primary(client, created_prompt, monkeypatch):
+    read_preference = db.build_read_preference('secondaryPreferred')
+    monkeypatch.setattr(db, 'API_READ_PREFERENCE', read_preference)
+    # A lagging secondary read after an invalidation would stay cached for the whole TTL.
+    assert db.cache_fill_read_preference(LRUCache(10)).mongos_mode == 'primary'
+    assert db.cache_fill_read_preference(LRUCache(0)) == read_preference
+
+    prompt_cache.clear()
+    response = client.get(f'/api/prompt/{created_prompt.prompt_id}', headers=auth_headers())
+    assert response.status_code == 200
+    assert prompt_cache.get(created_prompt.prompt_id) == response.get_json()
+
+
+def facet_count(client, facet, value):
+    response = client.get('/api/prompts:facets', headers=auth_headers(), query_string={'facets': facet})
+    assert response.status_code == 200
+    return {item['value']: item['count'] for item in response.get_json()['data'][facet]}.get(value, 0)
+
+
+def test_facet_counts_follow_creates_updates_and_deletes(client):
+    tag, other_tag, llm = (f'facet-{uuid.uuid4().hex}' for _ in range(3))
+    prompt_ids = []
+    for _ in range(2):
+        payload = build_prompt_payload(tags=[tag, tag, TEST_MARKER_TAG], applicable_llm=llm)
+        response = client.post('/api/prompt', json=payload, headers=auth_headers())
+        prompt_ids.append(response.get_json()['prompt_id'])
+    assert facet_count(client, 'tags', tag) == 2
+    assert facet_count(client, 'applicable_llm', llm) == 2
+
+    client.put(f'/api/prompt/{prompt_ids[0]}', json={'tags': [other_tag, TEST_MARKER_TAG]}, headers=auth_headers())
+    assert facet_count(client, 'tags', tag) == 1
+    assert facet_count(client, 'tags', other_tag) == 1
+
+    client.delete(f'/api/prompt/{prompt_ids[1]}', headers=auth_headers())
+    client.post('/api/prompts:batchWrite', headers=auth_headers(), json={'operations': [
+        {'op': 'update', 'prompt_id': prompt_ids[0], 'prompt': {'applicable_llm': 'LLM1'}},
+    ]})
+    data = client.get('/api/prompts:facets', headers=auth_headers()).get_json()['data']
+    assert tag not in {item['value'] for item in data['tags']}
+    assert llm not in {item['value'] for item in data['applicable_llm']}
+    assert facet_count(client, 'tags', other_tag) == 1
+
+
+def test_facet_counts_rebuild_matches_incremental_counts(client):
+    tag = f'facet-{uuid.uuid4().hex}'
+    body = ''.join(
+        json.dumps(build_prompt_payload(prompt_id=f'test-{uuid.uuid4()}', tags=[tag, TEST_MARKER_TAG])) + '\n'
+        for _ in range(3)
+    )
+    client.post('/api/prompts:import', data=body, headers=auth_headers())
+    incremental = facet_count(client, 'tags', tag)
+
+    rebuild_facet_counts()
+    assert incremental == facet_count(client, 'tags', tag) == 3
+    assert get_facet_counts(('tags',))['tags'][0]['count'] >= 3
+
+
+def test_get_prompt_facets_rejects_unknown_facets(client):
+    response = client.get('/api/prompts:facets', headers=auth_headers(), query_string={'facets': 'content'})
+    assert response.status_code == 400
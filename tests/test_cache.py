@@ -0,0 +1,38 @@
+from api.cache import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_lru_cache_expires_entries(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('api.cache.time.monotonic', lambda: now[0])
+    cache = LRUCache(10, ttl=5)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+
+    now[0] += 5
+    assert cache.get('a') is None
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['evictions'] == 1
+
+
+def test_lru_cache_invalidate_counts_only_present_keys():
+    cache = LRUCache(10)
+    cache.set('a', 1)
+    cache.invalidate('a')
+    cache.invalidate('missing')
+    assert cache.get('a') is None
+    assert cache.stats()['invalidations'] == 1
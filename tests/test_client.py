@@ -0,0 +1,109 @@
+import os
+import threading
+import uuid
+
+import pytest
+from werkzeug.serving import make_server
+
+
+os.environ.setdefault('AUTH_TOKEN', 'test_auth_token')
+
+from api.index import app
+from api.models import Prompt, PromptTombstone
+from api.templating import CompiledTemplate as ServerTemplate, analyze_template
+from promptdoc_client import PromptClient, PromptClientError, CompiledTemplate
+
+
+TEST_MARKER_TAG = '__pytest__'
+
+
+@pytest.fixture(autouse=True)
+def cleanup_test_prompts():
+    yield
+    Prompt.objects(tags__in=[TEST_MARKER_TAG]).delete()
+    PromptTombstone.objects(prompt_id__startswith='test-').delete()
+
+
+@pytest.fixture(scope='module')
+def base_url():
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def save_prompt(**overrides):
+    data = {
+        'prompt_id': f'test-{uuid.uuid4()}',
+        'content': 'Hello {{ name }}',
+        'version': '1',
+        'applicable_llm': 'LLM1',
+        'tags': [TEST_MARKER_TAG],
+    }
+    data.update(overrides)
+    prompt = Prompt(**data)
+    prompt.save()
+    return prompt
+
+
+def test_client_syncs_incrementally_and_renders_locally(base_url, tmp_path):
+    first = save_prompt()
+    snapshot_path = str(tmp_path / 'prompts.json')
+    client = PromptClient(base_url, os.environ['AUTH_TOKEN'], snapshot_path=snapshot_path, page_size=2)
+    client.refresh()
+    assert client.render(first.prompt_id, {'name': 'Ada'}) == 'Hello Ada'
+
+    second = save_prompt(content='Bye {{name}}')
+    assert client.refresh() == 1
+    assert client.get(second.prompt_id)['content'] == 'Bye {{name}}'
+    assert client.refresh() == 0
+
+    # A restarted service serves the snapshot even when the API is unreachable.
+    offline = PromptClient('http://127.0.0.1:9', 'token', snapshot_path=snapshot_path, timeout=0.5)
+    offline.start()
+    try:
+        assert offline.render(second.prompt_id, {'name': 'Ada'}) == 'Bye Ada'
+    finally:
+        offline.close()
+
+
+def test_client_drops_deleted_prompts(base_url):
+    prompt = save_prompt()
+    client = PromptClient(base_url, os.environ['AUTH_TOKEN'])
+    client.refresh()
+    assert client.get(prompt.prompt_id) is not None
+
+    with app.test_client() as api_client:
+        response = api_client.delete(f'/api/prompt/{prompt.prompt_id}',
+                                     headers={'Authorization': f"Bearer {os.environ['AUTH_TOKEN']}"})
+    assert response.status_code == 200
+    assert client.refresh() == 1
+    assert client.get(prompt.prompt_id) is None
+
+
+def test_client_reports_api_errors(base_url):
+    client = PromptClient(base_url, 'wrong-token')
+    with pytest.raises(PromptClientError) as error:
+        client.refresh()
+    assert error.value.status == 401
+    with pytest.raises(KeyError):
+        client.render('missing')
+
+
+def test_changes_endpoint_rejects_invalid_cursor(base_url):
+    client = PromptClient(base_url, os.environ['AUTH_TOKEN'])
+    with pytest.raises(PromptClientError) as error:
+        client.request('/api/prompts:changes', {'cursor': 'not-a-cursor'})
+    assert error.value.status == 400
+
+
+@pytest.mark.parametrize('content, variables', [
+    ('Hi {{ name }}, {{data}} {{missing}}', {'name': 'Ada', 'data': {'k': [1, 'é']}}),
+    ('{{a}}{{a}} {{ 1bad }}', {'a': 3}),
+])
+def test_client_renders_like_the_server(content, variables):
+    expected = ServerTemplate(content).render(variables)
+    assert CompiledTemplate(content).render(variables) == expected
+    segments = analyze_template(content)['segments']
+    assert CompiledTemplate(content, segments).render(variables) == expected